@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -97,6 +98,68 @@ DATABASES = {
     }
 }
 
+# Options for the shared pymongo client used by the raw MongoDB queries
+# (services.mongo). One pooled client is created lazily per worker process.
+MONGO_CLIENT_OPTIONS = {
+    'maxPoolSize': 50,
+    'minPoolSize': 0,
+    'waitQueueTimeoutMS': 2000,
+    'serverSelectionTimeoutMS': 5000,
+    'retryWrites': True,
+    'w': 'majority',
+    'readConcernLevel': 'majority',
+}
+
+# Caches. services.cache keeps computed read models (catalog, dashboard
+# summaries, invoice statuses) in a small per-process LRU tier in front of
+# the SERVICES_CACHE cache, shared by every worker process. Set REDIS_URL
+# (e.g. redis://localhost:6379/1) to share it through Redis; without it a
+# file-based cache stands in, shared by the processes of this host.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'services': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'homeservice',
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'services',
+        'KEY_PREFIX': 'homeservice',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+SERVICES_CACHE = 'services'
+
+# Seconds a worker keeps a value in its local tier before reading the shared
+# cache again; invalidations from other processes reach it within this time.
+SERVICES_CACHE_LOCAL_MAX_AGE = 5
+
+# Seconds the loaded service catalog (services.catalog) is cached before
+# reloading; Service and ServiceCategory saves invalidate it immediately.
+CATALOG_MAX_AGE = 300
+
+# Seconds a worker keeps its provider assignment pool (services.assignment)
+# before reloading provider loads; profile and service saves invalidate it.
+ASSIGNMENT_POOL_MAX_AGE = 60
+
+# Seconds a customer's dashboard booking summary (services.summaries) is
+# cached, and how many summaries each worker keeps locally; booking writes
+# invalidate a customer's summary immediately.
+USER_SUMMARY_MAX_AGE = 30
+USER_SUMMARY_MAX_ENTRIES = 10000
+
+# Seconds an invoice status polled by the invoice page (services.invoicing)
+# is cached; booking transitions and the invoice job invalidate it.
+INVOICE_STATUS_MAX_AGE = 300
+
+# Bytes kept in the capped booking transition log (services.transitions);
+# the oldest entries are dropped once it is full.
+BOOKING_TRANSITION_LOG_SIZE = 64 * 1024 * 1024
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -138,6 +201,13 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Invoice PDFs are served from media storage. Set to 'X-Sendfile' (Apache)
+# or 'X-Accel-Redirect' (nginx) to let the web server stream the file;
+# None streams it from Django with FileResponse.
+INVOICE_SENDFILE_HEADER = None
+# Internal location nginx maps to MEDIA_ROOT, used with X-Accel-Redirect
+INVOICE_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = 'bootstrap5'
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
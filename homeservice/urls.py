@@ -19,6 +19,7 @@ urlpatterns = [
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('provider-dashboard/', views.provider_dashboard, name='provider_dashboard'),
     path('servicer-dashboard/', views.servicer_dashboard, name='servicer_dashboard'),
+    path('servicer-dashboard/claim/', views.claim_servicer_job, name='claim_servicer_job'),
     path('update-service-status/', views.update_service_status, name='update_service_status'),
 
     # Test page for dropdown functionality
@@ -3,6 +3,7 @@ from django.template import RequestContext
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Count, Sum
+from services.catalog import get_catalog
 from services.models import Service, ServiceCategory, Booking
 from users.models import User
 
@@ -23,91 +24,14 @@ def home(request):
 def user_dashboard(request):
     """Dashboard for regular users to browse and book services"""
 
-    # Get sample featured services (top 6 services)
-    featured_services = [
-        {
-            'id': 1,
-            'name': 'Electrical Installation',
-            'description': 'Professional installation of electrical systems in your home or office. Includes wiring, outlets, switches, and circuit breakers.',
-            'price': 2500,
-            'duration': 3,
-            'average_rating': 4.5,
-            'review_count': 12,
-            'category': {'name': 'Electrical'},
-            'provider': {'user': {'get_full_name': 'Rajesh Kumar'}},
-            'image': None
-        },
-        {
-            'id': 4,
-            'name': 'Pipe Repair',
-            'description': 'Professional repair of leaking or damaged pipes. Includes copper, PVC, and PEX pipe repairs.',
-            'price': 1200,
-            'duration': 2,
-            'average_rating': 4.6,
-            'review_count': 10,
-            'category': {'name': 'Plumbing'},
-            'provider': {'user': {'get_full_name': 'Suresh Patel'}},
-            'image': None
-        },
-        {
-            'id': 7,
-            'name': 'Deep Cleaning',
-            'description': 'Comprehensive deep cleaning service for your entire home. Includes all rooms and surfaces.',
-            'price': 3500,
-            'duration': 4,
-            'average_rating': 4.8,
-            'review_count': 22,
-            'category': {'name': 'Cleaning'},
-            'provider': {'user': {'get_full_name': 'Sunita Joshi'}},
-            'image': None
-        },
-        {
-            'id': 10,
-            'name': 'Furniture Repair',
-            'description': 'Professional furniture repair and restoration services.',
-            'price': 1800,
-            'duration': 3,
-            'average_rating': 4.7,
-            'review_count': 11,
-            'category': {'name': 'Carpentry'},
-            'provider': {'user': {'get_full_name': 'Manoj Kumar'}},
-            'image': None
-        },
-        {
-            'id': 14,
-            'name': 'AC Repair',
-            'description': 'Professional air conditioning repair and maintenance services.',
-            'price': 2500,
-            'duration': 2,
-            'average_rating': 4.8,
-            'review_count': 19,
-            'category': {'name': 'Appliance Repair'},
-            'provider': {'user': {'get_full_name': 'Rohit Sharma'}},
-            'image': None
-        },
-        {
-            'id': 20,
-            'name': 'CCTV Installation',
-            'description': 'Professional CCTV camera installation and setup.',
-            'price': 5500,
-            'duration': 4,
-            'average_rating': 4.7,
-            'review_count': 12,
-            'category': {'name': 'Security'},
-            'provider': {'user': {'get_full_name': 'Ajay Kumar'}},
-            'image': None
-        }
-    ]
+    catalog = get_catalog()
 
-    # Get sample categories
-    categories = [
-        {'name': 'Electrical', 'slug': 'electrical'},
-        {'name': 'Plumbing', 'slug': 'plumbing'},
-        {'name': 'Cleaning', 'slug': 'cleaning'},
-        {'name': 'Carpentry', 'slug': 'carpentry'},
-        {'name': 'Painting', 'slug': 'painting'},
-        {'name': 'Appliance Repair', 'slug': 'appliance-repair'},
+    # Featured services (top rated, one per category) and categories from the catalog
+    featured_services = [
+        dict(service, category={'name': service['category_name']})
+        for service in catalog.featured(6)
     ]
+    categories = catalog.categories[:6]
 
     context = {
         'featured_services': featured_services,
@@ -117,34 +41,16 @@ def user_dashboard(request):
         'dashboard_message': 'Welcome to your dashboard! Browse our featured services below.'
     }
 
-    # Try to get real user bookings from database if available
+    # Latest bookings and status counts: cached per customer, one
+    # aggregation when the cache is cold (see services.summaries)
     try:
-        from services.models import Booking
         if request.user.is_authenticated:
-            # Get all user bookings for recent bookings display
-            try:
-                all_bookings = list(Booking.objects.filter(customer=request.user).order_by('-booking_date')[:3])
-            except:
-                try:
-                    all_bookings = list(Booking.objects.filter(customer=request.user).order_by('-id')[:3])
-                except:
-                    all_bookings = list(Booking.objects.filter(customer=request.user)[:3])
-
-            # Get confirmed bookings count for the dashboard counter
-            try:
-                confirmed_bookings_count = Booking.objects.filter(
-                    customer=request.user,
-                    status='confirmed'
-                ).count()
-            except:
-                confirmed_bookings_count = 0
-
-            context['user_bookings'] = all_bookings
-            context['confirmed_bookings_count'] = confirmed_bookings_count
-
-            if all_bookings:
-                print(f"Found {len(all_bookings)} total bookings for user {request.user.email}")
-            print(f"Found {confirmed_bookings_count} confirmed bookings for user {request.user.email}")
+            from services.summaries import get_user_summary
+
+            summary = get_user_summary(request.user)
+            context['user_bookings'] = summary.bookings
+            context['confirmed_bookings_count'] = summary.count('confirmed')
+            context['booking_status_counts'] = summary.status_counts
     except Exception as e:
         # Continue with empty bookings if database error
         print(f"Bookings data error (non-critical): {e}")
@@ -161,193 +67,20 @@ def admin_dashboard(request):
         return redirect('user_dashboard')
 
     try:
-        # Get statistics
-        total_services = Service.objects.count()
-        total_bookings = Booking.objects.count()
-
-        # Calculate total revenue from confirmed/completed AND paid bookings only
-        # Using manual approach due to Djongo boolean field query issues
-        try:
-            revenue_data = Booking.objects.filter(
-                status__in=['confirmed', 'completed'],
-                is_paid=True
-            ).aggregate(total=Sum('total_amount'))
-            total_revenue = revenue_data['total'] if revenue_data['total'] is not None else 0
-        except Exception as e:
-            # Fallback: Manual calculation for MongoDB/Djongo compatibility
-            print(f"DEBUG: Using manual revenue calculation due to query error: {e}")
-            confirmed_bookings = Booking.objects.filter(status__in=['confirmed', 'completed'])
-            total_revenue = 0
-            for booking in confirmed_bookings:
-                try:
-                    if hasattr(booking, 'is_paid') and booking.is_paid:
-                        total_revenue += float(booking.total_amount or 0)
-                except Exception:
-                    continue
-
-        # If no total_amount, calculate from service prices for confirmed+paid bookings
-        if total_revenue == 0:
-            try:
-                paid_confirmed_bookings = Booking.objects.filter(
-                    status__in=['confirmed', 'completed'],
-                    is_paid=True
-                ).select_related('service')
-                total_revenue = sum(booking.service.price for booking in paid_confirmed_bookings)
-            except Exception:
-                # Manual fallback for service price calculation
-                confirmed_bookings = Booking.objects.filter(status__in=['confirmed', 'completed']).select_related('service')
-                for booking in confirmed_bookings:
-                    try:
-                        if hasattr(booking, 'is_paid') and booking.is_paid:
-                            total_revenue += float(booking.service.price or 0)
-                    except Exception:
-                        continue
-
-        pending_bookings = Booking.objects.filter(status='pending').count()
-
-        # Recent bookings - MongoDB compatible approach
-        try:
-            # Try MongoDB first for better compatibility
-            import pymongo
-            from django.conf import settings
-            from bson import ObjectId
-
-            client = pymongo.MongoClient(settings.DATABASES['default']['CLIENT']['host'])
-            db = client[settings.DATABASES['default']['NAME']]
-
-            # Get recent bookings from MongoDB
-            recent_booking_docs = list(db['services_booking'].find().sort('created_at', -1).limit(5))
-
-            recent_bookings = []
-            for booking_doc in recent_booking_docs:
-                try:
-                    # Get customer info
-                    customer = User.objects.get(id=booking_doc['customer_id'])
-
-                    # Create a mock booking object for template compatibility
-                    class MockRecentBooking:
-                        def __init__(self, doc, customer_obj):
-                            self.id = str(doc['_id'])
-                            self.customer = customer_obj
-                            self.booking_date = doc.get('booking_date')
-                            self.total_amount = doc.get('total_amount', 0)
-                            self.status = doc.get('status', 'pending')
-                            self.created_at = doc.get('created_at')
-                            self.notes = doc.get('notes', 'Service Booking')
-
-                            # Mock service object with better service name detection
-                            service_name = doc.get('notes', 'Home Service')
-                            if 'plumbing' in service_name.lower():
-                                service_name = 'Plumbing Service'
-                            elif 'electrical' in service_name.lower():
-                                service_name = 'Electrical Service'
-                            elif 'cleaning' in service_name.lower():
-                                service_name = 'Cleaning Service'
-                            elif 'repair' in service_name.lower():
-                                service_name = 'Repair Service'
-                            elif 'installation' in service_name.lower():
-                                service_name = 'Installation Service'
-
-                            self.service = type('MockService', (), {
-                                'name': service_name,
-                                'price': doc.get('total_amount', 0)
-                            })()
-
-                        def get_status_display(self):
-                            status_map = {
-                                'pending': 'Pending',
-                                'confirmed': 'Confirmed',
-                                'rejected': 'Rejected',
-                                'completed': 'Completed',
-                                'cancelled': 'Cancelled'
-                            }
-                            return status_map.get(self.status, self.status.title())
-
-                    mock_booking = MockRecentBooking(booking_doc, customer)
-                    recent_bookings.append(mock_booking)
-
-                except Exception as booking_error:
-                    print(f"Error processing booking {booking_doc.get('_id')}: {booking_error}")
-                    continue
+        from services.dashboard import get_dashboard_stats
 
-        except Exception as mongo_error:
-            print(f"MongoDB query failed, using Django ORM: {mongo_error}")
-
-            # Fallback to Django ORM
-            try:
-                recent_bookings = list(Booking.objects.all().order_by('-created_at')[:5])
-            except Exception as orm_error:
-                print(f"Django ORM also failed: {orm_error}")
-                recent_bookings = []
-
-        # Popular services - create sample services with booking counts
-        try:
-            # Try to get real services first
-            try:
-                popular_services = list(Service.objects.all()[:5])
-                if not popular_services:
-                    raise Exception("No services found")
-            except:
-                # Create sample popular services if none exist
-                popular_services = [
-                    {
-                        'name': 'Plumbing Repair',
-                        'price': 1500,
-                        'booking_count': 25,
-                        'category': 'Plumbing',
-                        'description': 'Professional plumbing repair services'
-                    },
-                    {
-                        'name': 'Electrical Installation',
-                        'price': 2500,
-                        'booking_count': 18,
-                        'category': 'Electrical',
-                        'description': 'Expert electrical installation and wiring'
-                    },
-                    {
-                        'name': 'Deep House Cleaning',
-                        'price': 3500,
-                        'booking_count': 32,
-                        'category': 'Cleaning',
-                        'description': 'Complete home deep cleaning service'
-                    },
-                    {
-                        'name': 'AC Repair & Service',
-                        'price': 2200,
-                        'booking_count': 15,
-                        'category': 'Appliance Repair',
-                        'description': 'Air conditioning repair and maintenance'
-                    },
-                    {
-                        'name': 'Furniture Assembly',
-                        'price': 1800,
-                        'booking_count': 12,
-                        'category': 'Carpentry',
-                        'description': 'Professional furniture assembly service'
-                    }
-                ]
-
-                # Convert to mock service objects for template compatibility
-                mock_services = []
-                for service_data in popular_services:
-                    class MockService:
-                        def __init__(self, data):
-                            self.name = data['name']
-                            self.price = data['price']
-                            self.booking_count = data['booking_count']
-                            self.category = data['category']
-                            self.description = data['description']
-
-                    mock_services.append(MockService(service_data))
-
-                popular_services = mock_services
-
-        except Exception as service_error:
-            print(f"Error fetching services: {service_error}")
-            popular_services = []
+        # Statistics from the dashboard counters, lists from one aggregation
+        stats = get_dashboard_stats(request, recent_limit=5, pending_limit=0, popular_limit=5)
+        total_services = stats.total_services
+        total_bookings = stats.total_bookings
+        total_revenue = stats.total_revenue
+        pending_bookings = stats.pending_bookings
+        recent_bookings = stats.recent_bookings
+        popular_services = stats.popular_services
 
     except Exception as e:
         # Handle database errors gracefully
+        print(f"Error loading admin dashboard stats: {e}")
         total_services = 0
         total_bookings = 0
         total_revenue = 0
@@ -404,83 +137,38 @@ def servicer_dashboard(request):
     if request.user.user_type != 'provider':
         return redirect('user_dashboard')
 
-    try:
-        # Get confirmed bookings assigned to this provider that need service completion
-        confirmed_bookings = []
+    from django.core.paginator import Paginator
 
+    page_number = request.GET.get('page')
+    try:
         # Try MongoDB first for better compatibility
         try:
-            import pymongo
-            from django.conf import settings
-            from bson import ObjectId
-
-            client = pymongo.MongoClient(settings.DATABASES['default']['CLIENT']['host'])
-            db = client[settings.DATABASES['default']['NAME']]
-
-            # Get all admin-approved bookings (ready for service completion by any servicer)
-            booking_docs = db['services_booking'].find({
-                'status': 'confirmed'  # All admin approved bookings
-            }).sort('booking_date', -1)
-
-            for booking_doc in booking_docs:
-                # Get invoice for this booking
-                invoice_doc = db['services_invoice'].find_one({
-                    'booking_id': booking_doc['_id']
-                })
+            from services.provider_jobs import ProviderFeed, ProviderJobsQuery, completed_count
 
-                if not invoice_doc:
-                    # Create invoice if doesn't exist
-                    from datetime import datetime
-                    invoice_doc = {
-                        'booking_id': booking_doc['_id'],
-                        'invoice_number': f"INV-{str(booking_doc['_id'])[:8].upper()}",
-                        'generated_at': datetime.now(),
-                        'subtotal': float(booking_doc.get('total_amount', 0)),
-                        'tax_amount': float(booking_doc.get('total_amount', 0)) * 0.18,
-                        'total_amount': float(booking_doc.get('total_amount', 0)) * 1.18
-                    }
-                    db['services_invoice'].insert_one(invoice_doc)
-
-                # Get customer info
-                customer = User.objects.get(id=booking_doc['customer_id'])
-
-                confirmed_bookings.append({
-                    'booking_id': str(booking_doc['_id']),
-                    'invoice_number': invoice_doc['invoice_number'],
-                    'customer_name': customer.get_full_name(),
-                    'customer_email': customer.email,
-                    'customer_phone': booking_doc.get('phone_number', ''),
-                    'service_name': booking_doc.get('notes', 'Service'),
-                    'booking_date': booking_doc.get('booking_date'),
-                    'address': booking_doc.get('address', ''),
-                    'total_amount': booking_doc.get('total_amount', 0),
-                    'status': booking_doc.get('status', 'confirmed'),
-                    'special_instructions': booking_doc.get('special_instructions', ''),
-                })
+            # One aggregation per page joins the provider's confirmed bookings
+            # to their invoices and customers; nothing is written here
+            jobs = ProviderJobsQuery(request.user.id)
+            confirmed_bookings = Paginator(jobs, 20).get_page(page_number)
+            total_assigned = jobs.count()
+            completed = completed_count(request.user.id)
+            # Approved bookings no provider was free for, which this one may take
+            open_jobs = ProviderFeed(request.user).open_jobs()
 
         except Exception as mongo_error:
             print(f"MongoDB query failed, using Django ORM: {mongo_error}")
 
-            # Fallback to Django ORM - Get all admin-approved bookings
+            # Fallback to Django ORM - the provider's confirmed bookings
             bookings = Booking.objects.filter(
-                status='confirmed'  # All admin approved bookings
-            ).select_related('customer').order_by('-booking_date')
-
-            for booking in bookings:
-                # Get or create invoice
-                from services.models import Invoice
-                invoice, created = Invoice.objects.get_or_create(
-                    booking=booking,
-                    defaults={
-                        'subtotal': booking.total_amount,
-                        'tax_amount': booking.total_amount * 0.18,
-                        'total_amount': booking.total_amount * 1.18,
-                    }
-                )
-
-                confirmed_bookings.append({
+                provider=request.user, status='confirmed'
+            ).select_related('customer', 'service', 'invoice').order_by('-booking_date')
+            page = Paginator(bookings, 20).get_page(page_number)
+
+            rows = []
+            for booking in page:
+                invoice = getattr(booking, 'invoice', None)
+                rows.append({
                     'booking_id': str(booking.id),
-                    'invoice_number': invoice.invoice_number,
+                    'invoice_number': invoice.invoice_number if invoice else None,
                     'customer_name': booking.customer.get_full_name(),
                     'customer_email': booking.customer.email,
                     'customer_phone': booking.phone_number,
@@ -491,23 +179,18 @@ def servicer_dashboard(request):
                     'status': booking.status,
                     'special_instructions': getattr(booking, 'special_instructions', ''),
                 })
-
-        # Get statistics
-        total_assigned = len(confirmed_bookings)
-
-        # Count completed services (try MongoDB first, then Django ORM)
-        try:
-            import pymongo
-            client = pymongo.MongoClient(settings.DATABASES['default']['CLIENT']['host'])
-            db = client[settings.DATABASES['default']['NAME']]
-            completed_count = db['services_booking'].count_documents({'status': 'completed'})
-        except:
-            completed_count = Booking.objects.filter(status='completed').count()
+            page.object_list = rows
+            confirmed_bookings = page
+            total_assigned = page.paginator.count
+            completed = Booking.objects.filter(provider=request.user, status='completed').count()
+            open_jobs = []
 
         context = {
             'confirmed_bookings': confirmed_bookings,
+            'page_obj': confirmed_bookings,
             'total_assigned': total_assigned,
-            'completed_count': completed_count,
+            'completed_count': completed,
+            'open_jobs': open_jobs,
             'is_servicer_dashboard': True,
             'provider_name': request.user.get_full_name(),
         }
@@ -518,6 +201,7 @@ def servicer_dashboard(request):
             'confirmed_bookings': [],
             'total_assigned': 0,
             'completed_count': 0,
+            'open_jobs': [],
             'is_servicer_dashboard': True,
             'provider_name': request.user.get_full_name(),
             'error_message': 'Unable to load bookings at this time.'
@@ -525,6 +209,28 @@ def servicer_dashboard(request):
 
     return render(request, 'dashboards/servicer_dashboard.html', context)
 
+@login_required
+def claim_servicer_job(request):
+    """Take an open job from the servicer dashboard"""
+    if request.method != 'POST':
+        return redirect('servicer_dashboard')
+
+    if request.user.user_type != 'provider':
+        return redirect('user_dashboard')
+
+    try:
+        from services.provider_jobs import claim_job
+
+        claimed, message = claim_job(request.POST.get('booking_id'), request.user)
+        if claimed:
+            messages.success(request, message)
+        else:
+            messages.error(request, message)
+    except Exception as e:
+        print(f"Error claiming job: {e}")
+        messages.error(request, 'Unable to take this job at this time.')
+    return redirect('servicer_dashboard')
+
 @login_required
 def update_service_status(request):
     """Update service status using invoice ID"""
@@ -544,53 +250,40 @@ def update_service_status(request):
     try:
         # Try MongoDB first
         try:
-            import pymongo
-            from django.conf import settings
-            from bson import ObjectId
+            from services.mongo import get_db
+            from services.transitions import apply_transition
             from datetime import datetime
 
-            client = pymongo.MongoClient(settings.DATABASES['default']['CLIENT']['host'])
-            db = client[settings.DATABASES['default']['NAME']]
+            db = get_db()
 
             # Find invoice by invoice number
-            invoice_doc = db['services_invoice'].find_one({
-                'invoice_number': invoice_id
-            })
+            invoice_doc = db['services_invoice'].find_one(
+                {'invoice_number': invoice_id}, {'booking_id': 1}
+            )
 
             if not invoice_doc:
                 messages.error(request, f'Invoice {invoice_id} not found.')
                 return redirect('servicer_dashboard')
 
-            # Get booking (any servicer can update any confirmed booking)
-            booking_doc = db['services_booking'].find_one({
-                '_id': invoice_doc['booking_id'],
-                'status': 'confirmed'  # Only allow updates to confirmed bookings
-            })
-
-            if not booking_doc:
-                messages.error(request, 'Booking not found or not in confirmed status.')
-                return redirect('servicer_dashboard')
-
-            # Update booking status
-            update_result = db['services_booking'].update_one(
-                {'_id': invoice_doc['booking_id']},
-                {
-                    '$set': {
-                        'status': new_status,
-                        'updated_at': datetime.now(),
-                        'service_completed_at': datetime.now() if new_status == 'completed' else None,
-                        'service_completed_by': request.user.id if new_status == 'completed' else None
-                    }
-                }
+            # Any servicer can update any confirmed booking; the transition
+            # only matches while the booking is still confirmed
+            if new_status == 'completed':
+                event = 'complete'
+                changes = {'service_completed_at': datetime.now(), 'service_completed_by': request.user.id}
+            else:
+                event = 'decline'
+                changes = {'service_completed_at': None, 'service_completed_by': None}
+            result = apply_transition(
+                invoice_doc['booking_id'], event, changes, actor_id=request.user.id, db=db,
             )
 
-            if update_result.modified_count > 0:
+            if result.ok:
                 if new_status == 'completed':
                     messages.success(request, f'Service for invoice {invoice_id} marked as completed successfully!')
                 else:
                     messages.success(request, f'Service for invoice {invoice_id} marked as rejected.')
             else:
-                messages.error(request, 'Failed to update service status.')
+                messages.error(request, 'Booking not found or not in confirmed status.')
 
         except Exception as mongo_error:
             print(f"MongoDB update failed, trying Django ORM: {mongo_error}")
@@ -266,6 +266,9 @@ class ProviderProfileAdmin(admin.ModelAdmin):
         ('Contact Information', {
             'fields': ('address', 'phone_number')
         }),
+        ('Service Area', {
+            'fields': ('service_areas',)
+        }),
         ('Status', {
             'fields': ('is_verified', 'is_available')
         }),
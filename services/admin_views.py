@@ -9,58 +9,28 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from datetime import datetime, timedelta
 import json
+import re
 from .models import Service, ServiceCategory, ServiceImage, Booking, Review, ProviderProfile
 from .forms import ServiceForm, ServiceCategoryForm
 from users.models import User
 
 def calculate_dashboard_stats():
-    """Calculate real-time dashboard statistics"""
+    """Dashboard statistics from the incrementally maintained counters"""
     try:
-        total_services = Service.objects.count()
-        total_bookings = Booking.objects.count()
-
-        # Calculate revenue from confirmed/completed AND paid bookings only
-        # Using manual approach due to Djongo boolean field query issues
-        try:
-            total_revenue = Booking.objects.filter(
-                status__in=['confirmed', 'completed'],
-                is_paid=True
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-
-            # Convert to float for JSON serialization
-            if hasattr(total_revenue, 'to_decimal'):
-                total_revenue = float(total_revenue.to_decimal())
-            else:
-                total_revenue = float(total_revenue)
-        except Exception as e:
-            # Fallback: Manual calculation for MongoDB/Djongo compatibility
-            print(f"DEBUG: Using manual revenue calculation due to query error: {e}")
-            confirmed_bookings = Booking.objects.filter(status__in=['confirmed', 'completed'])
-            total_revenue = 0
-            for booking in confirmed_bookings:
-                try:
-                    if hasattr(booking, 'is_paid') and booking.is_paid:
-                        total_revenue += float(booking.total_amount or 0)
-                except Exception:
-                    continue
-            total_revenue = float(total_revenue)
-
-        pending_bookings = Booking.objects.filter(status='pending').count()
-        confirmed_bookings = Booking.objects.filter(status='confirmed').count()
-        rejected_bookings = Booking.objects.filter(status='rejected').count()
+        from .dashboard import load_counters
 
-        # Today's bookings
-        today = timezone.now().date()
-        today_bookings = Booking.objects.filter(created_at__date=today).count()
+        # Built from the bookings once on first use
+        counters = load_counters()
 
+        status_counts = counters.get('status', {})
         return {
-            'total_services': total_services,
-            'total_bookings': total_bookings,
-            'total_revenue': total_revenue,
-            'pending_bookings': pending_bookings,
-            'confirmed_bookings': confirmed_bookings,
-            'rejected_bookings': rejected_bookings,
-            'today_bookings': today_bookings
+            'total_services': counters.get('services', 0),
+            'total_bookings': counters.get('total', 0),
+            'total_revenue': float(counters.get('revenue', 0)),
+            'pending_bookings': status_counts.get('pending', 0),
+            'confirmed_bookings': status_counts.get('confirmed', 0),
+            'rejected_bookings': status_counts.get('rejected', 0),
+            'today_bookings': counters.get('today', 0)
         }
     except Exception as e:
         print(f"Error calculating dashboard stats: {e}")
@@ -78,86 +48,28 @@ def calculate_dashboard_stats():
 def admin_dashboard(request):
     """Admin dashboard with real-time statistics"""
     try:
-        # Get real-time statistics with error handling
-        total_services = Service.objects.count()
-        total_bookings = Booking.objects.count()
-
-        # Calculate revenue from confirmed/completed AND paid bookings only
-        # Using manual approach due to Djongo boolean field query issues
-        try:
-            total_revenue = Booking.objects.filter(
-                status__in=['confirmed', 'completed'],
-                is_paid=True
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-        except Exception as e:
-            # Fallback: Manual calculation for MongoDB/Djongo compatibility
-            print(f"DEBUG: Using manual revenue calculation due to query error: {e}")
-            confirmed_bookings = Booking.objects.filter(status__in=['confirmed', 'completed'])
-            total_revenue = 0
-            for booking in confirmed_bookings:
-                try:
-                    if hasattr(booking, 'is_paid') and booking.is_paid:
-                        total_revenue += float(booking.total_amount or 0)
-                except Exception:
-                    continue
-            total_revenue = float(total_revenue)
-
-        # Get pending bookings count (requiring admin approval)
-        pending_bookings = Booking.objects.filter(status='pending').count()
-
-        # Get confirmed bookings count
-        confirmed_bookings = Booking.objects.filter(status='confirmed').count()
-
-        # Get rejected bookings count
-        rejected_bookings = Booking.objects.filter(status='rejected').count()
-
-        # Get today's new bookings
-        today = timezone.now().date()
-        today_bookings = Booking.objects.filter(
-            created_at__date=today
-        ).count()
-
-        # Recent bookings (last 10 with more details)
-        recent_bookings = Booking.objects.select_related(
-            'customer', 'provider'
-        ).order_by('-created_at')[:10]
+        from .dashboard import get_dashboard_stats
 
-        # Popular services (based on booking count)
-        popular_services = Service.objects.annotate(
-            booking_count=Count('booking')
-        ).order_by('-booking_count')[:5]
-
-        # Latest pending bookings for quick access
-        latest_pending = Booking.objects.filter(
-            status='pending'
-        ).select_related('customer', 'provider').order_by('-created_at')[:5]
+        # Totals and status counts from the dashboard counters, recent/pending
+        # bookings and popular services from a single aggregation
+        context = get_dashboard_stats(request, recent_limit=10, pending_limit=5, popular_limit=5).as_context()
 
     except Exception as e:
         # Handle database errors gracefully
         messages.error(request, f'Database error: {e}')
-        total_services = 0
-        total_bookings = 0
-        total_revenue = 0
-        pending_bookings = 0
-        confirmed_bookings = 0
-        rejected_bookings = 0
-        today_bookings = 0
-        recent_bookings = []
-        popular_services = []
-        latest_pending = []
-
-    context = {
-        'total_services': total_services,
-        'total_bookings': total_bookings,
-        'total_revenue': total_revenue,
-        'pending_bookings': pending_bookings,
-        'confirmed_bookings': confirmed_bookings,
-        'rejected_bookings': rejected_bookings,
-        'today_bookings': today_bookings,
-        'recent_bookings': recent_bookings,
-        'popular_services': popular_services,
-        'latest_pending': latest_pending,
-    }
+        context = {
+            'total_services': 0,
+            'total_bookings': 0,
+            'total_revenue': 0,
+            'pending_bookings': 0,
+            'confirmed_bookings': 0,
+            'rejected_bookings': 0,
+            'today_bookings': 0,
+            'recent_bookings': [],
+            'popular_services': [],
+            'latest_pending': [],
+        }
+
     return render(request, 'admin/dashboard.html', context)
 
 def admin_services(request):
@@ -252,30 +164,39 @@ def admin_delete_service(request, service_id):
     context = {'service': service}
     return render(request, 'admin/service_confirm_delete.html', context)
 
+def booking_search_filter(status='', search_query=''):
+    """Mongo filter for the admin booking lists: status plus a free-text search
+    over customer/provider name or email, address and notes"""
+    query = {}
+    if status:
+        query['status'] = status
+    if search_query:
+        user_ids = list(User.objects.filter(
+            Q(first_name__icontains=search_query) |
+            Q(last_name__icontains=search_query) |
+            Q(email__icontains=search_query)
+        ).values_list('id', flat=True))
+        pattern = {'$regex': re.escape(search_query), '$options': 'i'}
+        query['$or'] = [
+            {'customer_id': {'$in': user_ids}},
+            {'provider_id': {'$in': user_ids}},
+            {'address': pattern},
+            {'notes': pattern},
+        ]
+    return query
+
+
 @staff_member_required
 def admin_bookings(request):
     """View all bookings"""
     try:
-        # Get all bookings with error handling for missing service references
-        bookings = Booking.objects.select_related(
-            'customer', 'provider'
-        ).order_by('-created_at')
+        from .repositories import BookingRepository
 
-        # Filter by status
         status_filter = request.GET.get('status', '')
-        if status_filter:
-            bookings = bookings.filter(status=status_filter)
-
-        # Search functionality (removed service search since services might not exist)
         search_query = request.GET.get('search', '')
-        if search_query:
-            bookings = bookings.filter(
-                Q(customer__first_name__icontains=search_query) |
-                Q(customer__last_name__icontains=search_query) |
-                Q(customer__email__icontains=search_query) |
-                Q(address__icontains=search_query) |
-                Q(notes__icontains=search_query)
-            )
+        bookings = BookingRepository.for_request(request).query(
+            booking_search_filter(status_filter, search_query)
+        )
 
         # Pagination
         paginator = Paginator(bookings, 15)
@@ -357,321 +278,59 @@ def admin_reviews(request):
     return render(request, 'admin/reviews.html', context)
 
 # Booking Approval/Rejection API Views
+def _decision_response(decision, message=''):
+    """JSON response for one approve/reject decision"""
+    if not decision.ok:
+        return JsonResponse({
+            'success': False,
+            'message': decision.message,
+            'booking_id': str(decision.booking_id),
+            'current_status': decision.current_status,
+        })
+    booking = decision.booking
+    return JsonResponse({
+        'success': True,
+        'message': message,
+        'booking_id': str(decision.booking_id),
+        'new_status': booking['status'],
+        'booking': {
+            'status': booking['status'],
+            'provider_id': booking.get('provider_id'),
+            'total_amount': float(booking.get('total_amount') or 0),
+            'is_paid': bool(booking.get('is_paid')),
+        },
+        'updated_stats': calculate_dashboard_stats(),
+    })
+
+
 @staff_member_required
 @csrf_exempt
 @require_POST
 def admin_approve_booking(request):
-    """Approve a booking via AJAX"""
+    """Approve a pending booking, addressed by its ``booking_id``, via AJAX"""
     try:
         data = json.loads(request.body)
+        booking_id = data.get('booking_id')
+        if not booking_id:
+            return JsonResponse({'success': False, 'message': 'booking_id is required.'})
 
-        # Debug: Log the received data
-        print(f"DEBUG: Received data: {data}")
+        from .approvals import approve_booking, assign_provider
 
-        # Handle both old index-based and new data-based approaches
-        if 'booking_index' in data:
-            # Old approach for pending bookings page
-            booking_index = data.get('booking_index')
-            admin_notes = data.get('admin_notes', '')
-            pending_bookings = list(Booking.objects.filter(status='pending').order_by('-created_at'))
+        # The invoice document is created by the approve transition's hook;
+        # for paid bookings assign_provider queues the invoice job once the
+        # provider is known (see services.invoicing)
+        decision = approve_booking(booking_id, request.user, admin_notes=data.get('admin_notes', ''))
+        if not decision.ok:
+            return _decision_response(decision)
 
-            if 0 <= booking_index < len(pending_bookings):
-                booking = pending_bookings[booking_index]
-            else:
-                return JsonResponse({'success': False, 'message': 'Booking not found.'})
-        else:
-            # New approach for main bookings page - PRECISE MATCHING ONLY
-            customer_email = data.get('customer_email')
-            booking_amount = data.get('booking_amount')
-            booking_date = data.get('booking_date')
-            booking_address = data.get('booking_address', '')
-            booking_notes = data.get('booking_notes', '')
-            admin_notes = data.get('admin_notes', '')
-
-            print(f"DEBUG: Precise booking lookup - email={customer_email}, amount={booking_amount}, address={booking_address}")
-
-            if not all([customer_email, booking_amount, booking_date]):
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Missing required booking information. Email: {customer_email}, Amount: {booking_amount}, Date: {booking_date}'
-                })
-
-            # PRECISE MATCHING ONLY - No fallbacks to prevent wrong booking processing
-            from datetime import datetime
-            from decimal import Decimal
-
-            try:
-                # First check if we have any bookings at all
-                total_bookings = Booking.objects.count()
-                pending_bookings = Booking.objects.filter(status='pending').count()
-                print(f"DEBUG: Total bookings in system: {total_bookings}")
-                print(f"DEBUG: Pending bookings in system: {pending_bookings}")
-
-                if total_bookings == 0:
-                    return JsonResponse({
-                        'success': False,
-                        'message': 'No bookings found in the system. Please create a booking first.'
-                    })
-
-                if pending_bookings == 0:
-                    return JsonResponse({
-                        'success': False,
-                        'message': 'No pending bookings found. All bookings may have already been processed.'
-                    })
-
-                # Convert amount to decimal for precise comparison
-                try:
-                    booking_amount_decimal = Decimal(str(booking_amount))
-                    print(f"DEBUG: Converted amount to decimal: {booking_amount_decimal}")
-                except (ValueError, TypeError, InvalidOperation) as decimal_error:
-                    print(f"DEBUG: Error converting amount to decimal: {decimal_error}")
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'Invalid booking amount format: {booking_amount}'
-                    })
-
-                # Find EXACT match using multiple criteria
-                try:
-                    matching_bookings = Booking.objects.filter(
-                        customer__email=customer_email,
-                        total_amount=booking_amount_decimal,
-                        status='pending'
-                    ).order_by('-created_at')
-                except Exception as query_error:
-                    print(f"DEBUG: Database query error: {query_error}")
-                    # Fallback: try to find any pending booking for this customer
-                    try:
-                        matching_bookings = Booking.objects.filter(
-                            customer__email=customer_email,
-                            status='pending'
-                        ).order_by('-created_at')
-                        print(f"DEBUG: Fallback query found {matching_bookings.count()} bookings")
-                    except Exception as fallback_error:
-                        print(f"DEBUG: Fallback query also failed: {fallback_error}")
-                        return JsonResponse({
-                            'success': False,
-                            'message': f'Database error: Unable to query bookings. Error: {fallback_error}'
-                        })
-
-                print(f"DEBUG: Found {matching_bookings.count()} bookings matching email and amount")
-
-                # If multiple matches, try to narrow down by address
-                if matching_bookings.count() > 1 and booking_address:
-                    address_match = matching_bookings.filter(address__icontains=booking_address.strip())
-                    if address_match.exists():
-                        matching_bookings = address_match
-                        print(f"DEBUG: Narrowed down to {matching_bookings.count()} bookings using address")
-
-                # If still multiple matches, try to narrow down by notes
-                if matching_bookings.count() > 1 and booking_notes:
-                    notes_match = matching_bookings.filter(notes__icontains=booking_notes.strip())
-                    if notes_match.exists():
-                        matching_bookings = notes_match
-                        print(f"DEBUG: Narrowed down to {matching_bookings.count()} bookings using notes")
-
-                if not matching_bookings.exists():
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'No pending booking found for {customer_email} with amount ₹{booking_amount}. Please refresh the page.'
-                    })
-
-                if matching_bookings.count() > 1:
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'Multiple bookings found for {customer_email}. Cannot determine which booking to approve. Please contact support.'
-                    })
-
-                # Exactly one match found
-                booking = matching_bookings.first()
-                print(f"DEBUG: Found exact booking match - Customer: {booking.customer.email}, Amount: {booking.total_amount}")
-
-            except Exception as e:
-                import traceback
-                error_msg = str(e) if str(e) else "Unknown database error"
-                print(f"DEBUG: Error in precise booking lookup: {error_msg}")
-                print(f"DEBUG: Exception type: {type(e)}")
-                print(f"DEBUG: Traceback: {traceback.format_exc()}")
-                print(f"DEBUG: Data received - email: {customer_email}, amount: {booking_amount}")
-
-                # Try MongoDB direct approach as fallback
-                try:
-                    print("DEBUG: Attempting MongoDB direct approach...")
-                    from pymongo import MongoClient
-
-                    # Connect directly to MongoDB
-                    client = MongoClient('mongodb://localhost:27017/')
-                    db = client['homeservice_db']
-                    bookings_collection = db['services_booking']
-                    users_collection = db['users_user']
-
-                    # Find pending bookings
-                    pending_bookings = list(bookings_collection.find({'status': 'pending'}).limit(5))
-                    print(f"DEBUG: MongoDB direct query found {len(pending_bookings)} pending bookings")
-
-                    if len(pending_bookings) > 0:
-                        # Use the first pending booking
-                        booking_doc = pending_bookings[0]
-                        booking_id = booking_doc['_id']
-
-                        # Get customer info
-                        customer_doc = users_collection.find_one({'_id': booking_doc['customer_id']})
-                        customer_email = customer_doc['email'] if customer_doc else 'Unknown'
-
-                        print(f"DEBUG: Using MongoDB booking: {booking_id}, Customer: {customer_email}")
-
-                        # Assign a provider/servicer to the booking
-                        # Get an available provider (for now, use the test servicer)
-                        try:
-                            from users.models import User
-                            available_provider = User.objects.filter(
-                                user_type='provider',
-                                is_active=True
-                            ).first()
-
-                            if not available_provider:
-                                # Create default servicer if none exists
-                                available_provider = User.objects.filter(
-                                    email='servicer@example.com'
-                                ).first()
-
-                            provider_id = available_provider.id if available_provider else None
-
-                        except Exception as provider_error:
-                            print(f"DEBUG: Error finding provider: {provider_error}")
-                            provider_id = None
-
-                        # Update the booking status directly in MongoDB
-                        update_data = {
-                            'status': 'confirmed',
-                            'approved_at': datetime.now(),
-                            'updated_at': datetime.now()
-                        }
-
-                        # Assign provider if found
-                        if provider_id:
-                            update_data['provider_id'] = provider_id
-                            print(f"DEBUG: Assigning booking to provider ID: {provider_id}")
-
-                        update_result = bookings_collection.update_one(
-                            {'_id': booking_id},
-                            {'$set': update_data}
-                        )
-
-                        if update_result.modified_count > 0:
-                            print(f"DEBUG: Successfully updated booking {booking_id} via MongoDB")
-
-                            # Generate invoice after approval for MongoDB booking
-                            try:
-                                generate_invoice_for_mongodb_booking(booking_id, customer_email)
-                            except Exception as invoice_error:
-                                print(f"DEBUG: Invoice generation error: {invoice_error}")
-
-                            return JsonResponse({
-                                'success': True,
-                                'message': f'✅ Booking approved successfully via MongoDB! Customer: {customer_email}. Invoice generated.'
-                            })
-                        else:
-                            return JsonResponse({
-                                'success': False,
-                                'message': 'Failed to update booking status in MongoDB.'
-                            })
-                    else:
-                        return JsonResponse({
-                            'success': False,
-                            'message': 'No pending bookings found in MongoDB.'
-                        })
-
-                except Exception as mongo_error:
-                    print(f"DEBUG: MongoDB fallback also failed: {mongo_error}")
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'All approaches failed. Original error: {error_msg}. MongoDB error: {str(mongo_error)}. Please contact support.'
-                    })
-
-            # Fix decimal validation by handling MongoDB Decimal128 and other types
-            from decimal import Decimal, InvalidOperation
-            if hasattr(booking, 'total_amount') and booking.total_amount is not None:
-                try:
-                    # Handle MongoDB Decimal128 and other decimal types
-                    if hasattr(booking.total_amount, 'to_decimal'):
-                        # MongoDB Decimal128 has to_decimal() method
-                        booking.total_amount = booking.total_amount.to_decimal()
-                    elif not isinstance(booking.total_amount, Decimal):
-                        # Convert other types to Decimal
-                        amount_str = str(booking.total_amount)
-                        booking.total_amount = Decimal(amount_str)
-                except (InvalidOperation, ValueError, TypeError, AttributeError):
-                    # If conversion fails, set a default value
-                    booking.total_amount = Decimal('0.00')
-
-            # Check if booking is already processed
-            if booking.status != 'pending':
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Booking is already {booking.get_status_display().lower()}. Cannot approve again.'
-                })
+        try:
+            assign_provider(decision)
+        except Exception as provider_error:
+            print(f"DEBUG: Error assigning provider: {provider_error}")
 
-            # Assign a provider/servicer to the booking
-            if not booking.provider:
-                try:
-                    from users.models import User
-                    available_provider = User.objects.filter(
-                        user_type='provider',
-                        is_active=True
-                    ).first()
-
-                    if not available_provider:
-                        # Use the test servicer if no other provider available
-                        available_provider = User.objects.filter(
-                            email='servicer@example.com'
-                        ).first()
-
-                    if available_provider:
-                        booking.provider = available_provider
-                        print(f"DEBUG: Assigned booking to provider: {available_provider.email}")
-
-                except Exception as provider_error:
-                    print(f"DEBUG: Error assigning provider: {provider_error}")
-
-            # Update booking status with proper field handling
-            booking.status = 'confirmed'
-            if hasattr(booking, 'admin_notes'):
-                booking.admin_notes = admin_notes
-            if hasattr(booking, 'approved_by'):
-                booking.approved_by = request.user
-            if hasattr(booking, 'approved_at'):
-                booking.approved_at = timezone.now()
-
-            # Save the booking with proper error handling
-            try:
-                # Double-check status before saving to prevent race conditions
-                if booking.status != 'confirmed':
-                    print(f"DEBUG: Status changed during processing. Current status: {booking.status}")
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'Booking status changed during processing. Current status: {booking.get_status_display()}'
-                    })
-
-                booking.save()
-
-                print(f"DEBUG: Successfully approved booking - ID: {booking.id}, Customer: {booking.customer.email}, Status: {booking.status}")
-
-                # Calculate updated statistics for dashboard
-                updated_stats = calculate_dashboard_stats()
-
-                return JsonResponse({
-                    'success': True,
-                    'message': f'✅ Booking approved successfully for {booking.customer.get_full_name() or booking.customer.email}!',
-                    'booking_id': str(booking.id) if booking.id else 'N/A',
-                    'new_status': 'confirmed',
-                    'updated_stats': updated_stats
-                })
-            except Exception as save_error:
-                print(f"DEBUG: Error saving approved booking: {save_error}")
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Error saving booking: {str(save_error)}'
-                })
+        customer = User.objects.filter(id=decision.booking.get('customer_id')).only('email', 'first_name', 'last_name').first()
+        customer_name = (customer.get_full_name() or customer.email) if customer else 'Unknown'
+        return _decision_response(decision, f'✅ Booking approved successfully for {customer_name}!')
 
     except Exception as e:
         return JsonResponse({
@@ -683,225 +342,104 @@ def admin_approve_booking(request):
 @csrf_exempt
 @require_POST
 def admin_reject_booking(request):
-    """Reject a booking via AJAX"""
+    """Reject a pending booking, addressed by its ``booking_id``, via AJAX"""
     try:
         data = json.loads(request.body)
+        booking_id = data.get('booking_id')
+        if not booking_id:
+            return JsonResponse({'success': False, 'message': 'booking_id is required.'})
 
-        # Handle both old index-based and new data-based approaches
-        if 'booking_index' in data:
-            # Old approach for pending bookings page
-            booking_index = data.get('booking_index')
-            rejection_reason = data.get('rejection_reason', 'No reason provided')
-            admin_notes = data.get('admin_notes', '')
-            pending_bookings = list(Booking.objects.filter(status='pending').order_by('-created_at'))
-
-            if 0 <= booking_index < len(pending_bookings):
-                booking = pending_bookings[booking_index]
-            else:
-                return JsonResponse({'success': False, 'message': 'Booking not found.'})
-        else:
-            # New approach for main bookings page - PRECISE MATCHING ONLY
-            customer_email = data.get('customer_email')
-            booking_amount = data.get('booking_amount')
-            booking_date = data.get('booking_date')
-            booking_address = data.get('booking_address', '')
-            booking_notes = data.get('booking_notes', '')
-            rejection_reason = data.get('rejection_reason', 'No reason provided')
-            admin_notes = data.get('admin_notes', '')
+        from .approvals import reject_booking
 
-            print(f"DEBUG REJECT: Precise booking lookup - email={customer_email}, amount={booking_amount}, address={booking_address}")
+        rejection_reason = data.get('rejection_reason') or 'No reason provided'
+        decision = reject_booking(
+            booking_id, request.user, rejection_reason, admin_notes=data.get('admin_notes', ''),
+        )
+        if not decision.ok:
+            return _decision_response(decision)
 
-            if not all([customer_email, booking_amount, booking_date]):
-                return JsonResponse({'success': False, 'message': f'Missing required booking information for precise matching'})
+        customer = User.objects.filter(id=decision.booking.get('customer_id')).only('email', 'first_name', 'last_name').first()
+        customer_name = (customer.get_full_name() or customer.email) if customer else 'Unknown'
+        return _decision_response(
+            decision, f'❌ Booking rejected successfully for {customer_name}. Reason: {rejection_reason}',
+        )
 
-            # PRECISE MATCHING ONLY - No fallbacks to prevent wrong booking processing
-            from datetime import datetime
-            from decimal import Decimal
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error rejecting booking: {str(e)}'
+        })
 
-            try:
-                # Convert amount to decimal for precise comparison
-                booking_amount_decimal = Decimal(str(booking_amount))
-
-                # Find EXACT match using multiple criteria
-                matching_bookings = Booking.objects.filter(
-                    customer__email=customer_email,
-                    total_amount=booking_amount_decimal,
-                    status='pending'
-                ).order_by('-created_at')
-
-                print(f"DEBUG REJECT: Found {matching_bookings.count()} bookings matching email and amount")
-
-                # If multiple matches, try to narrow down by address
-                if matching_bookings.count() > 1 and booking_address:
-                    address_match = matching_bookings.filter(address__icontains=booking_address.strip())
-                    if address_match.exists():
-                        matching_bookings = address_match
-                        print(f"DEBUG REJECT: Narrowed down to {matching_bookings.count()} bookings using address")
-
-                # If still multiple matches, try to narrow down by notes
-                if matching_bookings.count() > 1 and booking_notes:
-                    notes_match = matching_bookings.filter(notes__icontains=booking_notes.strip())
-                    if notes_match.exists():
-                        matching_bookings = notes_match
-                        print(f"DEBUG REJECT: Narrowed down to {matching_bookings.count()} bookings using notes")
-
-                if not matching_bookings.exists():
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'No pending booking found for {customer_email} with amount ₹{booking_amount}. Please refresh the page.'
-                    })
-
-                if matching_bookings.count() > 1:
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'Multiple bookings found for {customer_email}. Cannot determine which booking to reject. Please contact support.'
-                    })
-
-                # Exactly one match found
-                booking = matching_bookings.first()
-                print(f"DEBUG REJECT: Found exact booking match - Customer: {booking.customer.email}, Amount: {booking.total_amount}")
-
-            except Exception as e:
-                import traceback
-                error_msg = str(e) if str(e) else "Unknown database error"
-                print(f"DEBUG REJECT: Error in precise booking lookup: {error_msg}")
-                print(f"DEBUG REJECT: Traceback: {traceback.format_exc()}")
-                print(f"DEBUG REJECT: Data received - email: {customer_email}, amount: {booking_amount}")
-
-                # Try MongoDB direct approach as fallback for rejection
-                try:
-                    print("DEBUG REJECT: Attempting MongoDB direct approach...")
-                    from pymongo import MongoClient
-
-                    # Connect directly to MongoDB
-                    client = MongoClient('mongodb://localhost:27017/')
-                    db = client['homeservice_db']
-                    bookings_collection = db['services_booking']
-                    users_collection = db['users_user']
-
-                    # Find pending bookings
-                    pending_bookings = list(bookings_collection.find({'status': 'pending'}).limit(5))
-                    print(f"DEBUG REJECT: MongoDB direct query found {len(pending_bookings)} pending bookings")
-
-                    if len(pending_bookings) > 0:
-                        # Use the first pending booking
-                        booking_doc = pending_bookings[0]
-                        booking_id = booking_doc['_id']
-
-                        # Get customer info
-                        customer_doc = users_collection.find_one({'_id': booking_doc['customer_id']})
-                        customer_email_mongo = customer_doc['email'] if customer_doc else 'Unknown'
-
-                        print(f"DEBUG REJECT: Using MongoDB booking: {booking_id}, Customer: {customer_email_mongo}")
-
-                        # Update the booking status directly in MongoDB
-                        update_result = bookings_collection.update_one(
-                            {'_id': booking_id},
-                            {
-                                '$set': {
-                                    'status': 'rejected',
-                                    'rejection_reason': rejection_reason,
-                                    'rejected_at': datetime.now(),
-                                    'updated_at': datetime.now()
-                                }
-                            }
-                        )
-
-                        if update_result.modified_count > 0:
-                            print(f"DEBUG REJECT: Successfully updated booking {booking_id} via MongoDB")
-                            return JsonResponse({
-                                'success': True,
-                                'message': f'❌ Booking rejected successfully via MongoDB! Customer: {customer_email_mongo}. Reason: {rejection_reason}'
-                            })
-                        else:
-                            return JsonResponse({
-                                'success': False,
-                                'message': 'Failed to update booking status in MongoDB.'
-                            })
-                    else:
-                        return JsonResponse({
-                            'success': False,
-                            'message': 'No pending bookings found in MongoDB.'
-                        })
-
-                except Exception as mongo_error:
-                    print(f"DEBUG REJECT: MongoDB fallback also failed: {mongo_error}")
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'All approaches failed. Original error: {error_msg}. MongoDB error: {str(mongo_error)}. Please contact support.'
-                    })
-
-            # Fix decimal validation by handling MongoDB Decimal128 and other types
-            from decimal import Decimal, InvalidOperation
-            if hasattr(booking, 'total_amount') and booking.total_amount is not None:
-                try:
-                    # Handle MongoDB Decimal128 and other decimal types
-                    if hasattr(booking.total_amount, 'to_decimal'):
-                        # MongoDB Decimal128 has to_decimal() method
-                        booking.total_amount = booking.total_amount.to_decimal()
-                    elif not isinstance(booking.total_amount, Decimal):
-                        # Convert other types to Decimal
-                        amount_str = str(booking.total_amount)
-                        booking.total_amount = Decimal(amount_str)
-                except (InvalidOperation, ValueError, TypeError, AttributeError):
-                    # If conversion fails, set a default value
-                    booking.total_amount = Decimal('0.00')
-
-            # Check if booking is already processed
-            if booking.status != 'pending':
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Booking is already {booking.get_status_display().lower()}. Cannot reject again.'
-                })
+@staff_member_required
+@csrf_exempt
+@require_POST
+def admin_bulk_booking_action(request):
+    """
+    Approve or reject many pending bookings in one request.
+
+    Expects ``{"action": "approve" | "reject", "booking_ids": [...],
+    "admin_notes": "...", "rejection_reason": "..."}`` and answers with one
+    outcome per id. The status changes are a single ``bulk_write``; provider
+    assignment, invoices and dashboard statistics are done once for the batch.
+    """
+    try:
+        from .approvals import (
+            MAX_BULK_DECISIONS, approval_changes, assign_providers, decide_bookings,
+            rejection_changes,
+        )
 
-            # Update only the fields we need to change
-            booking.status = 'rejected'
+        data = json.loads(request.body)
+        action = data.get('action')
+        booking_ids = data.get('booking_ids') or []
+        admin_notes = data.get('admin_notes', '')
+
+        if action not in ('approve', 'reject'):
+            return JsonResponse({'success': False, 'message': 'action must be "approve" or "reject".'})
+        if not isinstance(booking_ids, list) or not booking_ids:
+            return JsonResponse({'success': False, 'message': 'booking_ids must be a non-empty list.'})
+        if len(booking_ids) > MAX_BULK_DECISIONS:
+            return JsonResponse({
+                'success': False,
+                'message': f'At most {MAX_BULK_DECISIONS} bookings can be processed at once.'
+            })
 
-            # Set additional fields if they exist in the model
-            if hasattr(booking, 'rejection_reason'):
-                booking.rejection_reason = rejection_reason
-            if hasattr(booking, 'admin_notes'):
-                booking.admin_notes = admin_notes
-            if hasattr(booking, 'rejected_by'):
-                booking.rejected_by = request.user
-            if hasattr(booking, 'rejected_at'):
-                booking.rejected_at = timezone.now()
+        if action == 'approve':
+            changes = approval_changes(request.user, admin_notes)
+        else:
+            rejection_reason = data.get('rejection_reason') or 'No reason provided'
+            changes = rejection_changes(request.user, rejection_reason, admin_notes)
+
+        decisions = decide_bookings(booking_ids, action, changes, actor_id=request.user.id)
+        succeeded = [decision for decision in decisions if decision.ok]
 
-            # Save the booking with proper error handling
+        if action == 'approve' and succeeded:
             try:
-                # Double-check status before saving to prevent race conditions
-                if booking.status != 'rejected':
-                    print(f"DEBUG REJECT: Status changed during processing. Current status: {booking.status}")
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'Booking status changed during processing. Current status: {booking.get_status_display()}'
-                    })
-
-                booking.save()
-
-                print(f"DEBUG REJECT: Successfully rejected booking - ID: {booking.id}, Customer: {booking.customer.email}, Status: {booking.status}, Reason: {rejection_reason}")
-
-                # Calculate updated statistics for dashboard
-                updated_stats = calculate_dashboard_stats()
-
-                return JsonResponse({
-                    'success': True,
-                    'message': f'❌ Booking rejected successfully for {booking.customer.get_full_name() or booking.customer.email}. Reason: {rejection_reason}',
-                    'booking_id': str(booking.id) if booking.id else 'N/A',
-                    'new_status': 'rejected',
-                    'updated_stats': updated_stats
-                })
-            except Exception as save_error:
-                print(f"DEBUG REJECT: Error saving rejected booking: {save_error}")
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Error saving booking: {str(save_error)}'
-                })
+                assign_providers(succeeded)
+            except Exception as provider_error:
+                print(f"DEBUG: Error assigning providers: {provider_error}")
+
+        verb = 'approved' if action == 'approve' else 'rejected'
+        return JsonResponse({
+            'success': bool(succeeded),
+            'message': f'{len(succeeded)} of {len(decisions)} bookings {verb}.',
+            'processed': len(succeeded),
+            'failed': len(decisions) - len(succeeded),
+            'results': [
+                {
+                    'booking_id': decision.booking_id,
+                    'success': decision.ok,
+                    'status': decision.booking['status'] if decision.ok else decision.current_status,
+                    'message': decision.message,
+                }
+                for decision in decisions
+            ],
+            'updated_stats': calculate_dashboard_stats(),
+        })
 
     except Exception as e:
         return JsonResponse({
             'success': False,
-            'message': f'Error rejecting booking: {str(e)}'
+            'message': f'Error processing bookings: {str(e)}'
         })
 
 
@@ -909,7 +447,12 @@ def admin_reject_booking(request):
 def admin_booking_detail(request, booking_id):
     """View booking details"""
     try:
-        booking = get_object_or_404(Booking, id=booking_id)
+        from .repositories import BookingRepository
+
+        booking = BookingRepository.for_request(request).get(booking_id)
+        if booking is None:
+            messages.error(request, 'Booking not found.')
+            return redirect('services:admin_bookings')
 
         context = {
             'booking': booking,
@@ -924,32 +467,26 @@ def admin_booking_detail(request, booking_id):
 def admin_pending_bookings(request):
     """View pending bookings that need approval"""
     try:
-        # Get all pending bookings
-        pending_bookings = Booking.objects.filter(status='pending').select_related(
-            'customer', 'provider'
-        ).order_by('-created_at')
+        from .repositories import BookingRepository
 
-        # Search functionality
+        repository = BookingRepository.for_request(request)
         search_query = request.GET.get('search', '')
-        if search_query:
-            pending_bookings = pending_bookings.filter(
-                Q(customer__first_name__icontains=search_query) |
-                Q(customer__last_name__icontains=search_query) |
-                Q(customer__email__icontains=search_query) |
-                Q(provider__first_name__icontains=search_query) |
-                Q(provider__last_name__icontains=search_query) |
-                Q(address__icontains=search_query)
-            )
+        pending_bookings = repository.query(booking_search_filter('pending', search_query))
 
         # Pagination
         paginator = Paginator(pending_bookings, 10)
         page_number = request.GET.get('page')
-        pending_bookings = paginator.get_page(page_number)
+        page = paginator.get_page(page_number)
+
+        if search_query:
+            total_pending = repository.collection.count_documents({'status': 'pending'})
+        else:
+            total_pending = paginator.count
 
         context = {
-            'pending_bookings': pending_bookings,
+            'pending_bookings': page,
             'search_query': search_query,
-            'total_pending': Booking.objects.filter(status='pending').count(),
+            'total_pending': total_pending,
         }
         return render(request, 'admin/pending_bookings.html', context)
 
@@ -1046,159 +583,26 @@ def generate_invoice_after_approval(booking_id, customer_email):
     except Exception as e:
         print(f"DEBUG: Error generating invoice: {e}")
 
-def generate_invoice_for_mongodb_booking(booking_id, customer_email):
-    """Generate invoice after MongoDB booking approval"""
+def generate_invoice_for_mongodb_booking(booking_id, customer_email=None):
+    """Queue invoice, QR code and PDF generation for a MongoDB booking"""
     try:
-        import pymongo
-        from django.conf import settings
-        from bson import ObjectId
-        from decimal import Decimal
-        from datetime import datetime
-        import uuid
-        import qrcode
-        from io import BytesIO
-        from django.core.files.base import ContentFile
-
-        # Connect to MongoDB
-        client = pymongo.MongoClient(settings.DATABASES['default']['CLIENT']['host'])
-        db = client[settings.DATABASES['default']['NAME']]
-
-        # Get booking from MongoDB
-        booking_doc = db['services_booking'].find_one({'_id': ObjectId(booking_id)})
-        if not booking_doc:
-            print(f"DEBUG: Booking {booking_id} not found in MongoDB")
-            return
-
-        # Check if booking is paid
-        if not booking_doc.get('is_paid', False):
-            print(f"DEBUG: MongoDB booking {booking_id} is not paid, skipping invoice generation")
-            return
-
-        # Check if invoice already exists
-        existing_invoice = db['services_invoice'].find_one({'booking_id': ObjectId(booking_id)})
-        if existing_invoice:
-            print(f"DEBUG: Invoice already exists for MongoDB booking {booking_id}")
-            return
-
-        # Calculate invoice amounts
-        subtotal = Decimal(str(booking_doc.get('total_amount', 0)))
-        tax_rate = Decimal('0.18')  # 18% GST
-        tax_amount = subtotal * tax_rate
-        total_amount = subtotal + tax_amount
-
-        # Generate unique invoice number
-        date_str = datetime.now().strftime('%Y%m%d')
-        unique_id = str(uuid.uuid4())[:8].upper()
-        invoice_number = f"INV-{date_str}-{unique_id}"
-
-        # Generate QR code for service access
-        qr_data = f"HomeService Invoice: {invoice_number}\nBooking ID: {booking_id}\nAmount: ₹{total_amount}\nCustomer: {customer_email}"
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-
-        # Create invoice document in MongoDB
-        invoice_doc = {
-            'booking_id': ObjectId(booking_id),
-            'invoice_number': invoice_number,
-            'customer_email': customer_email,
-            'subtotal': float(subtotal),
-            'tax_amount': float(tax_amount),
-            'total_amount': float(total_amount),
-            'tax_rate': float(tax_rate),
-            'qr_code_data': qr_data,
-            'generated_at': datetime.now(),
-            'is_active': True,
-            'status': 'generated'
-        }
-
-        # Insert invoice into MongoDB
-        result = db['services_invoice'].insert_one(invoice_doc)
-        invoice_id = result.inserted_id
-
-        print(f"DEBUG: Invoice {invoice_number} created for MongoDB booking {booking_id}")
-
-        # Update booking with invoice reference
-        db['services_booking'].update_one(
-            {'_id': ObjectId(booking_id)},
-            {
-                '$set': {
-                    'invoice_id': invoice_id,
-                    'invoice_number': invoice_number,
-                    'invoice_generated_at': datetime.now(),
-                    'updated_at': datetime.now()
-                }
-            }
-        )
-
-        print(f"DEBUG: Updated MongoDB booking {booking_id} with invoice reference")
-
-        return invoice_id
+        from .invoicing import enqueue_invoice
 
+        return enqueue_invoice(booking_id)
     except Exception as e:
-        print(f"DEBUG: Error generating MongoDB invoice: {e}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        return None
+        print(f"DEBUG: Error queueing MongoDB invoice: {e}")
+        return False
 
 
 def generate_qr_code_for_invoice(invoice):
     """Generate QR code for invoice"""
     try:
-        import qrcode
-        from io import BytesIO
         from django.core.files.base import ContentFile
+        from .invoicing import qr_payload, render_qr_png
 
-        # Create QR code data
-        qr_data = f"HomeService Invoice: {invoice.invoice_number}\nBooking ID: {invoice.booking.id}\nAmount: ₹{invoice.total_amount}\nCustomer: {invoice.booking.customer.email}"
-
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-
-        # Save QR code to invoice
+        qr_data = qr_payload(invoice.invoice_number, invoice.booking.id, invoice.total_amount, invoice.booking.customer.email)
         qr_filename = f"qr_code_{invoice.invoice_number}.png"
-        invoice.qr_code.save(qr_filename, ContentFile(qr_buffer.read()), save=True)
-
-        print(f"DEBUG: QR code generated for invoice {invoice.invoice_number}")
-
-    except Exception as e:
-        print(f"DEBUG: Error generating QR code: {e}")
-    try:
-        import qrcode
-        from io import BytesIO
-        from django.core.files import File
-
-        # Create QR code data
-        qr_data = f"HomeService Invoice: {invoice.invoice_number}\nBooking ID: {invoice.booking.id}\nAmount: ₹{invoice.total_amount}\nAccess Code: {invoice.invoice_number[-8:]}"
-
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-
-        # Create QR code image
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-
-        # Save to BytesIO
-        buffer = BytesIO()
-        qr_img.save(buffer, format='PNG')
-        buffer.seek(0)
-
-        # Save to model
-        filename = f"qr_{invoice.invoice_number}.png"
-        invoice.qr_code.save(filename, File(buffer), save=True)
+        invoice.qr_code.save(qr_filename, ContentFile(render_qr_png(qr_data)), save=True)
 
         print(f"DEBUG: QR code generated for invoice {invoice.invoice_number}")
 
@@ -0,0 +1,139 @@
+"""
+Admin approval and rejection of pending bookings, addressed by ``_id``
+
+Decisions are the ``approve`` and ``reject`` events of the booking state
+machine (:mod:`services.transitions`): one conditional write on
+``{'_id': ..., 'status': 'pending'}``, so the lookup is a primary-key hit no
+matter how long the pending queue is, and two admins acting on the same
+booking cannot both win because the status precondition only matches once.
+
+Batches from the pending queue go through :func:`decide_bookings`, which
+applies the same precondition to every id in one ``bulk_write``.
+"""
+from datetime import datetime
+
+from .assignment import assign_providers as assign_booking_providers
+from .invoicing import queue_ready_invoices
+from .transitions import apply_transition, apply_transitions
+
+# Largest batch accepted by the bulk endpoint
+MAX_BULK_DECISIONS = 500
+
+# Fields returned to the caller together with the update's own fields
+DECISION_PROJECTION = {
+    'customer_id': 1, 'provider_id': 1, 'service_id': 1, 'total_amount': 1, 'booking_date': 1,
+    'duration_minutes': 1, 'notes': 1, 'service_snapshot': 1, 'status': 1, 'is_paid': 1,
+}
+
+
+class BookingDecision:
+    """Outcome of one approve/reject attempt"""
+    __slots__ = ('booking_id', 'booking', 'error', 'current_status')
+
+    def __init__(self, booking_id, booking=None, error=None, current_status=None):
+        self.booking_id = booking_id
+        self.booking = booking
+        self.error = error
+        self.current_status = current_status
+
+    @property
+    def ok(self):
+        return self.booking is not None
+
+    @property
+    def message(self):
+        if self.error == 'invalid_id':
+            return f'Invalid booking id: {self.booking_id}'
+        if self.error == 'not_found':
+            return 'Booking not found.'
+        if self.error == 'not_pending':
+            return f'Booking is already {self.current_status}. Only pending bookings can be processed.'
+        return ''
+
+
+def _decision(result):
+    if result.ok:
+        return BookingDecision(result.booking_id, booking=result.after)
+    if result.error == 'wrong_state':
+        return BookingDecision(result.booking_id, error='not_pending', current_status=result.current_status)
+    return BookingDecision(result.booking_id, error=result.error)
+
+
+def decide_booking(booking_id, event, changes, actor_id=None, db=None):
+    """
+    Apply ``event`` (``approve`` or ``reject``) with ``changes`` to a pending
+    booking and return a :class:`BookingDecision` holding the updated document.
+    """
+    return _decision(apply_transition(
+        booking_id, event, changes, actor_id=actor_id, projection=DECISION_PROJECTION, db=db,
+    ))
+
+
+def decide_bookings(booking_ids, event, changes, actor_id=None, db=None):
+    """
+    Apply ``event`` with ``changes`` to every pending booking in
+    ``booking_ids`` with one ``bulk_write`` and return a
+    :class:`BookingDecision` per distinct id, in the order given.
+    """
+    return [
+        _decision(result)
+        for result in apply_transitions(
+            booking_ids, event, changes, actor_id=actor_id, projection=DECISION_PROJECTION, db=db,
+        )
+    ]
+
+
+def assign_providers(decisions, db=None):
+    """
+    Give approved bookings a load-balanced provider (see
+    :mod:`services.assignment`) and return ``{booking _id: provider_id}`` for
+    those that changed hands. Paid bookings then get their invoice job, so
+    the PDF names the provider who does the work; it is queued even when the
+    assignment fails, with the provider the booking kept.
+    """
+    approved = [decision for decision in decisions if decision.ok]
+    try:
+        assignments = assign_booking_providers([decision.booking for decision in approved], db=db)
+        for decision in approved:
+            booking_id = decision.booking.get('_id')
+            if booking_id in assignments:
+                decision.booking['provider_id'] = assignments[booking_id]
+    finally:
+        queue_ready_invoices([decision.booking for decision in approved], db=db)
+    return assignments
+
+
+def assign_provider(decision, db=None):
+    """Give an approved booking a load-balanced provider"""
+    return assign_providers([decision], db=db)
+
+
+def approval_changes(admin, admin_notes=''):
+    now = datetime.now()
+    return {
+        'admin_notes': admin_notes,
+        'approved_by_id': admin.id,
+        'approved_at': now,
+        'updated_at': now,
+    }
+
+
+def rejection_changes(admin, rejection_reason, admin_notes=''):
+    now = datetime.now()
+    return {
+        'rejection_reason': rejection_reason,
+        'admin_notes': admin_notes,
+        'rejected_by_id': admin.id,
+        'rejected_at': now,
+        'updated_at': now,
+    }
+
+
+def approve_booking(booking_id, admin, admin_notes='', db=None):
+    return decide_booking(booking_id, 'approve', approval_changes(admin, admin_notes), actor_id=admin.id, db=db)
+
+
+def reject_booking(booking_id, admin, rejection_reason, admin_notes='', db=None):
+    return decide_booking(
+        booking_id, 'reject', rejection_changes(admin, rejection_reason, admin_notes), actor_id=admin.id, db=db,
+    )
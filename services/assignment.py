@@ -0,0 +1,293 @@
+"""
+Load-balanced provider assignment for approved bookings
+
+Candidates are active providers whose profile is available and who offer a
+service in the booking's category. Among those that are free at the booking
+time (see :mod:`services.slots`), the one with the fewest open bookings
+wins, ties going to the higher rated.
+
+The candidates live in a :class:`ProviderPool`: one min-heap per category
+keyed by ``(open bookings, -rating, provider id)``. Every assignment bumps
+the chosen provider's load in place, and heap entries made stale by that
+are refreshed lazily when they reach the top, so a batch of hundreds of
+bookings is assigned in one pass with one bookings write and one slots
+write (plus giving back the blocks the moved bookings left). The pool is
+cached per process and rebuilt after ``settings.ASSIGNMENT_POOL_MAX_AGE``
+seconds or when a provider profile or service changes (see
+:mod:`services.signals`), which also picks up loads that dropped because
+bookings were completed or cancelled.
+"""
+import heapq
+import threading
+import time
+from datetime import date, datetime
+
+from bson import ObjectId
+from bson.int64 import Int64
+from django.conf import settings
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from .catalog import get_catalog
+from .mongo import get_db
+from .repositories import booking_service_name
+from .slots import FULL_DAY, SLOTS_COLLECTION, booking_minutes, booking_span, rebuild, release
+from .summaries import invalidate_user_summary
+
+DEFAULT_MAX_AGE = 60
+
+# Bookings that count towards a provider's current load
+OPEN_STATUSES = ('confirmed', 'in_progress')
+
+# Heap key for bookings whose category is unknown: every candidate
+ANY_CATEGORY = None
+
+_pool = None
+_pool_built_at = 0.0
+_lock = threading.Lock()
+
+
+class ProviderPool:
+    """Per-category min-heaps of providers ordered by load, then rating"""
+
+    def __init__(self, ratings, capabilities, loads):
+        self.ratings = ratings
+        self.capabilities = capabilities
+        self.loads = loads
+        self._heaps = {}
+
+    def candidates(self, category):
+        if category is ANY_CATEGORY or category not in self.capabilities:
+            return set(self.ratings)
+        return self.capabilities[category]
+
+    def _heap(self, category):
+        key = category if category in self.capabilities else ANY_CATEGORY
+        heap = self._heaps.get(key)
+        if heap is None:
+            heap = [(self.loads.get(provider_id, 0), -self.ratings[provider_id], provider_id)
+                    for provider_id in self.candidates(key)]
+            heapq.heapify(heap)
+            self._heaps[key] = heap
+        return heap
+
+    def pick(self, category, fits=None):
+        """
+        Take the least loaded provider for ``category`` for which
+        ``fits(provider_id)`` holds, count the booking against them and
+        return their id, or None.
+        """
+        heap = self._heap(category)
+        skipped = []
+        chosen = None
+        while heap:
+            load, negative_rating, provider_id = heapq.heappop(heap)
+            current = self.loads.get(provider_id, 0)
+            if load != current:
+                # Assigned through another category's heap since this entry was pushed
+                heapq.heappush(heap, (current, negative_rating, provider_id))
+                continue
+            if fits is None or fits(provider_id):
+                chosen = provider_id
+                break
+            skipped.append((load, negative_rating, provider_id))
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        if chosen is not None:
+            self.loads[chosen] = self.loads.get(chosen, 0) + 1
+            heapq.heappush(heap, (self.loads[chosen], -self.ratings[chosen], chosen))
+        return chosen
+
+
+def build_pool(db=None):
+    """Load candidates, ratings, categories and open-booking counts (four queries)"""
+    from users.models import User
+    from .models import ProviderProfile, Service, ServiceCategory
+
+    provider_ids = set(User.objects.filter(user_type='provider', is_active=True).values_list('id', flat=True))
+    ratings = {provider_id: 0.0 for provider_id in provider_ids}
+    # Booleans are checked in Python: boolean filters are unreliable through djongo
+    for user_id, rating, is_available in ProviderProfile.objects.values_list('user_id', 'rating', 'is_available'):
+        if user_id not in ratings:
+            continue
+        if is_available:
+            ratings[user_id] = float(rating or 0)
+        else:
+            del ratings[user_id]
+
+    slugs = dict(ServiceCategory.objects.values_list('id', 'slug'))
+    capabilities = {}
+    for provider_id, category_id, is_active in Service.objects.values_list('provider_id', 'category_id', 'is_active'):
+        if is_active and provider_id in ratings and category_id in slugs:
+            capabilities.setdefault(slugs[category_id], set()).add(provider_id)
+
+    loads = {
+        row['_id']: row['count']
+        for row in (db if db is not None else get_db())['services_booking'].aggregate([
+            {'$match': {'provider_id': {'$in': list(ratings)}, 'status': {'$in': list(OPEN_STATUSES)}}},
+            {'$group': {'_id': '$provider_id', 'count': {'$sum': 1}}},
+        ])
+    }
+    return ProviderPool(ratings, capabilities, loads)
+
+
+def get_pool(db=None):
+    """The cached :class:`ProviderPool`, rebuilt when older than ``ASSIGNMENT_POOL_MAX_AGE``"""
+    global _pool, _pool_built_at
+    max_age = getattr(settings, 'ASSIGNMENT_POOL_MAX_AGE', DEFAULT_MAX_AGE)
+    if _pool is None or time.monotonic() - _pool_built_at > max_age:
+        pool = build_pool(db=db)
+        _pool, _pool_built_at = pool, time.monotonic()
+    return _pool
+
+
+def invalidate_pool(*args, **kwargs):
+    """Signal receiver: rebuild the pool on next use"""
+    global _pool
+    _pool = None
+
+
+def booking_category(booking_doc, catalog=None):
+    """Category slug of a raw booking's service, or None when it cannot be told"""
+    snapshot = booking_doc.get('service_snapshot') or {}
+    if snapshot.get('category'):
+        return snapshot['category']
+    catalog = catalog or get_catalog()
+    service = catalog.get(booking_doc.get('service_id')) if booking_doc.get('service_id') else None
+    if service is None:
+        service = catalog.get_by_name(booking_service_name(booking_doc, default=None))
+    return service['category_slug'] if service else ANY_CATEGORY
+
+
+def _load_masks(provider_ids, days, db):
+    """``{(provider_id, day): free mask}``, computing missing days first"""
+    if not provider_ids or not days:
+        return {}
+    slots = db[SLOTS_COLLECTION]
+    query = {'provider_id': {'$in': list(provider_ids)}, 'date': {'$in': [day.isoformat() for day in days]}}
+    masks = {(doc['provider_id'], date.fromisoformat(doc['date'])): int(doc['free'])
+             for doc in slots.find(query, {'provider_id': 1, 'date': 1, 'free': 1})}
+    if len(masks) < len(provider_ids) * len(days):
+        missing = {provider_id for provider_id in provider_ids for day in days if (provider_id, day) not in masks}
+        first, last = min(days), max(days)
+        rebuild(missing, first, (last - first).days + 1, db=db)
+        masks = {(doc['provider_id'], date.fromisoformat(doc['date'])): int(doc['free'])
+                 for doc in slots.find(query, {'provider_id': 1, 'date': 1, 'free': 1})}
+    return masks
+
+
+def assign_providers(booking_docs, db=None):
+    """
+    Give every approved booking in ``booking_docs`` (raw documents with
+    ``_id``) the least loaded provider that is free at its time, and return
+    ``{booking _id: provider_id}`` for the bookings that changed hands.
+
+    The provider chosen at creation already holds the slot and stays a
+    candidate; when another one wins, the booking moves to them: their
+    blocks are taken and the old provider's are given back. A booking
+    whose provider is no longer available and for which no candidate is
+    free is left unassigned (``None``); eligible providers are offered it
+    as an open job on their dashboard (see :mod:`services.provider_jobs`).
+
+    Each write is conditional on the provider read, so a booking another
+    admin or worker reassigned meanwhile is left alone and neither counted
+    nor reserved for.
+    """
+    docs = [doc for doc in booking_docs if doc.get('_id') is not None]
+    if not docs:
+        return {}
+    db = db if db is not None else get_db()
+    catalog = get_catalog()
+    today = timezone.localdate()
+
+    with _lock:
+        pool = get_pool(db=db)
+        plans = []
+        for doc in docs:
+            span = None
+            if isinstance(doc.get('booking_date'), datetime):
+                day, mask = booking_span(doc['booking_date'], booking_minutes(doc))
+                if day >= today and mask:
+                    span = (day, mask)
+            category = booking_category(doc, catalog)
+            plans.append((doc, category, span))
+
+        candidates = set().union(*(pool.candidates(category) for _, category, _ in plans))
+        masks = _load_masks(candidates, {span[0] for _, _, span in plans if span}, db)
+
+        moves = {}
+        for doc, category, span in plans:
+            current = doc.get('provider_id')
+
+            def fits(provider_id):
+                # The current provider already holds the booking's blocks
+                if span is None or provider_id == current:
+                    return True
+                return masks.get((provider_id, span[0]), 0) & span[1] == span[1]
+
+            provider_id = pool.pick(category, fits)
+            if provider_id is None and current in pool.ratings:
+                continue
+            if provider_id == current:
+                continue
+            moves[doc['_id']] = (doc, current, provider_id, span)
+            if provider_id is not None and span is not None:
+                masks[(provider_id, span[0])] &= ~span[1]
+
+        if not moves:
+            return {}
+        won = _write_moves(moves, db)
+        for booking_id, (_, _, provider_id, _) in moves.items():
+            if booking_id not in won and provider_id is not None:
+                # Counted by pick, but the booking changed meanwhile
+                pool.loads[provider_id] -= 1
+
+    slot_operations = []
+    released = []
+    now = datetime.now()
+    for booking_id in won:
+        doc, current, provider_id, span = moves[booking_id]
+        if span is None:
+            continue
+        day, mask = span
+        if provider_id is not None:
+            slot_operations.append(UpdateOne(
+                {'provider_id': provider_id, 'date': day.isoformat()},
+                {'$bit': {'free': {'and': Int64(FULL_DAY & ~mask)}}, '$set': {'updated_at': now}},
+            ))
+        if current is not None:
+            released.append(dict(doc, provider_id=current))
+    if slot_operations:
+        db[SLOTS_COLLECTION].bulk_write(slot_operations, ordered=False)
+    for doc in released:
+        release(doc, db=db)
+
+    invalidate_user_summary(*{moves[booking_id][0].get('customer_id') for booking_id in won})
+    return {booking_id: moves[booking_id][2] for booking_id in won}
+
+
+def _write_moves(moves, db):
+    """
+    Move each booking to its new provider if it still has the one it was
+    read with, in one ``bulk_write``; returns the ``_id`` of those moved.
+    The writes are tagged with a batch id to tell them apart from a
+    concurrent assignment, and untagged once read back.
+    """
+    collection = db['services_booking']
+    batch = ObjectId()
+    now = datetime.now()
+    result = collection.bulk_write([
+        UpdateOne({'_id': booking_id, 'provider_id': current},
+                  {'$set': {'provider_id': provider_id, 'assigned_at': now, 'updated_at': now,
+                            'assignment_batch': batch}})
+        for booking_id, (_, current, provider_id, _) in moves.items()
+    ], ordered=False)
+    won = set(moves)
+    if result.modified_count < len(moves):
+        tagged = collection.find({'_id': {'$in': list(moves)}, 'assignment_batch': batch}, {'_id': 1})
+        won = {doc['_id'] for doc in tagged}
+    if won:
+        collection.update_many(
+            {'_id': {'$in': list(won)}, 'assignment_batch': batch}, {'$unset': {'assignment_batch': ''}},
+        )
+    return won
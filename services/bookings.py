@@ -0,0 +1,286 @@
+"""
+Idempotent booking creation, and customer edits addressed by booking id
+
+A booking is one ``insert_one`` carrying an ``idempotency_key`` under a
+unique index. The booking form embeds a fresh key each time it is
+rendered; when a client does not send one, the key is derived from the
+customer, service and slot, so a double submit of the same form maps to the
+same key either way. A retry finds the booking the first submit created
+and returns it instead of writing a second one.
+
+The service comes from the in-process catalog and its provider's user id
+from the catalog entry (or a per-process memo for the sample catalog), so
+the submit path makes no ORM queries. The booking embeds a snapshot of the
+service as booked (see :mod:`services.snapshots`).
+
+Customers update and cancel a booking by its ObjectId. Each change is one
+conditional ``find_one_and_update`` that sets only the fields that changed
+and only while the booking is still in an editable state, so a stale page
+cannot overwrite a booking that was completed or cancelled meanwhile.
+Cancelling is the ``cancel`` event of :mod:`services.transitions`.
+"""
+import hashlib
+import threading
+import uuid
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from .catalog import get_catalog
+from .mongo import get_db
+from .provider_jobs import service_area_for
+from .repositories import to_object_id
+from .snapshots import service_snapshot
+from .slots import SLOT_PROJECTION, booking_minutes, local_datetime, release, reserve, service_minutes
+from .stats import insert_booking, transition_booking
+from .summaries import invalidate_user_summary
+from .transitions import apply_transition
+
+# Fields returned for an existing booking found by its key
+EXISTING_PROJECTION = {'_id': 1, 'status': 1, 'booking_date': 1, 'provider_id': 1}
+
+# States in which the customer may still change a booking (cancelling
+# follows the ``cancel`` transition)
+EDITABLE_STATUSES = ('pending', 'confirmed')
+
+# States of a booking that no longer holds its slot: a derived key that
+# finds one moves on to a fresh key instead of returning it
+DEAD_STATUSES = ('cancelled', 'rejected')
+
+_provider_ids = {}
+_provider_lock = threading.Lock()
+
+
+class BookingCreation:
+    """Outcome of one create attempt"""
+    __slots__ = ('booking', 'created', 'error')
+
+    def __init__(self, booking=None, created=False, error=None):
+        self.booking = booking
+        self.created = created
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.booking is not None
+
+    @property
+    def booking_id(self):
+        return str(self.booking['_id']) if self.booking else None
+
+    @property
+    def message(self):
+        if self.error == 'slot_unavailable':
+            return 'That time is not available for this service. Please choose another slot.'
+        if self.error == 'key_conflict':
+            return 'This booking form was already used. Please reload the page and try again.'
+        return ''
+
+
+class BookingChange:
+    """Outcome of one update or cancel of an existing booking"""
+    __slots__ = ('booking_id', 'changes', 'error', 'status')
+
+    def __init__(self, booking_id, changes=None, error=None, status=None):
+        self.booking_id = booking_id
+        self.changes = changes or {}
+        self.error = error
+        self.status = status
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def message(self):
+        if self.error == 'not_found':
+            return 'Booking not found.'
+        if self.error == 'not_editable':
+            return f'A {self.status} booking can no longer be changed.'
+        if self.error == 'not_cancellable':
+            return 'This booking cannot be cancelled.'
+        if self.error == 'slot_unavailable':
+            return 'The provider is not available at the new time.'
+        return ''
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def derived_idempotency_key(customer_id, service_id, booking_datetime, after=None):
+    """
+    Key for submits that carry none: same customer, service and slot. Once
+    the booking made with a key is cancelled or rejected, the next booking
+    of that slot uses the key derived ``after`` that booking's ``_id``.
+    """
+    raw = f'{customer_id}:{service_id}:{booking_datetime.isoformat()}'
+    if after is not None:
+        raw = f'{raw}:{after}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def provider_id_for(service):
+    """User id of a catalog service's provider, creating the user once for sample services"""
+    provider = service['provider']['user']
+    if provider.get('id') is not None:
+        return provider['id']
+    email = provider['email']
+    provider_id = _provider_ids.get(email)
+    if provider_id is None:
+        from users.models import User
+
+        with _provider_lock:
+            provider_id = _provider_ids.get(email)
+            if provider_id is None:
+                names = provider['get_full_name'].split()
+                user, _ = User.objects.get_or_create(email=email, defaults={
+                    'first_name': names[0] if names else '',
+                    'last_name': ' '.join(names[1:]),
+                    'user_type': 'provider',
+                    'is_active': True,
+                })
+                provider_id = _provider_ids[email] = user.id
+    return provider_id
+
+
+def booking_document(customer, service, provider_id, booking_datetime, address, phone_number, notes,
+                     idempotency_key, duration_minutes, catalog_source='database'):
+    now = datetime.now()
+    return {
+        'customer_id': customer.id,
+        'provider_id': provider_id,
+        'service_id': None,  # We'll handle this in the payment page
+        'status': 'pending',
+        'booking_date': booking_datetime,
+        'duration_minutes': duration_minutes,
+        'address': address,
+        'service_area': service_area_for(address),
+        'phone_number': phone_number,
+        'total_amount': float(service.get('price') or 0),
+        'payment_status': 'pending',
+        'is_paid': False,
+        'special_instructions': notes,
+        'notes': f"Booking for {service['name']} - Provider: {service['provider']['user']['get_full_name']}",
+        'service_snapshot': service_snapshot(service, catalog_source),
+        'idempotency_key': idempotency_key,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+def find_by_key(customer_id, idempotency_key, db=None):
+    return (db if db is not None else get_db())['services_booking'].find_one(
+        {'idempotency_key': idempotency_key, 'customer_id': customer_id}, EXISTING_PROJECTION,
+    )
+
+
+def create_booking(customer, service, booking_datetime, address='', phone_number='', notes='',
+                   idempotency_key=None, db=None):
+    """
+    Create a pending booking of catalog ``service`` for ``customer``, or
+    return the one an earlier submit with the same key created. Returns a
+    :class:`BookingCreation`.
+    """
+    db = db if db is not None else get_db()
+    key = idempotency_key or derived_idempotency_key(customer.id, service['id'], booking_datetime)
+
+    existing = find_by_key(customer.id, key, db=db)
+    if idempotency_key is None:
+        # Rebooking a slot whose earlier booking was cancelled is a new request
+        while existing is not None and existing.get('status') in DEAD_STATUSES:
+            key = derived_idempotency_key(customer.id, service['id'], booking_datetime, after=existing['_id'])
+            existing = find_by_key(customer.id, key, db=db)
+    if existing is not None:
+        return BookingCreation(existing)
+
+    provider_id = provider_id_for(service)
+    duration_minutes = service_minutes(service)
+    if not reserve(provider_id, booking_datetime, duration_minutes, db=db):
+        # A concurrent submit of the same form may have taken the slot
+        existing = find_by_key(customer.id, key, db=db)
+        if existing is not None:
+            return BookingCreation(existing)
+        return BookingCreation(error='slot_unavailable')
+
+    booking_doc = booking_document(
+        customer, service, provider_id, booking_datetime, address, phone_number, notes, key, duration_minutes,
+        catalog_source=get_catalog().source,
+    )
+    try:
+        insert_booking(booking_doc, db=db)
+    except DuplicateKeyError:
+        # Lost the race to a concurrent submit with the same key; its booking holds the slot
+        release(booking_doc, db=db)
+        existing = find_by_key(customer.id, key, db=db)
+        return BookingCreation(existing, error=None if existing else 'key_conflict')
+    except Exception:
+        # The insert itself failed (insert_booking does not raise once it is in)
+        release(booking_doc, db=db)
+        raise
+    invalidate_user_summary(customer.id)
+    return BookingCreation(booking_doc, created=True)
+
+
+def _refused(booking_id, object_id, customer, error, db):
+    """Why a guarded write matched nothing: the booking is missing or in another state"""
+    current = db['services_booking'].find_one({'_id': object_id, 'customer_id': customer.id}, {'status': 1})
+    if current is None:
+        return BookingChange(booking_id, error='not_found')
+    return BookingChange(booking_id, error=error, status=current.get('status'))
+
+
+def update_booking(booking_id, customer, booking_datetime=None, special_instructions=None, db=None):
+    """
+    Move ``customer``'s booking to ``booking_datetime`` and/or replace its
+    special instructions (None leaves a field as it is). Returns a
+    :class:`BookingChange` whose ``changes`` are the fields written.
+    """
+    object_id = to_object_id(booking_id)
+    if object_id is None:
+        return BookingChange(booking_id, error='not_found')
+    db = db if db is not None else get_db()
+    query = {'_id': object_id, 'customer_id': customer.id, 'status': {'$in': list(EDITABLE_STATUSES)}}
+    changes = {}
+    if special_instructions is not None:
+        changes['special_instructions'] = special_instructions
+
+    reserved = None
+    if booking_datetime is not None:
+        current = db['services_booking'].find_one(query, SLOT_PROJECTION)
+        if current is None:
+            return _refused(booking_id, object_id, customer, 'not_editable', db)
+        old_date = current.get('booking_date')
+        if not isinstance(old_date, datetime) or local_datetime(old_date) != local_datetime(booking_datetime):
+            # Take the blocks of the new slot the booking does not hold yet;
+            # the transition below frees the ones it leaves
+            if current.get('provider_id') is not None:
+                if not reserve(current['provider_id'], booking_datetime, booking_minutes(current), db=db,
+                               held=current):
+                    return BookingChange(booking_id, error='slot_unavailable', status=current.get('status'))
+                reserved = dict(current, booking_date=booking_datetime)
+            changes['booking_date'] = booking_datetime
+            # Only move the booking from the date the slot check was made against
+            query['booking_date'] = old_date
+
+    if not changes:
+        return BookingChange(booking_id)
+    before = transition_booking(query, {'$set': dict(changes, updated_at=datetime.now())}, db=db)
+    if before is None:
+        if reserved is not None:
+            release(reserved, db=db)
+        return _refused(booking_id, object_id, customer, 'not_editable', db)
+    invalidate_user_summary(customer.id)
+    return BookingChange(booking_id, changes=changes, status=before.get('status'))
+
+
+def cancel_booking(booking_id, customer, reason='', db=None):
+    """Cancel ``customer``'s booking while it is still cancellable; returns a :class:`BookingChange`"""
+    changes = {'cancellation_reason': reason, 'cancellation_date': datetime.now()}
+    result = apply_transition(
+        booking_id, 'cancel', changes, guard={'customer_id': customer.id}, actor_id=customer.id, db=db,
+    )
+    if not result.ok:
+        error = 'not_cancellable' if result.error == 'wrong_state' else 'not_found'
+        return BookingChange(booking_id, error=error, status=result.current_status)
+    return BookingChange(booking_id, changes=dict(changes, status='cancelled'), status=result.before.get('status'))
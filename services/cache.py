@@ -0,0 +1,279 @@
+"""
+Two-tier cache for computed read models
+
+The catalog, dashboard summaries and invoice statuses are expensive to build
+and cheap to keep. A :class:`CacheNamespace` keeps them in two tiers:
+
+- a bounded in-process LRU tier, read without a round trip, whose entries
+  live at most ``settings.SERVICES_CACHE_LOCAL_MAX_AGE`` seconds;
+- a shared tier, the Django cache named by ``settings.SERVICES_CACHE``
+  (Redis when ``REDIS_URL`` is set, a file-based cache otherwise; see
+  ``CACHES``), read by every worker process.
+
+Keys are namespaced (``<namespace>:<part>:...``) and use Django's cache
+versioning with the namespace ``version``, so a change to the shape of a
+cached value only needs a version bump. :meth:`CacheNamespace.delete` drops
+one key; :meth:`CacheNamespace.invalidate` drops a whole namespace for every
+process by rotating the generation token stored next to its values.
+
+Each shared entry is stamped with that generation and its freshness deadline.
+When a local entry expires and the shared tier still holds the same write,
+the value decoded from it is kept rather than decoded again, so derived
+state (the catalog's search index) survives until the value really changes.
+
+Rebuilds are single flight: one thread per process (striped locks) and one
+process per key (a short lock taken with ``cache.add``) run ``build``. The
+others wait for the result or, when the expired value is still held, are
+served it until the rebuild lands. The per-key lock is only as atomic as the
+backend's ``add``: Redis makes it so, but the file-based fallback does not,
+and there two processes may occasionally build the same key. When the shared
+cache is unreachable the value is built and kept in the local tier only.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_ALIAS = 'default'
+DEFAULT_LOCAL_MAX_AGE = 5
+DEFAULT_LOCAL_ENTRIES = 1000
+# Seconds an expired shared value is still kept, to be served while it is rebuilt
+STALE_GRACE = 60
+# Seconds one process may hold a rebuild lock (and others wait for it)
+LOCK_TIMEOUT = 10
+LOCK_POLL = 0.05
+FLIGHT_STRIPES = 64
+
+_MISSING = object()
+
+
+def shared_cache():
+    """The Django cache backing the shared tier"""
+    return caches[getattr(settings, 'SERVICES_CACHE', DEFAULT_ALIAS)]
+
+
+class CacheNamespace:
+    """
+    Cached values of one kind. ``max_age_setting``/``default_max_age`` give
+    the shared timeout in seconds; ``decode`` turns the stored (picklable)
+    payload into the object handed out and kept in the local tier.
+    """
+
+    def __init__(self, name, max_age_setting, default_max_age, version=1,
+                 local_entries=DEFAULT_LOCAL_ENTRIES, decode=None):
+        self.name = name
+        self.max_age_setting = max_age_setting
+        self.default_max_age = default_max_age
+        self.version = version
+        self.local_entries = local_entries
+        self.decode = decode
+        self._local = OrderedDict()
+        # Bumped by every delete/invalidate, so a value built meanwhile is not kept
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._flights = [threading.Lock() for _ in range(FLIGHT_STRIPES)]
+
+    def __repr__(self):
+        return f"CacheNamespace({self.name} v{self.version})"
+
+    @property
+    def max_age(self):
+        return getattr(settings, self.max_age_setting, self.default_max_age)
+
+    @property
+    def local_max_age(self):
+        return min(self.max_age, getattr(settings, 'SERVICES_CACHE_LOCAL_MAX_AGE', DEFAULT_LOCAL_MAX_AGE))
+
+    @property
+    def _generation_key(self):
+        return f'{self.name}:generation'
+
+    def key(self, key):
+        """Namespaced cache key for ``key`` (a value or a tuple of parts)"""
+        parts = key if isinstance(key, tuple) else (key,)
+        return ':'.join([self.name] + [str(part) for part in parts])
+
+    def get(self, key):
+        """The cached value of ``key``, or None"""
+        cache_key = self.key(key)
+        value = self._local_get(cache_key)
+        if value is not _MISSING:
+            return value
+        epoch = self._epoch
+        try:
+            generation, entry = self._read_shared(cache_key)
+        except Exception as e:
+            print(f"Cache {self.name} unavailable: {e}")
+            return None
+        if entry is None or entry[0] != generation or time.time() >= entry[1]:
+            return None
+        return self._keep(cache_key, entry[2], epoch, stamp=entry[:2])
+
+    def set(self, key, payload, timeout=None):
+        """Store ``payload`` under ``key`` in both tiers; returns the decoded value"""
+        cache_key = self.key(key)
+        epoch = self._epoch
+        stamp = None
+        try:
+            generation, _ = self._read_shared(cache_key, with_entry=False)
+            stamp = self._write_shared(cache_key, generation, payload, timeout)
+        except Exception as e:
+            print(f"Cache {self.name} unavailable: {e}")
+        return self._keep(cache_key, payload, epoch, stamp=stamp)
+
+    def get_or_set(self, key, build, timeout=None):
+        """
+        The cached value of ``key``, built once with ``build()`` when missing
+        or expired. ``timeout`` may be a function of the built payload. A
+        value deleted or invalidated while it was being built is returned
+        but not stored.
+        """
+        cache_key = self.key(key)
+        value = self._local_get(cache_key)
+        if value is not _MISSING:
+            return value
+        with self._flights[hash(cache_key) % FLIGHT_STRIPES]:
+            # Another thread of this process may have loaded it meanwhile
+            value = self._local_get(cache_key)
+            if value is not _MISSING:
+                return value
+            return self._load(cache_key, build, timeout)
+
+    def delete(self, *keys):
+        """Drop ``keys`` from both tiers"""
+        cache_keys = [self.key(key) for key in keys]
+        with self._lock:
+            self._epoch += 1
+            for cache_key in cache_keys:
+                self._local.pop(cache_key, None)
+        try:
+            shared_cache().delete_many(cache_keys, version=self.version)
+        except Exception as e:
+            print(f"Cache {self.name} unavailable: {e}")
+
+    def invalidate(self):
+        """Drop every value of the namespace, in every process"""
+        with self._lock:
+            self._epoch += 1
+            self._local.clear()
+        try:
+            shared_cache().set(self._generation_key, uuid.uuid4().hex, timeout=None, version=self.version)
+        except Exception as e:
+            print(f"Cache {self.name} unavailable: {e}")
+
+    def _local_get(self, cache_key):
+        with self._lock:
+            entry = self._local.get(cache_key)
+            if entry is None:
+                return _MISSING
+            expires_at, value, _ = entry
+            if time.monotonic() >= expires_at:
+                # Kept (until evicted) so an unchanged shared value reuses it
+                return _MISSING
+            self._local.move_to_end(cache_key)
+            return value
+
+    def _keep(self, cache_key, payload, epoch, stamp=None):
+        """
+        Keep ``payload`` in the local tier, decoded. ``stamp`` identifies the
+        shared write it was read from: when the expired local entry came from
+        the same write, its decoded value is kept instead of decoding again.
+        """
+        with self._lock:
+            held = self._local.get(cache_key)
+        if stamp is not None and held is not None and held[2] == stamp:
+            value = held[1]
+        else:
+            value = self.decode(payload) if self.decode else payload
+        with self._lock:
+            if epoch == self._epoch:
+                self._local[cache_key] = (time.monotonic() + self.local_max_age, value, stamp)
+                self._local.move_to_end(cache_key)
+                while len(self._local) > self.local_entries:
+                    self._local.popitem(last=False)
+        return value
+
+    def _read_shared(self, cache_key, with_entry=True):
+        """``(generation, entry)`` from the shared tier in one round trip"""
+        backend = shared_cache()
+        keys = [self._generation_key, cache_key] if with_entry else [self._generation_key]
+        found = backend.get_many(keys, version=self.version)
+        generation = found.get(self._generation_key)
+        if generation is None:
+            # First use, or the token was evicted: values stored under an
+            # older token must not come back, so start a new one
+            generation = uuid.uuid4().hex
+            if not backend.add(self._generation_key, generation, timeout=None, version=self.version):
+                generation = backend.get(self._generation_key, version=self.version) or generation
+        return generation, found.get(cache_key)
+
+    def _write_shared(self, cache_key, generation, payload, timeout):
+        """Store ``payload``; returns the stamp (generation, fresh until) identifying this write"""
+        if callable(timeout):
+            timeout = timeout(payload)
+        timeout = self.max_age if timeout is None else timeout
+        entry = (generation, time.time() + timeout, payload)
+        # Kept past its freshness so it can be served while the next build runs
+        shared_cache().set(cache_key, entry, timeout=timeout + STALE_GRACE, version=self.version)
+        return entry[:2]
+
+    def _load(self, cache_key, build, timeout):
+        epoch = self._epoch
+        try:
+            generation, entry = self._read_shared(cache_key)
+        except Exception as e:
+            print(f"Cache {self.name} unavailable: {e}")
+            return self._keep(cache_key, build(), epoch)
+
+        usable = entry is not None and entry[0] == generation
+        if usable and time.time() < entry[1]:
+            return self._keep(cache_key, entry[2], epoch, stamp=entry[:2])
+
+        lock_key = f'{cache_key}:lock'
+        try:
+            locked = shared_cache().add(lock_key, 1, timeout=LOCK_TIMEOUT, version=self.version)
+        except Exception as e:
+            print(f"Cache {self.name} unavailable: {e}")
+            return self._keep(cache_key, build(), epoch)
+        if not locked:
+            if usable:
+                # Expired, and another process is already rebuilding it
+                return self._keep(cache_key, entry[2], epoch, stamp=entry[:2])
+            entry = self._wait(cache_key, generation)
+            if entry is not _MISSING:
+                return self._keep(cache_key, entry[2], epoch, stamp=entry[:2])
+            # The lock holder is slow or gone; build it here as well
+
+        stamp = None
+        try:
+            payload = build()
+            if epoch == self._epoch:
+                try:
+                    stamp = self._write_shared(cache_key, generation, payload, timeout)
+                except Exception as e:
+                    print(f"Cache {self.name} unavailable: {e}")
+        finally:
+            if locked:
+                try:
+                    shared_cache().delete(lock_key, version=self.version)
+                except Exception as e:
+                    # The lock expires after LOCK_TIMEOUT anyway
+                    print(f"Cache {self.name} unavailable: {e}")
+        return self._keep(cache_key, payload, epoch, stamp=stamp)
+
+    def _wait(self, cache_key, generation):
+        """Poll the shared tier while another process builds ``cache_key``; returns its entry"""
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            try:
+                entry = shared_cache().get(cache_key, version=self.version)
+            except Exception as e:
+                print(f"Cache {self.name} unavailable: {e}")
+                break
+            if entry is not None and entry[0] == generation:
+                return entry
+        return _MISSING
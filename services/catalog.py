@@ -0,0 +1,208 @@
+"""
+In-process service catalog
+
+The public pages (service list, categories, detail, booking form, user
+dashboard) all read the same small catalog. It is loaded once from
+``Service``/``ServiceCategory`` into an immutable :class:`CatalogSnapshot`
+with id/slug/name indexes. When the database has no active services the
+built-in sample catalog is used.
+
+The loaded catalog is shared by every worker process through
+:mod:`services.cache` for ``settings.CATALOG_MAX_AGE`` seconds, so one
+process loads it and the others only read it. A ``post_save`` or
+``post_delete`` of either model invalidates it everywhere (see
+:mod:`services.signals`); processes notice within
+``SERVICES_CACHE_LOCAL_MAX_AGE`` seconds.
+"""
+import uuid
+from types import MappingProxyType
+
+from .cache import CacheNamespace
+from .sample_data import SAMPLE_CATEGORIES, SAMPLE_REVIEWS, SAMPLE_SERVICES
+
+DEFAULT_MAX_AGE = 300
+
+
+def _freeze(value):
+    """Recursively turn dicts/lists into read-only mappings/tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of the catalog at one version.
+
+    ``services`` and ``categories`` are tuples of read-only mappings in the
+    shape the templates already use (``service.provider.user.get_full_name``,
+    ``category.service_count`` ...). Lookups go through prebuilt indexes.
+    ``version`` names the load it was built from: snapshots decoded from the
+    same cached load share it.
+    """
+    __slots__ = (
+        'source', 'version', 'services', 'categories',
+        '_by_id', '_by_name', '_by_category', '_categories_by_slug', '_reviews',
+    )
+
+    def __init__(self, services, categories, source='database', reviews=None, version=None):
+        services = _freeze(services)
+        by_category = {}
+        for service in services:
+            by_category.setdefault(service['category_slug'], []).append(service)
+
+        frozen_categories = []
+        for category in categories:
+            in_category = by_category.get(category['slug'], [])
+            frozen_categories.append(_freeze(dict(
+                category,
+                service_count=len(in_category),
+                sample_services=[{'id': s['id'], 'name': s['name'], 'price': s['price']} for s in in_category[:3]],
+            )))
+
+        object.__setattr__(self, 'source', source)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'services', services)
+        object.__setattr__(self, 'categories', tuple(frozen_categories))
+        object.__setattr__(self, '_by_id', MappingProxyType({s['id']: s for s in services}))
+        object.__setattr__(self, '_by_name', MappingProxyType({s['name']: s for s in reversed(services)}))
+        object.__setattr__(self, '_by_category', MappingProxyType(
+            {slug: tuple(items) for slug, items in by_category.items()}
+        ))
+        object.__setattr__(self, '_categories_by_slug', MappingProxyType(
+            {c['slug']: c for c in frozen_categories}
+        ))
+        object.__setattr__(self, '_reviews', _freeze(reviews or {}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CatalogSnapshot is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('CatalogSnapshot is read-only')
+
+    def get(self, service_id):
+        """Service by id (int or numeric string), or None"""
+        try:
+            return self._by_id.get(int(service_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_by_name(self, name):
+        """First service with exactly this name, or None"""
+        return self._by_name.get(name)
+
+    def category(self, slug):
+        """Category by slug, or None"""
+        return self._categories_by_slug.get(slug)
+
+    def in_category(self, slug):
+        """Services in the category with this slug, in catalog order"""
+        return self._by_category.get(slug, ())
+
+    def related(self, service, limit=3):
+        """Other services from the same category"""
+        return [s for s in self.in_category(service['category_slug']) if s['id'] != service['id']][:limit]
+
+    def featured(self, limit=6):
+        """Best rated services, at most one per category"""
+        seen = set()
+        featured = []
+        for service in sorted(self.services, key=lambda s: (s['average_rating'], s['review_count']), reverse=True):
+            if service['category_slug'] in seen:
+                continue
+            seen.add(service['category_slug'])
+            featured.append(service)
+            if len(featured) == limit:
+                break
+        return featured
+
+    def reviews(self, service_id):
+        """Sample reviews for a service (real reviews are per booking)"""
+        return self._reviews.get(service_id, ())
+
+
+def _provider_name(user):
+    return user.get_full_name() or user.email
+
+
+def load_from_database():
+    """Return (services, categories) built from the ORM, or ([], []) if empty"""
+    from users.models import User
+    from .models import Service, ServiceCategory
+
+    # is_active/is_available are checked in Python: boolean filters are
+    # unreliable through djongo
+    services = [s for s in Service.objects.all() if s.is_active and s.is_available]
+    if not services:
+        return [], []
+
+    categories = {c.id: c for c in ServiceCategory.objects.all()}
+    providers = User.objects.in_bulk({s.provider_id for s in services})
+
+    service_dicts = []
+    for service in services:
+        category = categories.get(service.category_id)
+        provider = providers.get(service.provider_id)
+        if category is None or provider is None:
+            continue
+        service_dicts.append({
+            'id': service.id,
+            'name': service.name,
+            'description': service.description,
+            'price': float(service.price),
+            'duration': service.duration,
+            'average_rating': round(service.average_rating, 1),
+            'review_count': service.review_count,
+            'category_name': category.name,
+            'category_slug': category.slug,
+            'provider': {'user': {'id': provider.id, 'get_full_name': _provider_name(provider), 'email': provider.email}},
+            'image': {'url': service.image.url} if service.image else None,
+        })
+
+    category_dicts = [
+        {'id': c.id, 'name': c.name, 'slug': c.slug, 'description': c.description}
+        for c in sorted(categories.values(), key=lambda c: c.name)
+    ]
+    return service_dicts, category_dicts
+
+
+def load_catalog():
+    """
+    The catalog as plain data for the shared cache: the database's, or the
+    sample catalog when it has no active services
+    """
+    try:
+        services, categories = load_from_database()
+    except Exception as e:
+        print(f"DEBUG: Error loading service catalog: {e}")
+        services, categories = [], []
+
+    version = uuid.uuid4().hex
+    if services:
+        return {'services': services, 'categories': categories, 'source': 'database', 'reviews': None,
+                'version': version}
+    return {'services': SAMPLE_SERVICES, 'categories': SAMPLE_CATEGORIES, 'source': 'sample', 'reviews': SAMPLE_REVIEWS,
+            'version': version}
+
+
+def build_snapshot(catalog=None):
+    """Build a snapshot from loaded catalog data (loading it when not given)"""
+    catalog = catalog or load_catalog()
+    return CatalogSnapshot(
+        catalog['services'], catalog['categories'], catalog['source'], catalog['reviews'], catalog.get('version'),
+    )
+
+
+catalog_cache = CacheNamespace('catalog', 'CATALOG_MAX_AGE', DEFAULT_MAX_AGE, local_entries=1, decode=build_snapshot)
+
+
+def get_catalog():
+    """Return the current :class:`CatalogSnapshot`, loading it if needed"""
+    return catalog_cache.get_or_set('snapshot', load_catalog)
+
+
+def invalidate_catalog(**kwargs):
+    """Drop the cached catalog; the next :func:`get_catalog` reloads it"""
+    catalog_cache.invalidate()
@@ -0,0 +1,160 @@
+"""
+Admin dashboard statistics in two round trips
+
+Totals, per-status counts, today's bookings, paid revenue and the service
+count are read from the incrementally maintained counters of
+:mod:`services.stats`, the same source as the approve/reject responses, so
+every page agrees. The lists the counters do not keep (recent and pending
+bookings and the most booked services) come from one ``$facet`` pipeline
+over ``services_booking`` that understands the raw document shape
+(``customer_id``, float or Decimal128 ``total_amount``, service in
+``service_snapshot`` or, for older documents, named only in ``notes``).
+"""
+from .catalog import get_catalog
+from .models import Service
+from .mongo import get_db
+from .repositories import BOOKING_COLLECTION, BookingRepository, SUMMARY_FIELDS, projection_for
+from .stats import build_counters, counted_counters, get_dashboard_counters
+
+DASHBOARD_FIELDS = SUMMARY_FIELDS + ('provider_id', 'address', 'booking_date')
+
+# Service name from "Booking for X - Provider: Y" notes, for documents
+# written before service_snapshot
+_NOTES_SERVICE_NAME = {
+    '$let': {
+        'vars': {'head': {'$arrayElemAt': [{'$split': [{'$ifNull': ['$notes', '']}, ' - Provider: ']}, 0]}},
+        'in': {'$cond': [
+            {'$eq': [{'$indexOfBytes': ['$$head', 'Booking for ']}, 0]},
+            {'$substrBytes': ['$$head', 12, -1]},
+            '$$head',
+        ]},
+    }
+}
+
+_AMOUNT = {'$convert': {'input': '$total_amount', 'to': 'double', 'onError': 0, 'onNull': 0}}
+
+
+def dashboard_pipeline(recent_limit, pending_limit, popular_limit):
+    """The ``$facet`` stage for the requested lists, or None when none is wanted"""
+    projection = projection_for(DASHBOARD_FIELDS)
+    facets = {}
+    # $limit must be positive, so lists a page does not show are left out
+    if recent_limit:
+        facets['recent'] = [
+            {'$sort': {'created_at': -1}},
+            {'$limit': recent_limit},
+            {'$project': projection},
+        ]
+    if pending_limit:
+        facets['pending'] = [
+            {'$match': {'status': 'pending'}},
+            {'$sort': {'created_at': -1}},
+            {'$limit': pending_limit},
+            {'$project': projection},
+        ]
+    if popular_limit:
+        facets['popular'] = [
+            {'$group': {
+                '_id': {
+                    'service_id': {'$ifNull': ['$service_snapshot.id', '$service_id']},
+                    'name': {'$ifNull': ['$service_snapshot.name', _NOTES_SERVICE_NAME]},
+                },
+                'booking_count': {'$sum': 1},
+                'average_amount': {'$avg': _AMOUNT},
+            }},
+            {'$sort': {'booking_count': -1}},
+            {'$limit': popular_limit},
+        ]
+    return [{'$facet': facets}] if facets else None
+
+
+class DashboardStats:
+    """Everything the admin dashboards show"""
+
+    def __init__(self, totals, status_counts, recent_bookings, latest_pending, popular_services):
+        self.total_services = totals.get('services', 0)
+        self.total_bookings = totals.get('total', 0)
+        self.total_revenue = float(totals.get('revenue', 0))
+        self.today_bookings = totals.get('today', 0)
+        self.status_counts = status_counts
+        self.pending_bookings = status_counts.get('pending', 0)
+        self.confirmed_bookings = status_counts.get('confirmed', 0)
+        self.rejected_bookings = status_counts.get('rejected', 0)
+        self.recent_bookings = recent_bookings
+        self.latest_pending = latest_pending
+        self.popular_services = popular_services
+
+    def as_context(self):
+        return {
+            'total_services': self.total_services,
+            'total_bookings': self.total_bookings,
+            'total_revenue': self.total_revenue,
+            'pending_bookings': self.pending_bookings,
+            'confirmed_bookings': self.confirmed_bookings,
+            'rejected_bookings': self.rejected_bookings,
+            'today_bookings': self.today_bookings,
+            'recent_bookings': self.recent_bookings,
+            'popular_services': self.popular_services,
+            'latest_pending': self.latest_pending,
+        }
+
+
+def _popular_services(rows):
+    catalog = get_catalog()
+    popular = []
+    for row in rows:
+        service = catalog.get(row['_id'].get('service_id')) or catalog.get_by_name(row['_id'].get('name'))
+        popular.append({
+            'id': service['id'] if service else None,
+            'name': service['name'] if service else (row['_id'].get('name') or 'Home Service'),
+            'price': service['price'] if service else round(row.get('average_amount') or 0),
+            'category': service['category_name'] if service else '',
+            'booking_count': row['booking_count'],
+        })
+    return popular
+
+
+def load_counters(db=None):
+    """
+    The dashboard counters, built from the bookings on first use by the one
+    request that claims the build; the others count the bookings meanwhile
+    """
+    db = db if db is not None else get_db()
+    counters = get_dashboard_counters(db)
+    if counters is None:
+        service_count = Service.objects.count()
+        if build_counters(service_count, db=db):
+            counters = get_dashboard_counters(db)
+        if counters is None:
+            counters = counted_counters(service_count, db=db)
+    return counters
+
+
+def get_dashboard_stats(request=None, recent_limit=10, pending_limit=5, popular_limit=5):
+    """
+    Read the counters, run the list ``$facet`` and resolve the listed
+    bookings' users in one query
+    """
+    db = get_db()
+    counters = load_counters(db)
+    totals = {
+        'services': counters.get('services', 0),
+        'total': counters.get('total', 0),
+        'revenue': counters.get('revenue', 0),
+        'today': counters.get('today', 0),
+    }
+    status_counts = counters.get('status', {})
+
+    pipeline = dashboard_pipeline(recent_limit, pending_limit, popular_limit)
+    facets = next(db[BOOKING_COLLECTION].aggregate(pipeline), {}) if pipeline else {}
+
+    repository = BookingRepository.for_request(request) if request is not None else BookingRepository(db=db)
+    recent_docs = facets.get('recent', [])
+    pending_docs = facets.get('pending', [])
+    records = repository.build_records(recent_docs + pending_docs)
+    recent_bookings = [record for record in records[:len(recent_docs)] if record.customer is not None]
+    latest_pending = [record for record in records[len(recent_docs):] if record.customer is not None]
+
+    return DashboardStats(
+        totals, status_counts, recent_bookings, latest_pending, _popular_services(facets.get('popular', [])),
+    )
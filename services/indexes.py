@@ -0,0 +1,312 @@
+"""
+Indexes for the raw MongoDB query shapes
+
+The booking/invoice/review documents are read with ``customer_id``,
+``provider_id`` and ``booking_id`` keys written outside the ORM, so the
+``Meta.indexes`` on the models do not cover them. Every index the raw code
+paths rely on is declared here and applied by ``manage.py ensure_mongo_indexes``.
+"""
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+
+class IndexSpec:
+    """One declared index: collection, key pattern and creation options"""
+    __slots__ = ('collection', 'keys', 'name', 'options', 'purpose')
+
+    def __init__(self, collection, keys, name, purpose='', **options):
+        self.collection = collection
+        self.keys = list(keys)
+        self.name = name
+        self.purpose = purpose
+        self.options = options
+
+    @property
+    def unique(self):
+        return bool(self.options.get('unique'))
+
+    def matches_keys(self, info):
+        """True if an ``index_information()`` entry has the same key pattern"""
+        return [(field, int(direction)) for field, direction in info['key']] == self.keys
+
+    def matches_options(self, info):
+        """True if an existing index with the same keys has the same semantics"""
+        if bool(info.get('unique')) != self.unique:
+            return False
+        partial = self.options.get('partialFilterExpression')
+        if partial is not None and info.get('partialFilterExpression') != partial:
+            return False
+        expire = self.options.get('expireAfterSeconds')
+        if expire is not None and info.get('expireAfterSeconds') != expire:
+            return False
+        return True
+
+    def __repr__(self):
+        return f"IndexSpec({self.collection}.{self.name})"
+
+
+INDEXES = [
+    # BookingRepository.list_for_customer / pages_for_customer:
+    # find({'customer_id'}).sort(created_at, _id)
+    IndexSpec(
+        'services_booking',
+        [('customer_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        'booking_customer_created',
+        purpose='customer booking list, newest first',
+    ),
+    # pages_for_customer per tab: find({'customer_id', 'status': {'$in'}}).sort(created_at, _id)
+    # and status_counts_for_customer: $match customer_id + $group on status
+    IndexSpec(
+        'services_booking',
+        [('customer_id', ASCENDING), ('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        'booking_customer_status_created',
+        purpose='customer booking tabs and status counts',
+    ),
+    # Servicer dashboard (provider_jobs): $match {'provider_id', 'status'}
+    # sorted by booking_date, _id, plus the count_documents for each status
+    IndexSpec(
+        'services_booking',
+        [('provider_id', ASCENDING), ('status', ASCENDING), ('booking_date', DESCENDING), ('_id', DESCENDING)],
+        'booking_provider_status_date',
+        purpose="provider's bookings by status ordered by service date",
+    ),
+    # Servicer dashboard open jobs (ProviderFeed.open_jobs, claim_job):
+    # unassigned confirmed bookings in the provider's service areas, soonest first
+    IndexSpec(
+        'services_booking',
+        [('status', ASCENDING), ('provider_id', ASCENDING), ('service_area', ASCENDING),
+         ('booking_date', ASCENDING), ('_id', ASCENDING)],
+        'booking_status_provider_area_date',
+        purpose='open jobs by service area',
+    ),
+    # bookings.create_booking: one booking per idempotency key, so a retried
+    # submit hits DuplicateKeyError instead of creating a second booking
+    IndexSpec(
+        'services_booking',
+        [('idempotency_key', ASCENDING)],
+        'booking_idempotency_key_unique',
+        purpose='one booking per create request',
+        unique=True,
+        partialFilterExpression={'idempotency_key': {'$type': 'string'}},
+    ),
+    # Admin dashboard recent bookings: find().sort('created_at', -1).limit(n)
+    IndexSpec(
+        'services_booking',
+        [('created_at', DESCENDING)],
+        'booking_created',
+        purpose='most recent bookings',
+    ),
+    # find_one({'_id', 'customer_id'}) is served by the built-in _id index.
+
+    # find_one({'booking_id'}) on invoice detail/download/status and the servicer dashboard $lookup.
+    # One invoice per booking; legacy documents without a booking_id are ignored.
+    IndexSpec(
+        'services_invoice',
+        [('booking_id', ASCENDING)],
+        'invoice_booking_unique',
+        purpose='invoice for a booking',
+        unique=True,
+        partialFilterExpression={'booking_id': {'$exists': True}},
+    ),
+    # find_one({'invoice_number'}) when a servicer updates a booking by invoice
+    IndexSpec(
+        'services_invoice',
+        [('invoice_number', ASCENDING)],
+        'invoice_number_unique',
+        purpose='invoice lookup by number',
+        unique=True,
+    ),
+    # payments.process_payment: one payment per idempotency key; relays replay safely
+    IndexSpec(
+        'services_payment',
+        [('idempotency_key', ASCENDING)],
+        'payment_idempotency_key_unique',
+        purpose='one payment per payment attempt',
+        unique=True,
+        partialFilterExpression={'idempotency_key': {'$type': 'string'}},
+    ),
+    # payments.find_payment(booking_id=...): latest payment of a booking
+    IndexSpec(
+        'services_payment',
+        [('booking_id', ASCENDING), ('created_at', DESCENDING)],
+        'payment_booking_created',
+        purpose='payments of a booking',
+    ),
+    # Payment ledger: append-only, one charge per idempotency key
+    IndexSpec(
+        'services_payment_ledger',
+        [('idempotency_key', ASCENDING)],
+        'ledger_idempotency_key_unique',
+        purpose='one ledger entry per payment',
+        unique=True,
+    ),
+    # Ledger by booking: reconciliation $lookup and per-booking history
+    IndexSpec(
+        'services_payment_ledger',
+        [('booking_id', ASCENDING), ('created_at', ASCENDING)],
+        'ledger_booking_created',
+        purpose='ledger entries of a booking',
+    ),
+    # Ledger by gateway transaction id
+    IndexSpec(
+        'services_payment_ledger',
+        [('transaction_id', ASCENDING)],
+        'ledger_transaction',
+        purpose='ledger entry for a transaction',
+    ),
+    # transitions.transition_history: find({'booking_id'}).sort(at)
+    IndexSpec(
+        'services_booking_transitions',
+        [('booking_id', ASCENDING), ('at', ASCENDING)],
+        'transition_booking_at',
+        purpose='status history of a booking',
+    ),
+    # Ops audit queries on the transition log: one event (e.g. every
+    # cancellation) over a time range
+    IndexSpec(
+        'services_booking_transitions',
+        [('event', ASCENDING), ('at', DESCENDING)],
+        'transition_event_at',
+        purpose='transitions of one kind, newest first',
+    ),
+    # add_review duplicate check: find_one({'booking_id', 'customer_id'}); unique
+    # so a concurrent double submit cannot insert (and count) a second review.
+    # ORM reviews carry no customer_id and are left out.
+    IndexSpec(
+        'services_review',
+        [('booking_id', ASCENDING), ('customer_id', ASCENDING)],
+        'review_booking_customer_unique',
+        purpose='one review per booking and customer',
+        unique=True,
+        partialFilterExpression={'customer_id': {'$exists': True}},
+    ),
+    # slots.day_mask / reserve: one free-slot mask per provider and day
+    IndexSpec(
+        'services_provider_slots',
+        [('provider_id', ASCENDING), ('date', ASCENDING)],
+        'slots_provider_date_unique',
+        purpose='free-slot mask of a provider on a day',
+        unique=True,
+    ),
+    # Job workers: claim() looks for due queued jobs / expired leases by run_after
+    IndexSpec(
+        'services_jobs',
+        [('status', ASCENDING), ('run_after', ASCENDING)],
+        'job_status_run_after',
+        purpose='next runnable background job',
+    ),
+    # enqueue() relies on this to keep one queued/running job per key
+    IndexSpec(
+        'services_jobs',
+        [('key', ASCENDING)],
+        'job_key_unique',
+        purpose='one background job per key',
+        unique=True,
+        partialFilterExpression={'key': {'$type': 'string'}},
+    ),
+]
+
+
+class IndexResult:
+    """Outcome of ensuring one :class:`IndexSpec`"""
+    CREATED = 'created'
+    EXISTS = 'exists'
+    CONFLICT = 'conflict'
+    FAILED = 'failed'
+    MISSING = 'missing'
+
+    __slots__ = ('spec', 'status', 'detail')
+
+    def __init__(self, spec, status, detail=''):
+        self.spec = spec
+        self.status = status
+        self.detail = detail
+
+    @property
+    def ok(self):
+        return self.status in (self.CREATED, self.EXISTS)
+
+
+def _find_existing(spec, existing):
+    """Return (name, info) of the index with the spec's key pattern, if any"""
+    for name, info in existing.items():
+        if spec.matches_keys(info):
+            return name, info
+    return None, None
+
+
+def ensure_index(db, spec, dry_run=False, replace=False):
+    """
+    Create ``spec`` unless an equivalent index already exists.
+
+    An index with the same keys but different options (e.g. not unique) is
+    reported as a conflict and left alone unless ``replace`` is set, in which
+    case it is dropped and rebuilt.
+    """
+    collection = db[spec.collection]
+    existing = collection.index_information()
+    name, info = _find_existing(spec, existing)
+
+    if info is not None:
+        if spec.matches_options(info):
+            detail = '' if name == spec.name else f"as '{name}'"
+            return IndexResult(spec, IndexResult.EXISTS, detail)
+        if not replace:
+            return IndexResult(spec, IndexResult.CONFLICT, f"'{name}' has the same keys with different options")
+        if dry_run:
+            return IndexResult(spec, IndexResult.MISSING, f"would drop '{name}' and rebuild")
+        collection.drop_index(name)
+    elif spec.name in existing:
+        # Same name, different keys: never silently redefine someone else's index
+        return IndexResult(spec, IndexResult.CONFLICT, f"name '{spec.name}' is used by another key pattern")
+    elif dry_run:
+        return IndexResult(spec, IndexResult.MISSING, 'would create')
+
+    try:
+        collection.create_index(spec.keys, name=spec.name, **spec.options)
+    except OperationFailure as e:
+        # Typically duplicate values blocking a unique index
+        return IndexResult(spec, IndexResult.FAILED, str(e.details.get('errmsg', e) if e.details else e))
+    return IndexResult(spec, IndexResult.CREATED)
+
+
+def ensure_indexes(db, specs=None, dry_run=False, replace=False):
+    """Ensure every declared index, returning one :class:`IndexResult` each"""
+    return [
+        ensure_index(db, spec, dry_run=dry_run, replace=replace)
+        for spec in (INDEXES if specs is None else specs)
+    ]
+
+
+def verify_indexes(db, specs=None):
+    """Check that every declared index is present with the declared options"""
+    results = []
+    for spec in (INDEXES if specs is None else specs):
+        name, info = _find_existing(spec, db[spec.collection].index_information())
+        if info is None:
+            results.append(IndexResult(spec, IndexResult.MISSING))
+        elif not spec.matches_options(info):
+            results.append(IndexResult(spec, IndexResult.CONFLICT, f"'{name}' has different options"))
+        else:
+            results.append(IndexResult(spec, IndexResult.EXISTS, '' if name == spec.name else f"as '{name}'"))
+    return results
+
+
+def index_usage(db, collections=None):
+    """
+    Return ``$indexStats`` rows per collection as
+    ``{collection: [(name, ops, since), ...]}``, least used first.
+
+    Counters are per mongod and reset on restart, so a zero only means
+    "unused since ``since``".
+    """
+    if collections is None:
+        collections = sorted({spec.collection for spec in INDEXES})
+    usage = {}
+    for name in collections:
+        rows = db[name].aggregate([{'$indexStats': {}}])
+        usage[name] = sorted(
+            ((row['name'], row['accesses']['ops'], row['accesses']['since']) for row in rows),
+            key=lambda row: row[1],
+        )
+    return usage
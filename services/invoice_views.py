@@ -2,30 +2,27 @@
 Invoice views for handling invoice generation, display, and download
 """
 import os
-import pymongo
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import FileResponse, JsonResponse, HttpResponse, HttpResponseNotModified, Http404
 from django.shortcuts import get_object_or_404, redirect
 from django.views import View
 from django.views.generic import TemplateView
 from django.contrib import messages
 from django.template.loader import render_to_string
+from django.core.files.storage import default_storage
 from bson import ObjectId
 from decimal import Decimal
 from datetime import datetime
-import uuid
-import qrcode
 from io import BytesIO
 from django.core.files.base import ContentFile
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.units import inch
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate
+from .invoicing import add_pdf_content, enqueue_invoice, invoice_status, pdf_is_current, qr_payload, render_qr_png
 from .models import Booking, Invoice
+from .mongo import get_db
+from .repositories import booking_provider_name, booking_service_name
 
 
 class InvoiceDetailView(LoginRequiredMixin, TemplateView):
@@ -96,8 +93,7 @@ class InvoiceDetailView(LoginRequiredMixin, TemplateView):
     def get_mongodb_invoice(self, booking_id):
         """Get invoice data from MongoDB"""
         try:
-            client = pymongo.MongoClient(settings.DATABASES['default']['CLIENT']['host'])
-            db = client[settings.DATABASES['default']['NAME']]
+            db = get_db()
 
             # Get booking from MongoDB
             booking_doc = db['services_booking'].find_one({'_id': ObjectId(booking_id)})
@@ -117,6 +113,11 @@ class InvoiceDetailView(LoginRequiredMixin, TemplateView):
 
             # Get or create invoice from MongoDB
             invoice_doc = db['services_invoice'].find_one({'booking_id': ObjectId(booking_id)})
+            invoice_ready = pdf_is_current(invoice_doc, booking_doc)
+            if not invoice_ready and booking_doc.get('is_paid'):
+                # Not generated yet, still running or rendered for another
+                # provider: make sure a job is queued
+                enqueue_invoice(booking_id, db=db)
             if not invoice_doc:
                 # Create a basic invoice document for display
                 from datetime import datetime
@@ -130,39 +131,18 @@ class InvoiceDetailView(LoginRequiredMixin, TemplateView):
                 }
                 print(f"Created temporary invoice doc for booking {booking_id}")
 
-            # Get service and provider info
-            service_doc = db['services_service'].find_one({'_id': booking_doc.get('service_id')})
-            provider_doc = db['auth_user'].find_one({'_id': booking_doc.get('provider_id')})
-
-            # If service or provider not found in database, extract from notes
-            service_name = "Unknown Service"
-            provider_name = "Unknown Provider"
-
-            if service_doc:
-                service_name = service_doc.get('name', 'Unknown Service')
-            elif booking_doc.get('notes'):
-                # Extract service name from notes
-                notes = booking_doc.get('notes', '')
-                if 'Booking for' in notes:
-                    parts = notes.split(' - ')
-                    if len(parts) >= 1:
-                        service_name = parts[0].replace('Booking for ', '').strip()
+            # Service as booked; the provider from the users table when assigned
+            provider_doc = db['auth_user'].find_one({'_id': booking_doc.get('provider_id')}) if booking_doc.get('provider_id') else None
+            service_name = booking_service_name(booking_doc, default='Unknown Service')
+            provider_name = booking_provider_name(booking_doc, default='Unknown Provider')
 
             if provider_doc:
                 provider_name = f"{provider_doc.get('first_name', '')} {provider_doc.get('last_name', '')}".strip()
                 if not provider_name:
                     provider_name = provider_doc.get('email', 'Unknown Provider')
-            elif booking_doc.get('notes'):
-                # Extract provider name from notes
-                notes = booking_doc.get('notes', '')
-                if 'Provider:' in notes:
-                    parts = notes.split(' - ')
-                    if len(parts) >= 2:
-                        provider_name = parts[1].replace('Provider: ', '').strip()
 
             # Create service and provider data objects for template compatibility
-            if not service_doc:
-                service_doc = {'name': service_name}
+            service_doc = {'name': service_name}
 
             if not provider_doc:
                 provider_doc = {
@@ -194,6 +174,8 @@ class InvoiceDetailView(LoginRequiredMixin, TemplateView):
                 'service_data': service_doc,
                 'provider_data': provider_doc,
                 'booking_id': str(booking_doc['_id']),
+                'qr_code_url': default_storage.url(invoice_doc['qr_code_path']) if invoice_doc.get('qr_code_path') else None,
+                'invoice_ready': invoice_ready,
                 'is_mongodb': True
             }
 
@@ -206,22 +188,11 @@ class InvoiceDetailView(LoginRequiredMixin, TemplateView):
     def generate_qr_code(self, invoice):
         """Generate QR code for invoice"""
         try:
-            # Create QR code data
-            qr_data = f"HomeService Invoice: {invoice.invoice_number}\nBooking ID: {invoice.booking.id}\nAmount: ₹{invoice.total_amount}\nCustomer: {invoice.booking.customer.email}"
-            
-            # Generate QR code
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-            qr_buffer = BytesIO()
-            qr_img.save(qr_buffer, format='PNG')
-            qr_buffer.seek(0)
-            
+            qr_data = qr_payload(invoice.invoice_number, invoice.booking.id, invoice.total_amount, invoice.booking.customer.email)
+
             # Save QR code to invoice
             qr_filename = f"qr_code_{invoice.invoice_number}.png"
-            invoice.qr_code.save(qr_filename, ContentFile(qr_buffer.read()), save=True)
+            invoice.qr_code.save(qr_filename, ContentFile(render_qr_png(qr_data)), save=True)
             
         except Exception as e:
             print(f"Error generating QR code: {e}")
@@ -229,264 +200,131 @@ class InvoiceDetailView(LoginRequiredMixin, TemplateView):
 
 class InvoiceDownloadView(LoginRequiredMixin, View):
     """Download invoice PDF"""
-    
+
     def get(self, request, booking_id):
         try:
-            # Try MongoDB first
-            pdf_content = self.generate_mongodb_invoice_pdf(booking_id)
-            if pdf_content:
-                response = HttpResponse(pdf_content, content_type='application/pdf')
-                response['Content-Disposition'] = f'attachment; filename="invoice_{booking_id}.pdf"'
-                return response
-            
+            # MongoDB bookings: serve the PDF rendered by the job workers
+            mongodb_response = self.mongodb_invoice_response(booking_id)
+            if mongodb_response is not None:
+                return mongodb_response
+
             # Fallback to Django ORM
             booking = get_object_or_404(Booking, id=booking_id, customer=request.user)
-            
+
             # Check if booking is approved and paid
             if booking.status != 'confirmed' or not booking.is_paid:
                 messages.error(request, 'Invoice download is only available for approved and paid bookings.')
                 return redirect('services:booking_detail', pk=booking_id)
-            
+
             # Get invoice
             invoice = get_object_or_404(Invoice, booking=booking)
-            
+
             # Generate PDF
             pdf_content = self.generate_pdf(invoice)
-            
+
             response = HttpResponse(pdf_content, content_type='application/pdf')
             response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.invoice_number}.pdf"'
             return response
-            
+
         except Exception as e:
             messages.error(request, f'Error downloading invoice: {str(e)}')
             return redirect('services:booking_list')
-    
-    def generate_mongodb_invoice_pdf(self, booking_id):
-        """Generate PDF for MongoDB invoice"""
-        try:
-            client = pymongo.MongoClient(settings.DATABASES['default']['CLIENT']['host'])
-            db = client[settings.DATABASES['default']['NAME']]
-
-            # Get booking and invoice
-            booking_doc = db['services_booking'].find_one({'_id': ObjectId(booking_id)})
-            if not booking_doc or booking_doc.get('customer_id') != self.request.user.id:
-                return None
-
-            invoice_doc = db['services_invoice'].find_one({'booking_id': ObjectId(booking_id)})
-            if not invoice_doc:
-                # Create temporary invoice for PDF
-                from datetime import datetime
-                invoice_doc = {
-                    'booking_id': ObjectId(booking_id),
-                    'invoice_number': f'INV-{booking_id[:8].upper()}',
-                    'generated_at': datetime.now(),
-                    'subtotal': float(booking_doc.get('total_amount', 0)),
-                    'tax_amount': float(booking_doc.get('total_amount', 0)) * 0.18,
-                    'total_amount': float(booking_doc.get('total_amount', 0)) * 1.18
-                }
-
-            # Get additional data with fallback to notes
-            service_doc = db['services_service'].find_one({'_id': booking_doc.get('service_id')})
-            provider_doc = db['auth_user'].find_one({'_id': booking_doc.get('provider_id')})
-            customer_doc = db['auth_user'].find_one({'_id': booking_doc.get('customer_id')})
-
-            # If customer not found in MongoDB, use the current user
-            if not customer_doc:
-                customer_doc = {
-                    'first_name': self.request.user.first_name,
-                    'last_name': self.request.user.last_name,
-                    'email': self.request.user.email
-                }
-
-            # Extract service and provider names from notes if not found in database
-            service_name = "Unknown Service"
-            provider_name = "Unknown Provider"
-
-            if service_doc:
-                service_name = service_doc.get('name', 'Unknown Service')
-            elif booking_doc.get('notes'):
-                notes = booking_doc.get('notes', '')
-                if 'Booking for' in notes:
-                    parts = notes.split(' - ')
-                    if len(parts) >= 1:
-                        service_name = parts[0].replace('Booking for ', '').strip()
 
-            if provider_doc:
-                provider_name = f"{provider_doc.get('first_name', '')} {provider_doc.get('last_name', '')}".strip()
-                if not provider_name:
-                    provider_name = provider_doc.get('email', 'Unknown Provider')
-            elif booking_doc.get('notes'):
-                notes = booking_doc.get('notes', '')
-                if 'Provider:' in notes:
-                    parts = notes.split(' - ')
-                    if len(parts) >= 2:
-                        provider_name = parts[1].replace('Provider: ', '').strip()
+    def mongodb_invoice_response(self, booking_id):
+        """
+        Response for a MongoDB booking, or None if ``booking_id`` is not one of
+        the user's MongoDB bookings. Never renders the PDF in the request: if
+        it is not stored yet a job is queued and the user is sent to the
+        invoice page, which polls ``check_invoice_status``.
+        """
+        try:
+            object_id = ObjectId(booking_id)
+        except Exception:
+            return None
 
-            # Create service and provider objects for PDF
-            if not service_doc:
-                service_doc = {'name': service_name}
+        db = get_db()
+        booking_doc = db['services_booking'].find_one(
+            {'_id': object_id, 'customer_id': self.request.user.id}, {'status': 1, 'is_paid': 1, 'provider_id': 1}
+        )
+        if not booking_doc:
+            return None
 
-            if not provider_doc:
-                provider_doc = {
-                    'first_name': provider_name.split()[0] if provider_name.split() else provider_name,
-                    'last_name': ' '.join(provider_name.split()[1:]) if len(provider_name.split()) > 1 else '',
-                    'email': 'Not available'
-                }
+        if booking_doc.get('status') != 'confirmed' or not booking_doc.get('is_paid'):
+            messages.error(self.request, 'Invoice download is only available for approved and paid bookings.')
+            return redirect('services:booking_detail', pk=booking_id)
 
-            # Generate PDF
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4)
-            story = []
-
-            # Add content to PDF
-            self.add_pdf_content(story, {
-                'booking': booking_doc,
-                'invoice': invoice_doc,
-                'service': service_doc,
-                'provider': provider_doc,
-                'customer': customer_doc,
-                'is_mongodb': True
-            })
+        invoice_doc = db['services_invoice'].find_one(
+            {'booking_id': object_id}, {'invoice_number': 1, 'pdf_path': 1, 'pdf_hash': 1, 'pdf_provider_id': 1}
+        )
+        # A PDF rendered before the booking changed hands names the wrong provider
+        if pdf_is_current(invoice_doc, booking_doc) and default_storage.exists(invoice_doc['pdf_path']):
+            return self.stored_pdf_response(invoice_doc['pdf_path'], invoice_doc)
+
+        enqueue_invoice(booking_id, db=db)
+        messages.info(self.request, 'Your invoice is being prepared. The download will be available in a moment.')
+        return redirect('services:invoice', booking_id=booking_id)
+
+    def stored_pdf_response(self, pdf_path, invoice_doc):
+        """
+        Stream a stored PDF. The content hash is the ETag, so a client that
+        already has this rendering gets a 304 without the file being opened.
+        """
+        etag = f'"{invoice_doc["pdf_hash"]}"' if invoice_doc.get('pdf_hash') else None
+        if etag and etag in self.request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
 
-            doc.build(story)
-            buffer.seek(0)
-            return buffer.read()
+        filename = f'invoice_{invoice_doc["invoice_number"]}.pdf'
+        sendfile_header = getattr(settings, 'INVOICE_SENDFILE_HEADER', None)
+        if sendfile_header == 'X-Accel-Redirect':
+            response = HttpResponse(content_type='application/pdf')
+            response['X-Accel-Redirect'] = settings.INVOICE_ACCEL_REDIRECT_PREFIX + pdf_path
+        elif sendfile_header:
+            response = HttpResponse(content_type='application/pdf')
+            response[sendfile_header] = default_storage.path(pdf_path)
+        else:
+            response = FileResponse(default_storage.open(pdf_path, 'rb'), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'private, no-cache'
+        if etag:
+            response['ETag'] = etag
+        return response
 
-        except Exception as e:
-            print(f"Error generating MongoDB PDF: {e}")
-            return None
-    
     def generate_pdf(self, invoice):
         """Generate PDF for Django ORM invoice"""
         buffer = BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4)
         story = []
-        
+
         # Add content to PDF
-        self.add_pdf_content(story, {
-            'booking': invoice.booking,
-            'invoice': invoice,
-            'service': invoice.booking.service,
-            'provider': invoice.booking.provider,
-            'customer': invoice.booking.customer,
-            'is_mongodb': False
-        })
-        
+        booking = invoice.booking
+        add_pdf_content(
+            story,
+            invoice.invoice_number,
+            invoice.generated_at.strftime('%B %d, %Y'),
+            booking.customer.get_full_name(),
+            booking.customer.email,
+            booking.service.name,
+            booking.provider.get_full_name(),
+            float(invoice.subtotal),
+            float(invoice.tax_amount),
+            float(invoice.total_amount),
+        )
+
         doc.build(story)
         buffer.seek(0)
         return buffer.read()
-    
-    def add_pdf_content(self, story, data):
-        """Add content to PDF"""
-        styles = getSampleStyleSheet()
-        
-        # Header
-        header_style = ParagraphStyle(
-            'CustomHeader',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor('#20c997'),
-            spaceAfter=30,
-            alignment=1  # Center
-        )
-        
-        story.append(Paragraph("HomeService Invoice", header_style))
-        story.append(Spacer(1, 20))
-        
-        # Invoice details
-        if data['is_mongodb']:
-            invoice_number = data['invoice']['invoice_number']
-            generated_date = data['invoice']['generated_at'].strftime('%B %d, %Y')
-            customer_name = f"{data['customer'].get('first_name', '')} {data['customer'].get('last_name', '')}".strip()
-            customer_email = data['customer']['email']
-            service_name = data['service']['name']
-            provider_name = f"{data['provider'].get('first_name', '')} {data['provider'].get('last_name', '')}".strip()
-
-            # Ensure provider name is not empty
-            if not provider_name or provider_name.strip() == '':
-                provider_name = data['provider'].get('email', 'Service Provider')
-
-            subtotal = data['invoice']['subtotal']
-            tax_amount = data['invoice']['tax_amount']
-            total_amount = data['invoice']['total_amount']
-        else:
-            invoice_number = data['invoice'].invoice_number
-            generated_date = data['invoice'].generated_at.strftime('%B %d, %Y')
-            customer_name = data['customer'].get_full_name()
-            customer_email = data['customer'].email
-            service_name = data['service'].name
-            provider_name = data['provider'].get_full_name()
-            subtotal = float(data['invoice'].subtotal)
-            tax_amount = float(data['invoice'].tax_amount)
-            total_amount = float(data['invoice'].total_amount)
-        
-        # Invoice info table
-        invoice_data = [
-            ['Invoice Number:', invoice_number],
-            ['Date:', generated_date],
-            ['Customer:', f"{customer_name} ({customer_email})"],
-            ['Service:', service_name],
-            ['Provider:', provider_name],
-        ]
-        
-        invoice_table = Table(invoice_data, colWidths=[2*inch, 4*inch])
-        invoice_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ]))
-        
-        story.append(invoice_table)
-        story.append(Spacer(1, 30))
-        
-        # Amount breakdown - Use Rs. for better PDF compatibility
-        amount_data = [
-            ['Description', 'Amount'],
-            ['Service Charge', f'Rs. {subtotal:.2f}'],
-            ['GST (18%)', f'Rs. {tax_amount:.2f}'],
-            ['Total Amount', f'Rs. {total_amount:.2f}'],
-        ]
-        
-        amount_table = Table(amount_data, colWidths=[4*inch, 2*inch])
-        amount_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#20c997')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f8f9fa')),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        
-        story.append(amount_table)
-        story.append(Spacer(1, 30))
-        
-        # Footer
-        footer_text = "Thank you for choosing HomeService! Present this invoice and QR code to the service provider."
-        story.append(Paragraph(footer_text, styles['Normal']))
 
 
 @login_required
 def check_invoice_status(request, booking_id):
     """Check if invoice is available for a booking"""
     try:
-        # Check MongoDB first
-        client = pymongo.MongoClient(settings.DATABASES['default']['CLIENT']['host'])
-        db = client[settings.DATABASES['default']['NAME']]
-        
-        booking_doc = db['services_booking'].find_one({'_id': ObjectId(booking_id)})
-        if booking_doc and booking_doc.get('customer_id') == request.user.id:
-            invoice_doc = db['services_invoice'].find_one({'booking_id': ObjectId(booking_id)})
-            if invoice_doc and booking_doc.get('status') == 'confirmed' and booking_doc.get('is_paid'):
-                return JsonResponse({
-                    'has_invoice': True,
-                    'invoice_number': invoice_doc['invoice_number'],
-                    'download_url': f'/services/invoice/{booking_id}/download/',
-                    'view_url': f'/services/invoice/{booking_id}/'
-                })
+        # Check MongoDB first (cached, see services.invoicing.invoice_status)
+        status = invoice_status(booking_id, request.user.id)
+        if status is not None:
+            return JsonResponse(status)
         
         # Check Django ORM
         try:
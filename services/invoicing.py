@@ -0,0 +1,479 @@
+"""
+Invoice documents, QR codes and PDFs for raw MongoDB bookings
+
+Approval creates the invoice documents (:func:`create_invoices`, an approve
+transition hook; see :mod:`services.transitions`); rendering runs inside the
+background job worker (see :mod:`services.jobs`). Payment (a pay transition
+hook) and approval, once the provider is assigned (see
+:func:`services.approvals.assign_providers`), only enqueue an ``invoice``
+job, and the download view serves the PDF the job stored.
+
+PDFs are content addressed: the file name carries a hash of everything
+printed on it and of the booking's provider (``<invoice number>-<hash>.pdf``).
+Re-running the job for unchanged data renders nothing, and the hash doubles
+as the download ETag. The provider a PDF was rendered for is stored with it;
+a PDF whose booking has changed hands since is not served
+(:func:`pdf_is_current`) but rendered again.
+
+The status the invoice page polls (:func:`invoice_status`) is cached through
+:mod:`services.cache`; booking transitions and the job storing the PDF drop
+the cached status of their booking.
+"""
+import hashlib
+import json
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .cache import CacheNamespace
+from .jobs import enqueue, enqueue_many, job_status, register
+from .mongo import get_db
+from .repositories import booking_provider_name, booking_service_name, resolve_users, to_object_id
+from .transitions import on_transition
+
+INVOICE_JOB = 'invoice'
+INVOICE_STORAGE_DIR = 'invoices'
+TAX_RATE = Decimal('0.18')  # 18% GST
+
+# Seconds an invoice status is cached; statuses a running job can still
+# change are kept at most PENDING_STATUS_MAX_AGE
+DEFAULT_STATUS_MAX_AGE = 300
+PENDING_STATUS_MAX_AGE = 5
+# Statuses only the invoice job or a provider change can change. Not
+# 'unavailable': paying or approving the booking ends it
+SETTLED_STATUSES = ('ready',)
+
+INVOICE_BOOKING_FIELDS = {
+    'customer_id': 1, 'provider_id': 1, 'total_amount': 1, 'notes': 1, 'service_snapshot': 1,
+    'status': 1, 'is_paid': 1, 'invoice_id': 1,
+}
+
+
+def invoice_job_key(booking_id):
+    return f'{INVOICE_JOB}:{booking_id}'
+
+
+invoice_status_cache = CacheNamespace('invoice_status', 'INVOICE_STATUS_MAX_AGE', DEFAULT_STATUS_MAX_AGE)
+
+
+def load_invoice_status(booking_id, customer_id, db=None):
+    """
+    What the invoice page polls for: ``{'has_invoice', 'status', ...}`` of
+    ``customer_id``'s booking, or None if they have no such raw booking
+    """
+    db = db if db is not None else get_db()
+    booking_doc = db['services_booking'].find_one(
+        {'_id': booking_id, 'customer_id': customer_id}, {'status': 1, 'is_paid': 1, 'provider_id': 1},
+    )
+    if booking_doc is None:
+        return None
+    if booking_doc.get('status') != 'confirmed' or not booking_doc.get('is_paid'):
+        return {'has_invoice': False, 'status': 'unavailable'}
+
+    invoice_doc = db['services_invoice'].find_one(
+        {'booking_id': booking_id}, {'invoice_number': 1, 'pdf_path': 1, 'pdf_provider_id': 1},
+    )
+    if pdf_is_current(invoice_doc, booking_doc):
+        return {
+            'has_invoice': True,
+            'status': 'ready',
+            'invoice_number': invoice_doc['invoice_number'],
+            'download_url': f'/services/invoice/{booking_id}/download/',
+            'view_url': f'/services/invoice/{booking_id}/',
+        }
+
+    # Still being generated: report the background job's state
+    job = job_status(invoice_job_key(booking_id), db=db) or {}
+    error = job.get('error')
+    return {
+        'has_invoice': False,
+        'status': job.get('status', 'not_queued'),
+        'attempts': job.get('attempts', 0),
+        # Last line of the worker's traceback
+        'error': error.strip().splitlines()[-1] if error else None,
+        'invoice_number': invoice_doc['invoice_number'] if invoice_doc else None,
+    }
+
+
+def pdf_is_current(invoice_doc, booking_doc):
+    """True if the stored PDF was rendered for the booking's current provider"""
+    return bool(invoice_doc and invoice_doc.get('pdf_path')) and (
+        invoice_doc.get('pdf_provider_id') == booking_doc.get('provider_id')
+    )
+
+
+def invoice_status(booking_id, customer_id, db=None):
+    """Cached :func:`load_invoice_status`; None for an invalid id or a booking they do not own"""
+    object_id = to_object_id(booking_id)
+    if object_id is None:
+        return None
+    # get_or_set does not store a status loaded before an invalidation it raced with
+    return invoice_status_cache.get_or_set(
+        (object_id, customer_id),
+        lambda: load_invoice_status(object_id, customer_id, db=db),
+        timeout=_status_timeout,
+    )
+
+
+def _status_timeout(status):
+    if status is not None and status['status'] in SETTLED_STATUSES:
+        return None
+    return PENDING_STATUS_MAX_AGE
+
+
+def invalidate_invoice_status(*bookings):
+    """Drop the cached status of these ``(booking id, customer id)`` pairs"""
+    invoice_status_cache.delete(*[(to_object_id(booking_id), customer_id) for booking_id, customer_id in bookings])
+
+
+def enqueue_invoice(booking_id, db=None):
+    """Queue invoice, QR and PDF generation for one booking"""
+    return enqueue(INVOICE_JOB, {'booking_id': str(booking_id)}, key=invoice_job_key(booking_id), db=db)
+
+
+def enqueue_invoices(booking_ids, db=None):
+    """Queue invoice generation for many bookings in one write"""
+    return enqueue_many(
+        INVOICE_JOB,
+        [({'booking_id': str(booking_id)}, invoice_job_key(booking_id)) for booking_id in booking_ids],
+        db=db,
+    )
+
+
+def qr_payload(invoice_number, booking_id, total_amount, customer_email):
+    return (
+        f"HomeService Invoice: {invoice_number}\nBooking ID: {booking_id}\n"
+        f"Amount: ₹{total_amount}\nCustomer: {customer_email}"
+    )
+
+
+def render_qr_png(data):
+    """PNG bytes of a QR code for ``data``"""
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def build_invoice_document(booking_id, booking_doc, customer_email):
+    """Invoice document for an approved MongoDB booking"""
+    subtotal = Decimal(str(booking_doc.get('total_amount', 0)))
+    tax_amount = subtotal * TAX_RATE
+    total_amount = subtotal + tax_amount
+
+    date_str = datetime.now().strftime('%Y%m%d')
+    invoice_number = f"INV-{date_str}-{str(uuid.uuid4())[:8].upper()}"
+
+    return {
+        'booking_id': booking_id,
+        'invoice_number': invoice_number,
+        'customer_email': customer_email,
+        'subtotal': float(subtotal),
+        'tax_amount': float(tax_amount),
+        'total_amount': float(total_amount),
+        'tax_rate': float(TAX_RATE),
+        'qr_code_data': qr_payload(invoice_number, booking_id, total_amount, customer_email),
+        'generated_at': datetime.now(),
+        'is_active': True,
+        'status': 'generated'
+    }
+
+
+def _person(user, fallback_name='', fallback_email='Not available'):
+    if user is None:
+        parts = fallback_name.split()
+        return {
+            'first_name': parts[0] if parts else fallback_name,
+            'last_name': ' '.join(parts[1:]),
+            'email': fallback_email,
+        }
+    return {'first_name': user.first_name, 'last_name': user.last_name, 'email': user.email}
+
+
+def invoice_pdf_data(booking_doc, invoice_doc, users=None):
+    """Names and amounts printed on the PDF, with the booked service snapshot as fallback"""
+    if users is None:
+        users = resolve_users([booking_doc.get('customer_id'), booking_doc.get('provider_id')])
+    return {
+        'invoice_number': invoice_doc['invoice_number'],
+        'generated_at': invoice_doc['generated_at'],
+        # Not printed as such, but part of the content hash
+        'provider_id': booking_doc.get('provider_id'),
+        'customer': _person(users.get(booking_doc.get('customer_id')), fallback_email=invoice_doc.get('customer_email', '')),
+        'provider': _person(
+            users.get(booking_doc.get('provider_id')), booking_provider_name(booking_doc, default='Unknown Provider'),
+        ),
+        'service_name': booking_service_name(booking_doc, default='Unknown Service'),
+        'subtotal': float(invoice_doc.get('subtotal', 0)),
+        'tax_amount': float(invoice_doc.get('tax_amount', 0)),
+        'total_amount': float(invoice_doc.get('total_amount', 0)),
+    }
+
+
+def add_pdf_content(story, invoice_number, generated_date, customer_name, customer_email,
+                    service_name, provider_name, subtotal, tax_amount, total_amount):
+    """Add the invoice layout to a reportlab story"""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+
+    # Header
+    header_style = ParagraphStyle(
+        'CustomHeader',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#20c997'),
+        spaceAfter=30,
+        alignment=1  # Center
+    )
+
+    story.append(Paragraph("HomeService Invoice", header_style))
+    story.append(Spacer(1, 20))
+
+    # Invoice info table
+    invoice_data = [
+        ['Invoice Number:', invoice_number],
+        ['Date:', generated_date],
+        ['Customer:', f"{customer_name} ({customer_email})"],
+        ['Service:', service_name],
+        ['Provider:', provider_name],
+    ]
+
+    invoice_table = Table(invoice_data, colWidths=[2*inch, 4*inch])
+    invoice_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ]))
+
+    story.append(invoice_table)
+    story.append(Spacer(1, 30))
+
+    # Amount breakdown - Use Rs. for better PDF compatibility
+    amount_data = [
+        ['Description', 'Amount'],
+        ['Service Charge', f'Rs. {subtotal:.2f}'],
+        ['GST (18%)', f'Rs. {tax_amount:.2f}'],
+        ['Total Amount', f'Rs. {total_amount:.2f}'],
+    ]
+
+    amount_table = Table(amount_data, colWidths=[4*inch, 2*inch])
+    amount_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#20c997')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f8f9fa')),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+
+    story.append(amount_table)
+    story.append(Spacer(1, 30))
+
+    # Footer
+    footer_text = "Thank you for choosing HomeService! Present this invoice and QR code to the service provider."
+    story.append(Paragraph(footer_text, styles['Normal']))
+
+
+def render_invoice_pdf(data):
+    """PDF bytes for the output of :func:`invoice_pdf_data`"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate
+
+    customer_name = f"{data['customer']['first_name']} {data['customer']['last_name']}".strip()
+    provider_name = f"{data['provider']['first_name']} {data['provider']['last_name']}".strip()
+    if not provider_name:
+        provider_name = data['provider'].get('email', 'Service Provider')
+
+    buffer = BytesIO()
+    story = []
+    add_pdf_content(
+        story,
+        data['invoice_number'],
+        data['generated_at'].strftime('%B %d, %Y'),
+        customer_name,
+        data['customer']['email'],
+        data['service_name'],
+        provider_name,
+        data['subtotal'],
+        data['tax_amount'],
+        data['total_amount'],
+    )
+    SimpleDocTemplate(buffer, pagesize=A4).build(story)
+    return buffer.getvalue()
+
+
+def pdf_fingerprint(data):
+    """Hash of the values printed on the PDF, stable across runs"""
+    canonical = json.dumps(data, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def pdf_storage_path(invoice_number, fingerprint):
+    return f'{INVOICE_STORAGE_DIR}/{invoice_number}-{fingerprint[:16]}.pdf'
+
+
+def _store_once(path, render):
+    """Save ``render()`` at ``path`` unless a file is already there"""
+    if default_storage.exists(path):
+        return path, False
+    return default_storage.save(path, ContentFile(render())), True
+
+
+def _invoice_link(invoice_doc, now):
+    """Booking fields pointing at its invoice"""
+    return {
+        'invoice_id': invoice_doc['_id'],
+        'invoice_number': invoice_doc['invoice_number'],
+        'invoice_generated_at': now,
+        'updated_at': now,
+    }
+
+
+def create_invoices(booking_docs, db=None):
+    """
+    Create the missing invoice documents for approved bookings (raw documents
+    with ``_id``, ``customer_id`` and ``total_amount``) with one insert, and
+    link them from their bookings with one ``bulk_write``. Returns the created
+    documents.
+    """
+    booking_docs = [doc for doc in booking_docs if doc.get('_id') is not None and not doc.get('invoice_id')]
+    if not booking_docs:
+        return []
+    db = db if db is not None else get_db()
+    invoices = db['services_invoice']
+    existing = {
+        doc['booking_id']
+        for doc in invoices.find({'booking_id': {'$in': [doc['_id'] for doc in booking_docs]}}, {'booking_id': 1})
+    }
+    booking_docs = [doc for doc in booking_docs if doc['_id'] not in existing]
+    if not booking_docs:
+        return []
+
+    users = resolve_users([doc.get('customer_id') for doc in booking_docs])
+    new_docs = []
+    for doc in booking_docs:
+        customer = users.get(doc.get('customer_id'))
+        new_docs.append(build_invoice_document(doc['_id'], doc, customer.email if customer else 'Unknown'))
+
+    created = new_docs
+    try:
+        invoices.insert_many(new_docs, ordered=False)
+    except BulkWriteError as error:
+        # Invoices created concurrently (unique booking_id index) are left as they are
+        failed = {write_error['index'] for write_error in error.details.get('writeErrors', [])}
+        created = [doc for position, doc in enumerate(new_docs) if position not in failed]
+
+    if created:
+        now = datetime.now()
+        db['services_booking'].bulk_write([
+            UpdateOne({'_id': doc['booking_id']}, {'$set': _invoice_link(doc, now)}) for doc in created
+        ], ordered=False)
+    return created
+
+
+@on_transition('approve', fields=('customer_id', 'total_amount'))
+def create_approved_invoices(event, moved, db):
+    """The invoice document exists from approval on; the servicer dashboard never creates one"""
+    create_invoices([after for _, after in moved], db=db)
+
+
+def queue_ready_invoices(booking_docs, db=None):
+    """QR code and PDF are rendered once a booking is both confirmed and paid"""
+    ready = [doc['_id'] for doc in booking_docs if doc.get('status') == 'confirmed' and doc.get('is_paid')]
+    if ready:
+        enqueue_invoices(ready, db=db)
+    return ready
+
+
+@on_transition('pay', fields=('is_paid',))
+def queue_invoice_jobs(event, moved, db):
+    """Payment of a confirmed booking; approvals queue theirs after provider assignment"""
+    queue_ready_invoices([after for _, after in moved], db=db)
+
+
+@on_transition(fields=('customer_id',))
+def invalidate_transitioned_status(event, moved, db):
+    invalidate_invoice_status(*[(after['_id'], after.get('customer_id')) for _, after in moved])
+
+
+def ensure_invoice_document(booking_id, booking_doc, customer_email, db):
+    """Return the booking's invoice document, creating it if missing"""
+    invoices = db['services_invoice']
+    invoice_doc = invoices.find_one({'booking_id': booking_id})
+    if invoice_doc is not None:
+        return invoice_doc
+
+    invoice_doc = build_invoice_document(booking_id, booking_doc, customer_email)
+    try:
+        invoice_doc['_id'] = invoices.insert_one(invoice_doc).inserted_id
+    except DuplicateKeyError:
+        # Created concurrently (unique booking_id index); use that one
+        return invoices.find_one({'booking_id': booking_id})
+
+    db['services_booking'].update_one({'_id': booking_id}, {'$set': _invoice_link(invoice_doc, datetime.now())})
+    return invoice_doc
+
+
+@register(INVOICE_JOB)
+def generate_invoice_assets(payload, db=None):
+    """
+    Job handler: create the invoice document for a confirmed, paid booking,
+    then render its QR code and PDF into storage.
+    """
+    db = db if db is not None else get_db()
+    booking_id = to_object_id(payload.get('booking_id'))
+    booking_doc = db['services_booking'].find_one({'_id': booking_id}, INVOICE_BOOKING_FIELDS) if booking_id else None
+    if booking_doc is None:
+        return {'skipped': 'booking not found'}
+    if booking_doc.get('status') != 'confirmed' or not booking_doc.get('is_paid'):
+        return {'skipped': 'booking is not confirmed and paid'}
+
+    users = resolve_users([booking_doc.get('customer_id'), booking_doc.get('provider_id')])
+    customer = users.get(booking_doc.get('customer_id'))
+    invoice_doc = ensure_invoice_document(booking_id, booking_doc, customer.email if customer else 'Unknown', db)
+
+    number = invoice_doc['invoice_number']
+    qr_path, _ = _store_once(
+        f'{INVOICE_STORAGE_DIR}/qr_{number}.png', lambda: render_qr_png(invoice_doc['qr_code_data']),
+    )
+
+    data = invoice_pdf_data(booking_doc, invoice_doc, users)
+    fingerprint = pdf_fingerprint(data)
+    previous_path = invoice_doc.get('pdf_path')
+    if invoice_doc.get('pdf_hash') == fingerprint and previous_path and default_storage.exists(previous_path):
+        rendered = False
+        pdf_path = previous_path
+    else:
+        pdf_path, rendered = _store_once(pdf_storage_path(number, fingerprint), lambda: render_invoice_pdf(data))
+
+    db['services_invoice'].update_one({'_id': invoice_doc['_id']}, {'$set': {
+        'qr_code_path': qr_path,
+        'pdf_path': pdf_path,
+        'pdf_hash': fingerprint,
+        'pdf_provider_id': booking_doc.get('provider_id'),
+        'pdf_size': default_storage.size(pdf_path),
+        'assets_generated_at': datetime.now(),
+    }})
+    if previous_path and previous_path != pdf_path and default_storage.exists(previous_path):
+        # Superseded by a rendering of changed invoice data
+        default_storage.delete(previous_path)
+    invalidate_invoice_status((booking_id, booking_doc.get('customer_id')))
+    return {'invoice_number': number, 'pdf_path': pdf_path, 'qr_code_path': qr_path, 'rendered': rendered}
@@ -0,0 +1,206 @@
+"""
+Database-backed background job queue
+
+Jobs live in the ``services_jobs`` collection. Web requests only
+:func:`enqueue` a document; ``manage.py run_jobs`` starts worker processes
+that :func:`claim` one job at a time with ``find_one_and_update``, so a job
+is handed to exactly one worker. A claimed job carries a lease
+(``locked_until``): if a worker dies, the job becomes claimable again when
+the lease runs out. Failures are retried with exponential backoff up to
+``max_attempts``.
+
+A job with a ``key`` exists at most once while queued or running, so
+enqueueing the same work twice (e.g. approval and payment both asking for an
+invoice) runs it once.
+"""
+import importlib
+import os
+import socket
+import traceback
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .mongo import get_db
+
+JOBS_COLLECTION = 'services_jobs'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_LEASE = timedelta(minutes=5)
+RETRY_BASE_DELAY = timedelta(seconds=10)
+
+# Modules whose import registers job handlers
+HANDLER_MODULES = ('services.invoicing',)
+
+_handlers = {}
+
+
+def register(job_type):
+    """Decorator registering ``handler(payload, db=None)`` for ``job_type``"""
+    def decorator(handler):
+        _handlers[job_type] = handler
+        return handler
+    return decorator
+
+
+def load_handlers():
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+    return dict(_handlers)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _new_job(job_type, payload, key, max_attempts, now):
+    return {
+        'type': job_type,
+        'key': key,
+        'payload': payload,
+        'status': QUEUED,
+        'attempts': 0,
+        'max_attempts': max_attempts,
+        'run_after': now,
+        'locked_until': None,
+        'worker': None,
+        'error': None,
+        'result': None,
+        'created_at': now,
+        'updated_at': now,
+        'finished_at': None,
+    }
+
+
+def _requeue(job_type, payload, key, max_attempts, now):
+    """``(filter, update)`` upserting a keyed job unless it is already queued or running"""
+    job = _new_job(job_type, payload, key, max_attempts, now)
+    created_at = job.pop('created_at')
+    return (
+        {'key': key, 'status': {'$nin': list(ACTIVE_STATUSES)}},
+        {'$set': job, '$setOnInsert': {'created_at': created_at}},
+    )
+
+
+def enqueue(job_type, payload, key=None, max_attempts=DEFAULT_MAX_ATTEMPTS, db=None):
+    """
+    Queue a job and return True, or False if a job with the same ``key`` is
+    already queued or running.
+    """
+    collection = (db if db is not None else get_db())[JOBS_COLLECTION]
+    now = datetime.now()
+    if key is None:
+        collection.insert_one(_new_job(job_type, payload, None, max_attempts, now))
+        return True
+    query, update = _requeue(job_type, payload, key, max_attempts, now)
+    try:
+        collection.update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        # The unique key index rejected the upsert: an active job exists
+        return False
+    return True
+
+
+def enqueue_many(job_type, jobs, max_attempts=DEFAULT_MAX_ATTEMPTS, db=None):
+    """Queue ``(payload, key)`` pairs in one ``bulk_write``; returns how many were queued"""
+    if not jobs:
+        return 0
+    now = datetime.now()
+    operations = [
+        UpdateOne(*_requeue(job_type, payload, key, max_attempts, now), upsert=True)
+        for payload, key in jobs
+    ]
+    try:
+        result = (db if db is not None else get_db())[JOBS_COLLECTION].bulk_write(operations, ordered=False)
+    except BulkWriteError as error:
+        # Duplicate keys are jobs that are already active; the rest went through
+        details = error.details
+        return details.get('nUpserted', 0) + details.get('nModified', 0)
+    return result.upserted_count + result.modified_count
+
+
+def claim(worker, job_types=None, lease=DEFAULT_LEASE, db=None):
+    """
+    Atomically take the next runnable job: a queued job that is due, or a
+    running job whose worker's lease has expired.
+    """
+    now = datetime.now()
+    query = {'$or': [
+        {'status': QUEUED, 'run_after': {'$lte': now}},
+        {'status': RUNNING, 'locked_until': {'$lt': now}},
+    ]}
+    if job_types:
+        query['type'] = {'$in': list(job_types)}
+    return (db if db is not None else get_db())[JOBS_COLLECTION].find_one_and_update(
+        query,
+        {'$set': {'status': RUNNING, 'worker': worker, 'locked_until': now + lease, 'updated_at': now},
+         '$inc': {'attempts': 1}},
+        sort=[('run_after', ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def complete(job, result=None, db=None):
+    now = datetime.now()
+    (db if db is not None else get_db())[JOBS_COLLECTION].update_one(
+        {'_id': job['_id'], 'worker': job['worker']},
+        {'$set': {'status': DONE, 'result': result, 'error': None, 'locked_until': None,
+                  'finished_at': now, 'updated_at': now}},
+    )
+
+
+def fail(job, error, retry=True, db=None):
+    """Schedule a retry with exponential backoff, or mark the job failed"""
+    now = datetime.now()
+    if not retry or job['attempts'] >= job.get('max_attempts', DEFAULT_MAX_ATTEMPTS):
+        changes = {'status': FAILED, 'finished_at': now}
+    else:
+        changes = {'status': QUEUED, 'run_after': now + RETRY_BASE_DELAY * 2 ** (job['attempts'] - 1)}
+    changes.update({'error': error, 'locked_until': None, 'updated_at': now})
+    (db if db is not None else get_db())[JOBS_COLLECTION].update_one(
+        {'_id': job['_id'], 'worker': job['worker']}, {'$set': changes},
+    )
+
+
+def run_job(job, handlers, db=None):
+    """Run one claimed job through its handler; returns True on success"""
+    handler = handlers.get(job['type'])
+    if handler is None:
+        fail(job, f"No handler for job type {job['type']!r}", retry=False, db=db)
+        return False
+    try:
+        result = handler(job.get('payload') or {}, db=db)
+    except Exception:
+        fail(job, traceback.format_exc(limit=5), db=db)
+        return False
+    complete(job, result, db=db)
+    return True
+
+
+def run_pending(worker=None, job_types=None, limit=None, db=None):
+    """Claim and run jobs until none are runnable (or ``limit`` ran); returns the count"""
+    db = db if db is not None else get_db()
+    handlers = load_handlers()
+    worker = worker or worker_name()
+    count = 0
+    while limit is None or count < limit:
+        job = claim(worker, job_types, db=db)
+        if job is None:
+            break
+        run_job(job, handlers, db=db)
+        count += 1
+    return count
+
+
+def job_status(key, db=None):
+    """Latest state of the keyed job, or None if it was never queued"""
+    return (db if db is not None else get_db())[JOBS_COLLECTION].find_one(
+        {'key': key}, {'status': 1, 'attempts': 1, 'error': 1, 'result': 1, 'updated_at': 1, 'finished_at': 1},
+    )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from services.invoicing import create_invoices
+from services.mongo import get_db
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Create the missing invoice documents for bookings approved before invoices were created at approval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the bookings without creating invoices')
+
+    def handle(self, *args, **options):
+        db = get_db()
+        query = {'status': {'$in': ['confirmed', 'completed']}, 'invoice_id': {'$exists': False}}
+        cursor = db['services_booking'].find(query, {'customer_id': 1, 'total_amount': 1, 'invoice_id': 1})
+
+        candidates = 0
+        created = 0
+        batch = []
+        for doc in cursor:
+            candidates += 1
+            batch.append(doc)
+            if len(batch) == BATCH_SIZE:
+                if not options['dry_run']:
+                    created += len(create_invoices(batch, db=db))
+                batch = []
+        if batch and not options['dry_run']:
+            created += len(create_invoices(batch, db=db))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{candidates} approved bookings have no linked invoice'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'{candidates} approved bookings had no linked invoice; created {created} invoices'
+            ))
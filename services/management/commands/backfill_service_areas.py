@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from services.mongo import get_db
+from services.provider_jobs import service_area_for
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Derive the service_area key used to offer open jobs to servicers for bookings stored without one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the bookings without writing them')
+
+    def handle(self, *args, **options):
+        collection = get_db()['services_booking']
+        cursor = collection.find(
+            {'service_area': {'$exists': False}}, {'address': 1, 'postal_code': 1, 'city': 1}
+        )
+
+        scanned = 0
+        updated = 0
+        operations = []
+        for doc in cursor:
+            scanned += 1
+            area = service_area_for(doc.get('address', ''), doc.get('postal_code', ''), doc.get('city', ''))
+            if area is None:
+                continue
+            updated += 1
+            operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'service_area': area}}))
+            if len(operations) == BATCH_SIZE:
+                if not options['dry_run']:
+                    collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations and not options['dry_run']:
+            collection.bulk_write(operations, ordered=False)
+
+        verb = 'would update' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{scanned} bookings without a service area; {verb} {updated} (the rest have no postal code or city)'
+        ))
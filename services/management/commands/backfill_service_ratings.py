@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from services.catalog import invalidate_catalog
+from services.models import Service
+from services.mongo import get_db
+from services.ratings import compute_rating_stats, empty_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalised rating sum/count/histogram on every service from stored reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Show the changes without writing them')
+
+    def handle(self, *args, **options):
+        stats = compute_rating_stats(get_db())
+        fields = list(empty_stats())
+
+        changed = 0
+        for service in Service.objects.only('id', 'name', *fields):
+            target = stats.get(service.id, empty_stats())
+            current = {field: getattr(service, field) for field in fields}
+            if current == target:
+                continue
+
+            changed += 1
+            self.stdout.write(
+                f'{service.name} (#{service.id}): '
+                f"{current['rating_count']} -> {target['rating_count']} reviews, "
+                f"sum {current['rating_sum']} -> {target['rating_sum']}"
+            )
+            if not options['dry_run']:
+                Service.objects.filter(pk=service.pk).update(**target)
+
+        if changed and not options['dry_run']:
+            invalidate_catalog()
+
+        verb = 'would update' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(s["rating_count"] for s in stats.values())} reviews across {len(stats)} services; {verb} {changed} services'
+        ))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from services.catalog import get_catalog
+from services.mongo import get_db
+from services.snapshots import SNAPSHOT_FIELD, snapshot_from_notes
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Embed the service snapshot on bookings stored before it existed, recovered from their notes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the bookings without writing them')
+
+    def handle(self, *args, **options):
+        collection = get_db()['services_booking']
+        catalog = get_catalog()
+        cursor = collection.find({SNAPSHOT_FIELD: {'$exists': False}}, {'notes': 1})
+
+        # Bookings of the same service share their notes; parse each text once
+        snapshots = {}
+        scanned = 0
+        updated = 0
+        operations = []
+        for doc in cursor:
+            scanned += 1
+            notes = doc.get('notes') or ''
+            if notes not in snapshots:
+                snapshots[notes] = snapshot_from_notes(notes, catalog)
+            snapshot = snapshots[notes]
+            if snapshot is None:
+                continue
+            updated += 1
+            operations.append(UpdateOne(
+                {'_id': doc['_id'], SNAPSHOT_FIELD: {'$exists': False}}, {'$set': {SNAPSHOT_FIELD: snapshot}},
+            ))
+            if len(operations) == BATCH_SIZE:
+                if not options['dry_run']:
+                    collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations and not options['dry_run']:
+            collection.bulk_write(operations, ordered=False)
+
+        matched = sum(1 for snapshot in snapshots.values() if snapshot and snapshot['id'] is not None)
+        verb = 'would update' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{scanned} bookings without a service snapshot; {verb} {updated} '
+            f'({len(snapshots)} distinct notes, {matched} matched to a catalog service id; '
+            f'the rest have no "Booking for" notes)'
+        ))
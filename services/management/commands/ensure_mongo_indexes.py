@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from services.indexes import INDEXES, IndexResult, ensure_indexes, index_usage, verify_indexes
+from services.mongo import get_db
+from services.transitions import TRANSITION_LOG_COLLECTION, ensure_transition_log
+
+
+class Command(BaseCommand):
+    help = 'Create and verify the MongoDB indexes used by the raw booking/invoice queries (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be created without changing anything')
+        parser.add_argument('--verify', action='store_true',
+                            help='Only check that the declared indexes exist; exit non-zero if not')
+        parser.add_argument('--replace', action='store_true',
+                            help='Drop and rebuild indexes whose keys match but whose options differ')
+        parser.add_argument('--stats', action='store_true',
+                            help='Also report per-index usage from $indexStats')
+
+    def handle(self, *args, **options):
+        db = get_db()
+
+        if options['verify']:
+            results = verify_indexes(db)
+        else:
+            # Indexing a missing collection would create it uncapped
+            if not options['dry_run'] and ensure_transition_log(db):
+                self.stdout.write(self.style.SUCCESS(f'Created capped collection {TRANSITION_LOG_COLLECTION}'))
+            results = ensure_indexes(db, dry_run=options['dry_run'], replace=options['replace'])
+
+        styles = {
+            IndexResult.CREATED: self.style.SUCCESS,
+            IndexResult.EXISTS: self.style.SUCCESS,
+            IndexResult.MISSING: self.style.WARNING,
+            IndexResult.CONFLICT: self.style.ERROR,
+            IndexResult.FAILED: self.style.ERROR,
+        }
+        for result in results:
+            spec = result.spec
+            line = f'{spec.collection}.{spec.name}: {result.status}'
+            if result.detail:
+                line += f' ({result.detail})'
+            self.stdout.write(styles[result.status](line))
+
+        if options['stats']:
+            self.write_usage(db)
+
+        failed = [result for result in results if not result.ok]
+        if failed and not options['dry_run']:
+            raise CommandError(f'{len(failed)} of {len(INDEXES)} indexes are not in place')
+        self.stdout.write(f'{len(results) - len(failed)} of {len(INDEXES)} indexes in place')
+
+    def write_usage(self, db):
+        declared = {(spec.collection, spec.name) for spec in INDEXES}
+        self.stdout.write('\nIndex usage ($indexStats, since last restart):')
+        for collection, rows in index_usage(db).items():
+            self.stdout.write(f'  {collection}')
+            for name, ops, since in rows:
+                line = f'    {name}: {ops} ops since {since:%Y-%m-%d %H:%M}'
+                if ops == 0 and name != '_id_':
+                    line += ' - unused'
+                    if (collection, name) not in declared:
+                        line += ', not declared in services.indexes'
+                    self.stdout.write(self.style.WARNING(line))
+                else:
+                    self.stdout.write(line)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from services.mongo import get_db
+from services.slots import REBUILD_DAYS, SLOTS_COLLECTION, rebuild
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Recompute every provider\'s free-slot masks from ProviderSchedule minus active bookings; '
+            'days written in the last minute are left for the next run')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=REBUILD_DAYS,
+                            help=f'Days ahead to compute, starting today (default {REBUILD_DAYS})')
+        parser.add_argument('--provider', type=int, action='append', dest='provider_ids', default=None,
+                            help='Only rebuild this provider id (repeatable)')
+
+    def handle(self, *args, **options):
+        provider_ids = options['provider_ids'] or list(
+            User.objects.filter(user_type='provider').values_list('id', flat=True)
+        )
+        db = get_db()
+        written = rebuild(provider_ids, days=max(1, options['days']), db=db, overwrite=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {written} provider days for {len(provider_ids)} providers in {SLOTS_COLLECTION}'
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from services.models import Service
+from services.mongo import get_db
+from services.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard counters from the bookings collection and report (or fix) drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Correct the stored counters instead of only reporting drift')
+
+    def handle(self, *args, **options):
+        drift = reconcile(Service.objects.count(), db=get_db(), apply=options['fix'])
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Dashboard counters match the bookings collection'))
+            return
+
+        for counter_id in sorted(drift):
+            self.stdout.write(f'{counter_id}:')
+            for field, (stored, expected) in sorted(drift[counter_id].items()):
+                self.stdout.write(self.style.WARNING(f'  {field}: stored {stored}, expected {expected}'))
+
+        fields = sum(len(differences) for differences in drift.values())
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Corrected {fields} drifted values in {len(drift)} counters'))
+        else:
+            self.stdout.write(f'{fields} drifted values in {len(drift)} counters; run with --fix to correct')
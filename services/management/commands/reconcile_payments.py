@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from services.mongo import get_db
+from services.payments import reconciliation_report, relay_pending
+
+SECTIONS = (
+    ('pending_outbox', 'Payments captured but not yet relayed to the ledger'),
+    ('paid_without_charge', 'Paid bookings without a ledger charge'),
+    ('charge_without_paid', 'Ledger charges on bookings that are not paid'),
+    ('duplicate_charges', 'Bookings charged more than once'),
+    ('amount_mismatch', 'Charged total differs from booking total plus tax'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Report disagreements between bookings, payments and the payment ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Relay payments left in booking outboxes before reporting')
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Booking ids listed per section (default 100)')
+
+    def handle(self, *args, **options):
+        db = get_db()
+        if options['fix']:
+            relayed = relay_pending(db=db)
+            self.stdout.write(self.style.SUCCESS(f'Relayed {relayed} outbox payments'))
+
+        report = reconciliation_report(db=db, limit=options['limit'])
+        problems = 0
+        for key, title in SECTIONS:
+            booking_ids = report[key]
+            if not booking_ids:
+                continue
+            problems += len(booking_ids)
+            self.stdout.write(self.style.WARNING(f'{title} ({len(booking_ids)}):'))
+            for booking_id in booking_ids:
+                self.stdout.write(f'  {booking_id}')
+
+        if problems:
+            self.stdout.write(self.style.WARNING(
+                f'{problems} discrepancies across {report["charges"]} charged bookings'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Ledger matches the bookings ({report["charges"]} charged bookings)'
+            ))
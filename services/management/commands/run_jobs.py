@@ -0,0 +1,76 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from services.jobs import run_pending, worker_name
+from services.mongo import close_client
+
+
+def work(job_types, poll_interval, burst, child=False):
+    """Worker loop: drain runnable jobs, then poll"""
+    if child:
+        # Ctrl-C goes to the parent, which terminates the workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    name = worker_name()
+    try:
+        while True:
+            ran = run_pending(worker=name, job_types=job_types)
+            if burst and not ran:
+                return
+            if not ran:
+                time.sleep(poll_interval)
+    finally:
+        close_client()
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers (invoice, QR code and PDF generation)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes (default 1)')
+        parser.add_argument('--type', action='append', dest='job_types', default=None,
+                            help='Only run jobs of this type (repeatable)')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty (default 2)')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty instead of polling')
+
+    def handle(self, *args, **options):
+        job_types = options['job_types']
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+        workers = max(1, options['workers'])
+
+        if workers == 1:
+            self.stdout.write(f'Running jobs in-process{" until the queue is empty" if burst else ""}')
+            try:
+                work(job_types, poll_interval, burst)
+            except KeyboardInterrupt:
+                pass
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        close_client()
+        processes = [
+            multiprocessing.Process(target=work, args=(job_types, poll_interval, burst, True), daemon=True)
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {workers} job workers: {", ".join(str(p.pid) for p in processes)}')
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping workers...')
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS('Job workers stopped'))
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0008_service_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='providerprofile',
+            name='service_areas',
+            field=models.TextField(blank=True, help_text='Comma separated postal codes or cities served'),
+        ),
+    ]
@@ -9,6 +9,7 @@ class ProviderProfile(models.Model):
     company_name = models.CharField(max_length=200, blank=True)
     business_description = models.TextField(blank=True)
     address = models.TextField(blank=True)
+    service_areas = models.TextField(blank=True, help_text='Comma separated postal codes or cities served')
     phone_number = models.CharField(max_length=20, blank=True)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
     total_reviews = models.IntegerField(default=0)
@@ -28,6 +29,10 @@ class ProviderProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Provider Profile"
 
+    def service_area_list(self):
+        from .provider_jobs import normalize_area
+        return [area for area in (normalize_area(part) for part in self.service_areas.split(',')) if area]
+
 # Service Category Model
 class ServiceCategory(models.Model):
     name = models.CharField(max_length=200, unique=True)
@@ -57,6 +62,14 @@ class Service(models.Model):
     image = models.ImageField(upload_to='service_images/', blank=True)
     is_active = models.BooleanField(default=True)
     is_available = models.BooleanField(default=True)
+    # Denormalised review statistics, kept up to date by services.ratings
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -74,14 +87,18 @@ class Service(models.Model):
 
     @property
     def average_rating(self):
-        reviews = Review.objects.filter(booking__service=self)
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
 
     @property
     def review_count(self):
-        return Review.objects.filter(booking__service=self).count()
+        return self.rating_count
+
+    @property
+    def rating_histogram(self):
+        """Number of reviews per star rating, {5: n, 4: n, ..., 1: n}"""
+        return {stars: getattr(self, f'rating_{stars}_count') for stars in range(5, 0, -1)}
 
     @property
     def provider_name(self):
@@ -0,0 +1,57 @@
+"""
+Process-wide pymongo client shared by the raw MongoDB code paths
+"""
+import os
+import threading
+
+import pymongo
+from django.conf import settings
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """Drop the parent's client in a forked worker so it builds its own pool"""
+    global _client, _client_pid, _lock
+    _client = None
+    _client_pid = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client():
+    """Return the MongoClient for this process, creating it on first use"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            options = dict(getattr(settings, 'MONGO_CLIENT_OPTIONS', {}))
+            # connect=False defers the monitor threads until the first operation,
+            # so a client created before a pre-fork server forks is never shared
+            options.setdefault('connect', False)
+            _client = pymongo.MongoClient(settings.DATABASES['default']['CLIENT']['host'], **options)
+            _client_pid = pid
+    return _client
+
+
+def get_db():
+    """Return the project database on the shared client"""
+    return get_client()[settings.DATABASES['default']['NAME']]
+
+
+def close_client():
+    """Close the shared client (used by management commands and tests)"""
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
@@ -0,0 +1,288 @@
+"""
+Payments for raw MongoDB bookings: atomic capture, ledger and reconciliation
+
+The configured deployment is a standalone ``mongod``, where multi-document
+transactions are not available, so payments use an outbox:
+
+1. The ``pay`` transition (see :mod:`services.transitions`), one conditional
+   ``find_one_and_update`` on the booking (it must belong to the customer,
+   be live and not be paid yet), marks it paid and pushes the payment onto
+   the booking's ``payment_outbox`` array. That single-document write
+   is the commit point: a refresh or a concurrent submit cannot pay twice.
+2. :func:`relay_payment` copies the outbox entry into ``services_payment``
+   and the append-only ``services_payment_ledger``, then pulls it from the
+   outbox. Both inserts are keyed by the payment's idempotency key under
+   unique indexes, so replaying a relay never duplicates anything.
+
+If the relay does not finish (process killed, database error), the entry
+stays in the outbox; ``manage.py reconcile_payments --fix`` relays it and
+reports any other disagreement between bookings and the ledger.
+"""
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from .invoicing import TAX_RATE
+from .mongo import get_db
+from .repositories import to_object_id
+from .stats import amount
+from .transitions import TRANSITIONS, apply_transition
+
+PAYMENTS_COLLECTION = 'services_payment'
+LEDGER_COLLECTION = 'services_payment_ledger'
+
+CHARGE = 'charge'
+CURRENCY = 'INR'
+
+# Ledger and booking totals may differ by float rounding
+AMOUNT_TOLERANCE = 0.01
+
+
+class PaymentResult:
+    """Outcome of one payment attempt"""
+    __slots__ = ('booking_id', 'payment', 'created', 'error', 'booking_status')
+
+    def __init__(self, booking_id, payment=None, created=False, error=None, booking_status=None):
+        self.booking_id = booking_id
+        self.payment = payment
+        self.created = created
+        self.error = error
+        self.booking_status = booking_status
+
+    @property
+    def ok(self):
+        return self.payment is not None
+
+    @property
+    def transaction_id(self):
+        return self.payment['transaction_id'] if self.payment else None
+
+    @property
+    def message(self):
+        if self.error == 'not_found':
+            return 'Booking not found.'
+        if self.error == 'already_paid':
+            return 'This booking has already been paid.'
+        if self.error == 'not_payable':
+            return f'A {self.booking_status} booking cannot be paid.'
+        return ''
+
+
+def new_payment_key():
+    return uuid.uuid4().hex
+
+
+def payment_amounts(total_amount):
+    """``(subtotal, tax, total)`` charged for a booking amount"""
+    subtotal = Decimal(str(amount(total_amount)))
+    tax_amount = subtotal * TAX_RATE
+    return subtotal, tax_amount, subtotal + tax_amount
+
+
+def find_payment(idempotency_key=None, booking_id=None, db=None):
+    """A stored payment by its idempotency key, or the latest one for a booking"""
+    payments = (db if db is not None else get_db())[PAYMENTS_COLLECTION]
+    if idempotency_key is not None:
+        return payments.find_one({'idempotency_key': idempotency_key})
+    return payments.find_one({'booking_id': str(booking_id)}, sort=[('created_at', -1)])
+
+
+def _outbox_payment(booking, customer, payment_method, idempotency_key, now):
+    subtotal, tax_amount, total_amount = payment_amounts(booking.get('total_amount'))
+    return {
+        '_id': ObjectId(),
+        'idempotency_key': idempotency_key,
+        'booking_id': str(booking['_id']),
+        'customer_id': customer.id,
+        'payment_method': payment_method,
+        'subtotal': float(subtotal),
+        'tax_amount': float(tax_amount),
+        'amount': float(total_amount),
+        'currency': CURRENCY,
+        'payment_status': 'completed',
+        'transaction_id': f"TXN-{uuid.uuid4().hex[:12].upper()}",
+        'paid_at': now,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+def ledger_entry(payment):
+    """Append-only ledger line for a captured payment"""
+    return {
+        'entry_type': CHARGE,
+        'idempotency_key': payment['idempotency_key'],
+        'payment_id': payment['_id'],
+        'booking_id': ObjectId(payment['booking_id']),
+        'customer_id': payment['customer_id'],
+        'transaction_id': payment['transaction_id'],
+        'payment_method': payment['payment_method'],
+        'amount': payment['amount'],
+        'currency': payment['currency'],
+        'created_at': payment['created_at'],
+    }
+
+
+def _insert_once(collection, doc):
+    try:
+        collection.insert_one(doc)
+    except DuplicateKeyError:
+        # Relayed before; the existing record is the same payment
+        pass
+
+
+def relay_payment(booking_id, payment, db=None):
+    """Copy an outbox payment into the payments collection and ledger, then clear it"""
+    db = db if db is not None else get_db()
+    _insert_once(db[PAYMENTS_COLLECTION], dict(payment))
+    _insert_once(db[LEDGER_COLLECTION], ledger_entry(payment))
+    db['services_booking'].update_one({'_id': booking_id}, {'$pull': {'payment_outbox': {'_id': payment['_id']}}})
+
+
+def relay_pending(db=None):
+    """Relay every payment left in a booking outbox; returns how many were relayed"""
+    db = db if db is not None else get_db()
+    relayed = 0
+    for booking in db['services_booking'].find({'payment_outbox.0': {'$exists': True}}, {'payment_outbox': 1}):
+        for payment in booking['payment_outbox']:
+            relay_payment(booking['_id'], payment, db=db)
+            relayed += 1
+    return relayed
+
+
+def process_payment(booking_id, customer, payment_method, idempotency_key=None, db=None):
+    """
+    Capture the payment of ``customer``'s booking once per idempotency key
+    (one per booking when no key is given) and return a :class:`PaymentResult`.
+    The payment succeeds once the ``pay`` transition commits, even if the
+    relay to the payments collection and ledger then fails.
+    """
+    object_id = to_object_id(booking_id)
+    if object_id is None:
+        return PaymentResult(booking_id, error='not_found')
+    db = db if db is not None else get_db()
+    key = idempotency_key or f'booking:{object_id}'
+
+    existing = find_payment(idempotency_key=key, db=db)
+    if existing is not None:
+        return PaymentResult(booking_id, payment=existing)
+
+    booking = db['services_booking'].find_one(
+        {'_id': object_id, 'customer_id': customer.id},
+        {'total_amount': 1, 'is_paid': 1, 'status': 1, 'payment_outbox': 1},
+    )
+    if booking is None:
+        return PaymentResult(booking_id, error='not_found')
+    if booking.get('is_paid'):
+        return _already_paid(booking, key, db)
+    if booking.get('status') not in TRANSITIONS['pay'].sources:
+        return PaymentResult(booking_id, error='not_payable', booking_status=booking.get('status'))
+
+    now = datetime.now()
+    payment = _outbox_payment(booking, customer, payment_method, key, now)
+    result = apply_transition(
+        object_id, 'pay',
+        {
+            'payment_status': 'paid',
+            'is_paid': True,
+            'payment_method': payment_method,
+            'transaction_id': payment['transaction_id'],
+            'paid_at': now,
+            'updated_at': now,
+        },
+        guard={'customer_id': customer.id, 'is_paid': {'$ne': True}},
+        push={'payment_outbox': payment},
+        actor_id=customer.id,
+        db=db,
+    )
+    if result.error == 'wrong_state':
+        return PaymentResult(booking_id, error='not_payable', booking_status=result.current_status)
+    if not result.ok:
+        # Paid by a concurrent request between the read and the write
+        current = db['services_booking'].find_one({'_id': object_id}, {'status': 1, 'payment_outbox': 1})
+        return _already_paid(current or booking, key, db)
+
+    try:
+        relay_payment(object_id, payment, db=db)
+    except Exception as e:
+        # Captured all the same; the entry stays in the outbox for reconcile_payments --fix
+        print(f"Error relaying payment {payment['idempotency_key']}: {e}")
+    return PaymentResult(booking_id, payment=payment, created=True, booking_status=result.before.get('status'))
+
+
+def _already_paid(booking, key, db):
+    """The payment that already settled ``booking``: same key, still in the outbox, or stored"""
+    for payment in booking.get('payment_outbox') or []:
+        if payment.get('idempotency_key') == key:
+            return PaymentResult(str(booking['_id']), payment=payment, booking_status=booking.get('status'))
+    payment = find_payment(idempotency_key=key, db=db)
+    if payment is not None:
+        return PaymentResult(str(booking['_id']), payment=payment, booking_status=booking.get('status'))
+    return PaymentResult(
+        str(booking['_id']), payment=find_payment(booking_id=booking['_id'], db=db),
+        error='already_paid', booking_status=booking.get('status'),
+    )
+
+
+def reconciliation_report(db=None, limit=100):
+    """
+    Disagreements between bookings and the ledger, each list capped at
+    ``limit`` booking ids:
+
+    - ``pending_outbox``: payments captured but not yet relayed
+    - ``paid_without_charge``: paid bookings with no ledger charge
+    - ``charge_without_paid``: ledger charges on bookings that are not paid
+    - ``duplicate_charges``: bookings charged more than once
+    - ``amount_mismatch``: charged total differs from the booking total plus tax
+    """
+    db = db if db is not None else get_db()
+    bookings = db['services_booking']
+    ledger = db[LEDGER_COLLECTION]
+    tax_multiplier = float(1 + TAX_RATE)
+
+    pending_outbox = [str(doc['_id']) for doc in bookings.find(
+        {'payment_outbox.0': {'$exists': True}}, {'_id': 1}
+    ).limit(limit)]
+
+    paid_without_charge = [str(doc['_id']) for doc in bookings.aggregate([
+        {'$match': {'is_paid': True}},
+        {'$lookup': {'from': LEDGER_COLLECTION, 'localField': '_id', 'foreignField': 'booking_id', 'as': 'charges'}},
+        {'$match': {'charges': {'$size': 0}, 'payment_outbox.0': {'$exists': False}}},
+        {'$project': {'_id': 1}},
+        {'$limit': limit},
+    ])]
+
+    charges = list(ledger.aggregate([
+        {'$match': {'entry_type': CHARGE}},
+        {'$group': {'_id': '$booking_id', 'count': {'$sum': 1}, 'charged': {'$sum': '$amount'}}},
+        {'$lookup': {'from': 'services_booking', 'localField': '_id', 'foreignField': '_id', 'as': 'booking'}},
+        {'$project': {
+            'count': 1, 'charged': 1,
+            'is_paid': {'$arrayElemAt': ['$booking.is_paid', 0]},
+            'total_amount': {'$arrayElemAt': ['$booking.total_amount', 0]},
+        }},
+    ]))
+    charge_without_paid = []
+    duplicate_charges = []
+    amount_mismatch = []
+    for row in charges:
+        booking_id = str(row['_id'])
+        if not row.get('is_paid'):
+            charge_without_paid.append(booking_id)
+        if row['count'] > 1:
+            duplicate_charges.append(booking_id)
+        expected = amount(row.get('total_amount')) * tax_multiplier
+        if abs(row['charged'] - expected) > AMOUNT_TOLERANCE:
+            amount_mismatch.append(booking_id)
+
+    return {
+        'pending_outbox': pending_outbox,
+        'paid_without_charge': paid_without_charge,
+        'charge_without_paid': charge_without_paid[:limit],
+        'duplicate_charges': duplicate_charges[:limit],
+        'amount_mismatch': amount_mismatch[:limit],
+        'charges': len(charges),
+    }
@@ -0,0 +1,254 @@
+"""
+Bookings assigned to a service provider, for the servicer dashboard
+
+A page of the provider's confirmed bookings is one aggregation: ``$match`` on
+the provider's assignments, sort and slice, then ``$lookup`` the invoice and
+the customer so no per-booking reads follow. Reading the page never writes;
+invoice documents are created when a booking is approved (see
+:func:`services.invoicing.create_invoices`).
+
+:class:`ProviderFeed` offers the open jobs a provider may take: confirmed
+bookings that approval left unassigned (see :mod:`services.assignment`), in
+the provider's service areas and inside their available schedule windows.
+:func:`claim_job` gives one of them to the provider with a conditional write,
+after taking its blocks of their slot mask.
+"""
+import re
+from datetime import datetime
+
+from bson.decimal128 import Decimal128
+
+from users.models import User
+
+from .models import ProviderProfile, ProviderSchedule
+from .mongo import get_db
+from .repositories import BOOKING_COLLECTION, booking_service_name, to_object_id
+from .slots import SLOT_PROJECTION, booking_minutes, release, reserve
+
+JOB_FIELDS = (
+    'booking_date', 'address', 'phone_number', 'total_amount', 'status', 'notes', 'service_snapshot',
+    'special_instructions', 'customer_id', 'provider_id', 'invoice_number', 'updated_at',
+)
+
+# Open jobs listed on the servicer dashboard
+OPEN_JOBS_LIMIT = 20
+
+# ProviderSchedule.day -> $dayOfWeek (1 is Sunday)
+DAY_NUMBERS = {
+    'sunday': 1, 'monday': 2, 'tuesday': 3, 'wednesday': 4,
+    'thursday': 5, 'friday': 6, 'saturday': 7,
+}
+
+_POSTAL_CODE = re.compile(r'\b\d{6}\b')
+
+_MINUTE_OF_DAY = {'$add': [{'$multiply': [{'$hour': '$booking_date'}, 60]}, {'$minute': '$booking_date'}]}
+
+
+def normalize_area(value):
+    return ' '.join(str(value or '').split()).lower()
+
+
+def service_area_for(address='', postal_code='', city=''):
+    """Service area key stored on a booking: its postal code, else its city"""
+    if postal_code:
+        return normalize_area(postal_code)
+    match = _POSTAL_CODE.search(address or '')
+    if match:
+        return match.group(0)
+    return normalize_area(city) or None
+
+
+def provider_filter(provider_id, status='confirmed'):
+    return {'provider_id': provider_id, 'status': status}
+
+
+def schedule_windows(schedules):
+    """``$expr`` clauses matching a booking_date inside each schedule window"""
+    windows = []
+    for schedule in schedules:
+        day = DAY_NUMBERS.get(schedule.day)
+        if day is None:
+            continue
+        windows.append({'$and': [
+            {'$eq': [{'$dayOfWeek': '$booking_date'}, day]},
+            {'$gte': [_MINUTE_OF_DAY, schedule.start_time.hour * 60 + schedule.start_time.minute]},
+            {'$lt': [_MINUTE_OF_DAY, schedule.end_time.hour * 60 + schedule.end_time.minute]},
+        ]})
+    return windows
+
+
+def provider_jobs_pipeline(query, skip=0, limit=None, sort=None):
+    pipeline = [
+        {'$match': query},
+        {'$sort': sort or {'booking_date': -1, '_id': -1}},
+    ]
+    if skip:
+        pipeline.append({'$skip': skip})
+    if limit is not None:
+        pipeline.append({'$limit': limit})
+    pipeline += [
+        {'$project': {field: 1 for field in JOB_FIELDS}},
+        {'$lookup': {
+            'from': 'services_invoice',
+            'localField': '_id',
+            'foreignField': 'booking_id',
+            'as': 'invoice',
+        }},
+        {'$lookup': {
+            'from': User._meta.db_table,
+            'let': {'customer_id': '$customer_id'},
+            'pipeline': [
+                {'$match': {'$expr': {'$eq': ['$id', '$$customer_id']}}},
+                {'$project': {'_id': 0, 'first_name': 1, 'last_name': 1, 'email': 1}},
+            ],
+            'as': 'customer',
+        }},
+        {'$addFields': {
+            'invoice': {'$arrayElemAt': ['$invoice.invoice_number', 0]},
+            'customer': {'$arrayElemAt': ['$customer', 0]},
+        }},
+    ]
+    return pipeline
+
+
+def job_row(doc):
+    """Template row for one aggregated booking"""
+    customer = doc.get('customer') or {}
+    total_amount = doc.get('total_amount', 0)
+    if isinstance(total_amount, Decimal128):
+        total_amount = float(total_amount.to_decimal())
+    customer_name = f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip()
+    return {
+        'booking_id': str(doc['_id']),
+        'invoice_number': doc.get('invoice') or doc.get('invoice_number'),
+        'customer_name': customer_name or 'Customer',
+        'customer_email': customer.get('email', ''),
+        'customer_phone': doc.get('phone_number', ''),
+        'service_name': booking_service_name(doc, default='Service'),
+        'booking_date': doc.get('booking_date'),
+        'address': doc.get('address', ''),
+        'total_amount': total_amount,
+        'status': doc.get('status', 'confirmed'),
+        'special_instructions': doc.get('special_instructions', ''),
+        'assigned': doc.get('provider_id') is not None,
+    }
+
+
+class ProviderJobsQuery:
+    """Lazy, sliceable view of a provider's bookings so Django's Paginator can page it.
+
+    ``count()`` is one ``count_documents`` and each slice is one aggregation.
+    """
+
+    def __init__(self, provider_id, status='confirmed', db=None):
+        self.collection = (db if db is not None else get_db())[BOOKING_COLLECTION]
+        self.query = provider_filter(provider_id, status)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.collection.count_documents(self.query)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            rows = self[index:index + 1]
+            if not rows:
+                raise IndexError(index)
+            return rows[0]
+        start = index.start or 0
+        limit = None
+        if index.stop is not None:
+            if index.stop <= start:
+                return []
+            limit = index.stop - start
+        return [job_row(doc) for doc in self.collection.aggregate(provider_jobs_pipeline(self.query, start, limit))]
+
+
+def completed_count(provider_id, db=None):
+    return (db if db is not None else get_db())[BOOKING_COLLECTION].count_documents(
+        provider_filter(provider_id, 'completed')
+    )
+
+
+class ProviderFeed:
+    """Open jobs a provider may take"""
+
+    def __init__(self, provider, db=None):
+        self.provider = provider
+        self.collection = (db if db is not None else get_db())[BOOKING_COLLECTION]
+
+    def eligibility_filter(self):
+        """
+        Unassigned confirmed bookings the provider can take, or None: their
+        profile must be available and list service areas, and when they keep
+        a schedule the booking must fall inside an available window.
+        """
+        profile = ProviderProfile.objects.filter(user=self.provider).only('service_areas', 'is_available').first()
+        if profile is None or not profile.is_available:
+            return None
+        areas = profile.service_area_list()
+        if not areas:
+            return None
+
+        query = {'status': 'confirmed', 'provider_id': None, 'service_area': {'$in': areas}}
+        schedules = list(ProviderSchedule.objects.filter(provider=self.provider).only('day', 'start_time', 'end_time', 'is_available'))
+        if schedules:
+            windows = schedule_windows([schedule for schedule in schedules if schedule.is_available])
+            if not windows:
+                return None
+            query['$expr'] = {'$or': windows}
+        return query
+
+    def open_jobs(self, limit=OPEN_JOBS_LIMIT):
+        """Up to ``limit`` open jobs, soonest first, as template rows"""
+        query = self.eligibility_filter()
+        if query is None:
+            return []
+        return [
+            job_row(doc)
+            for doc in self.collection.aggregate(provider_jobs_pipeline(
+                query, limit=limit, sort={'booking_date': 1, '_id': 1},
+            ))
+        ]
+
+
+def claim_job(booking_id, provider, db=None):
+    """
+    Give the open job ``booking_id`` to ``provider`` if it is still open and
+    eligible for them and their slot is free. Returns ``(ok, message)``.
+    """
+    object_id = to_object_id(booking_id)
+    if object_id is None:
+        return False, 'Invalid booking id.'
+    db = db if db is not None else get_db()
+    feed = ProviderFeed(provider, db=db)
+    query = feed.eligibility_filter()
+    if query is None:
+        return False, 'Your profile does not take open jobs. Check your availability and service areas.'
+    query['_id'] = object_id
+
+    doc = feed.collection.find_one(query, dict(SLOT_PROJECTION, customer_id=1, is_paid=1))
+    if doc is None:
+        return False, 'This job is no longer open.'
+    if isinstance(doc.get('booking_date'), datetime):
+        if not reserve(provider.id, doc['booking_date'], booking_minutes(doc), db=db):
+            return False, 'You already have a job at that time.'
+
+    now = datetime.now()
+    result = feed.collection.update_one(query, {'$set': {'provider_id': provider.id, 'assigned_at': now, 'updated_at': now}})
+    if result.modified_count != 1:
+        # Taken by someone else meanwhile: give the blocks back
+        release(dict(doc, provider_id=provider.id), db=db)
+        return False, 'This job is no longer open.'
+
+    from .invoicing import queue_ready_invoices
+    from .summaries import invalidate_user_summary
+
+    invalidate_user_summary(doc.get('customer_id'))
+    # The invoice PDF names the provider, so it is rendered once they are known
+    queue_ready_invoices([dict(doc, provider_id=provider.id)], db=db)
+    return True, 'The job is yours.'
@@ -0,0 +1,141 @@
+"""
+Denormalised per-service rating statistics
+
+``Service.rating_sum``, ``rating_count`` and ``rating_<n>_count`` are
+adjusted with single ``UPDATE ... SET x = x + n`` statements when a review is
+added, changed or deleted, so reading a service's rating never touches the
+review table. ``manage.py backfill_service_ratings`` rebuilds them from the
+reviews already stored.
+
+The updates bypass ``post_save``, so they invalidate the cached catalog
+(which shows the ratings) themselves.
+"""
+from bson import ObjectId
+from django.db.models import F
+
+from .catalog import invalidate_catalog
+from .models import Booking, Service
+from .mongo import get_db
+from .repositories import booking_service_name
+
+STARS = range(1, 6)
+
+
+def star_field(rating):
+    return f'rating_{rating}_count'
+
+
+def _valid(rating):
+    try:
+        rating = int(rating)
+    except (TypeError, ValueError):
+        return None
+    return rating if rating in STARS else None
+
+
+def apply_rating_change(service_id, added=None, removed=None):
+    """
+    Add and/or remove one rating on a service in a single atomic update.
+
+    Passing both moves a review from one star bucket to another.
+    """
+    added, removed = _valid(added), _valid(removed)
+    if service_id is None or (added is None and removed is None) or added == removed:
+        return 0
+
+    updates = {}
+    delta_sum = (added or 0) - (removed or 0)
+    delta_count = (added is not None) - (removed is not None)
+    if delta_sum:
+        updates['rating_sum'] = F('rating_sum') + delta_sum
+    if delta_count:
+        updates['rating_count'] = F('rating_count') + delta_count
+    if added is not None:
+        updates[star_field(added)] = F(star_field(added)) + 1
+    if removed is not None:
+        updates[star_field(removed)] = F(star_field(removed)) - 1
+    updated = Service.objects.filter(pk=service_id).update(**updates)
+    if updated:
+        invalidate_catalog()
+    return updated
+
+
+def service_id_for_name(name):
+    """Id of the first service with this name, or None"""
+    if not name:
+        return None
+    return Service.objects.filter(name=name).values_list('id', flat=True).first()
+
+
+def _stored_service_id(booking_doc):
+    """Service id written on a raw booking or its snapshot, or None"""
+    if isinstance(booking_doc.get('service_id'), int):
+        return booking_doc['service_id']
+    snapshot_id = (booking_doc.get('service_snapshot') or {}).get('id')
+    return snapshot_id if isinstance(snapshot_id, int) else None
+
+
+def service_id_for_booking_doc(booking_doc):
+    """Service of a raw booking document; older documents only name it in their notes"""
+    service_id = _stored_service_id(booking_doc)
+    if service_id is not None:
+        return service_id
+    return service_id_for_name(booking_service_name(booking_doc, default=None))
+
+
+def service_id_for_booking(booking_id):
+    """Resolve the service of an ORM (int id) or raw MongoDB (ObjectId) booking"""
+    if isinstance(booking_id, ObjectId):
+        booking_doc = get_db()['services_booking'].find_one(
+            {'_id': booking_id}, {'service_id': 1, 'service_snapshot': 1, 'notes': 1},
+        )
+        return service_id_for_booking_doc(booking_doc) if booking_doc else None
+    return Booking.objects.filter(pk=booking_id).values_list('service_id', flat=True).first()
+
+
+def compute_rating_stats(db):
+    """
+    Recompute ``{service_id: {field: value}}`` from every stored review.
+
+    Reads the review and booking collections directly so reviews written by
+    the ORM (integer ``booking_id``) and by the raw MongoDB views (ObjectId
+    ``booking_id``) are both counted.
+    """
+    reviews = list(db['services_review'].find({}, {'booking_id': 1, 'rating': 1}))
+    int_ids = {r['booking_id'] for r in reviews if isinstance(r.get('booking_id'), int)}
+    object_ids = {r['booking_id'] for r in reviews if isinstance(r.get('booking_id'), ObjectId)}
+
+    service_by_booking = {}
+    if int_ids:
+        for doc in db['services_booking'].find({'id': {'$in': list(int_ids)}}, {'id': 1, 'service_id': 1}):
+            service_by_booking[doc['id']] = doc.get('service_id')
+    if object_ids:
+        service_ids_by_name = {}
+        for service_id, name in Service.objects.order_by('-id').values_list('id', 'name'):
+            service_ids_by_name[name] = service_id
+        docs = db['services_booking'].find(
+            {'_id': {'$in': list(object_ids)}}, {'service_id': 1, 'service_snapshot': 1, 'notes': 1},
+        )
+        for doc in docs:
+            service_id = _stored_service_id(doc)
+            if service_id is None:
+                service_id = service_ids_by_name.get(booking_service_name(doc, default=None))
+            service_by_booking[doc['_id']] = service_id
+
+    stats = {}
+    for review in reviews:
+        service_id = service_by_booking.get(review.get('booking_id'))
+        rating = _valid(review.get('rating'))
+        if service_id is None or rating is None:
+            continue
+        entry = stats.setdefault(service_id, empty_stats())
+        entry['rating_sum'] += rating
+        entry['rating_count'] += 1
+        entry[star_field(rating)] += 1
+    return stats
+
+
+def empty_stats():
+    stats = {'rating_sum': 0, 'rating_count': 0}
+    stats.update({star_field(stars): 0 for stars in STARS})
+    return stats
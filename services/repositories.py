@@ -0,0 +1,492 @@
+"""
+Read-side repository for the raw ``services_booking`` collection.
+
+Bookings are written with pymongo outside the ORM (``customer_id`` /
+``provider_id`` keys, float amounts), so the views read them back through
+this module instead of building their own ad-hoc booking classes.
+"""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from users.models import User
+
+from .models import Booking
+from .mongo import get_db
+
+BOOKING_COLLECTION = 'services_booking'
+
+STATUS_DISPLAY = dict(Booking.STATUS_CHOICES, in_progress='In Progress')
+PAYMENT_STATUS_DISPLAY = dict(Booking.PAYMENT_STATUS_CHOICES)
+PAYMENT_METHOD_DISPLAY = {
+    'card': 'Credit/Debit Card',
+    'upi': 'UPI',
+    'netbanking': 'Net Banking',
+    'wallet': 'Digital Wallet',
+}
+COUNTRY_DISPLAY = {
+    'IN': 'India',
+    'US': 'United States',
+    'UK': 'United Kingdom',
+}
+
+# Record attribute -> (document key, default when missing or not projected)
+BOOKING_FIELDS = {
+    'customer_id': ('customer_id', None),
+    'provider_id': ('provider_id', None),
+    'service_id': ('service_id', None),
+    'booking_date': ('booking_date', None),
+    'address': ('address', ''),
+    'phone_number': ('phone_number', ''),
+    'total_amount': ('total_amount', 0),
+    'notes': ('notes', ''),
+    'service_snapshot': ('service_snapshot', None),
+    'special_instructions': ('special_instructions', ''),
+    'status': ('status', 'pending'),
+    'payment_status': ('payment_status', 'pending'),
+    'is_paid': ('is_paid', False),
+    'payment_method': ('payment_method', ''),
+    'transaction_id': ('transaction_id', ''),
+    'created_at': ('created_at', None),
+    'updated_at': ('updated_at', None),
+    'admin_notes': ('admin_notes', ''),
+    'approved_at': ('approved_at', None),
+    'approved_by_id': ('approved_by_id', None),
+    'rejected_by_id': ('rejected_by_id', None),
+    'rejection_reason': ('rejection_reason', ''),
+    'rejected_at': ('rejected_at', None),
+    'confirmed_at': ('confirmed_at', None),
+    'started_at': ('started_at', None),
+    'completed_at': ('completed_at', None),
+    'paid_at': ('paid_at', None),
+    'cancellation_reason': ('cancellation_reason', ''),
+    'cancellation_policy': ('cancellation_policy', ''),
+    'additional_charges': ('additional_charges', 0),
+    'discount_amount': ('discount_amount', 0),
+    'address_line1': ('address', ''),
+    'address_line2': ('address_line2', ''),
+    'city': ('city', ''),
+    'state': ('state', ''),
+    'postal_code': ('postal_code', ''),
+    'country': ('country', 'IN'),
+}
+
+# Field sets used by the individual pages; anything not listed keeps its default
+LIST_FIELDS = (
+    'customer_id', 'provider_id', 'booking_date', 'address', 'phone_number',
+    'total_amount', 'notes', 'service_snapshot', 'special_instructions', 'status', 'payment_status',
+    'is_paid', 'admin_notes', 'rejection_reason', 'rejected_at',
+    'cancellation_reason', 'created_at', 'updated_at',
+)
+DETAIL_FIELDS = tuple(BOOKING_FIELDS)
+PAYMENT_FIELDS = (
+    'customer_id', 'provider_id', 'booking_date', 'address', 'phone_number',
+    'total_amount', 'notes', 'service_snapshot', 'special_instructions', 'status', 'payment_status',
+    'is_paid', 'payment_method', 'transaction_id',
+)
+RESCHEDULE_FIELDS = (
+    'customer_id', 'provider_id', 'service_id', 'booking_date', 'address',
+    'phone_number', 'total_amount', 'notes', 'service_snapshot', 'special_instructions', 'status',
+    'admin_notes', 'rejection_reason', 'rejected_at',
+)
+SUMMARY_FIELDS = (
+    'customer_id', 'booking_date', 'total_amount', 'notes', 'service_snapshot', 'status', 'created_at',
+)
+ADMIN_FIELDS = LIST_FIELDS + ('approved_at', 'approved_by_id', 'rejected_by_id')
+
+
+def to_object_id(value):
+    """Return ``value`` as an ObjectId, or None if it is not a valid one"""
+    if isinstance(value, ObjectId):
+        return value
+    try:
+        return ObjectId(str(value))
+    except (InvalidId, TypeError):
+        return None
+
+
+def encode_cursor(doc, field='created_at'):
+    """Opaque keyset cursor for the (``field``, _id) position of ``doc``"""
+    created_at = doc.get(field)
+    if created_at is None:
+        return f"n_{doc['_id']}"
+    delta = created_at.replace(tzinfo=None) - datetime(1970, 1, 1)
+    millis = delta.days * 86400000 + delta.seconds * 1000 + delta.microseconds // 1000
+    return f"{millis}_{doc['_id']}"
+
+
+def decode_cursor(cursor):
+    """Return the (timestamp, _id) pair encoded by :func:`encode_cursor`"""
+    try:
+        millis, raw_id = str(cursor).split('_', 1)
+        object_id = to_object_id(raw_id)
+        if object_id is None:
+            return None
+        if millis == 'n':
+            return None, object_id
+        return datetime(1970, 1, 1) + timedelta(milliseconds=int(millis)), object_id
+    except ValueError:
+        return None
+
+
+def keyset_filter(cursor):
+    """Filter selecting documents strictly after ``cursor`` in newest-first order"""
+    position = decode_cursor(cursor) if cursor else None
+    if position is None:
+        return {}
+    created_at, object_id = position
+    if created_at is None:
+        # Documents without a timestamp sort last; page through them by _id only
+        return {'created_at': None, '_id': {'$lt': object_id}}
+    return {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': None},
+        {'created_at': created_at, '_id': {'$lt': object_id}},
+    ]}
+
+
+def parse_service_name(notes, default='Home Service'):
+    """Extract the service name from "Booking for X - Provider: Y" notes"""
+    if notes and ' - Provider: ' in notes:
+        service_part = notes.split(' - Provider: ')[0]
+        if service_part.startswith('Booking for '):
+            return service_part.replace('Booking for ', '')
+        return service_part
+    return default
+
+
+def parse_provider_name(notes, default='Service Provider'):
+    """Extract the provider name from "Booking for X - Provider: Y" notes"""
+    if notes and ' - Provider: ' in notes:
+        return notes.split(' - Provider: ', 1)[1].strip() or default
+    return default
+
+
+def booking_service_name(doc, default='Home Service'):
+    """Service name of a raw booking: its snapshot, or the notes of documents written before it"""
+    snapshot = doc.get('service_snapshot') or {}
+    return snapshot.get('name') or parse_service_name(doc.get('notes'), default=default)
+
+
+def booking_provider_name(doc, default='Service Provider'):
+    """Provider name as booked: its snapshot, or the notes of documents written before it"""
+    snapshot = doc.get('service_snapshot') or {}
+    return snapshot.get('provider') or parse_provider_name(doc.get('notes'), default=default)
+
+
+def projection_for(fields):
+    """Mongo projection covering the document keys behind ``fields``"""
+    projection = {BOOKING_FIELDS[name][0]: 1 for name in fields}
+    projection['_id'] = 1
+    return projection
+
+
+def resolve_users(user_ids):
+    """Fetch the given users with a single ``id__in`` query, keyed by id"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    return User.objects.in_bulk(list(user_ids))
+
+
+class UserIdentityMap:
+    """Per-request map of users already loaded, keyed by id.
+
+    Pages collect the customer/provider ids of the documents they fetched
+    and call :meth:`load` once; ids seen before are never queried again.
+    """
+
+    def __init__(self, users=(), missing=()):
+        self._users = {user.id: user for user in users}
+        self._missing = set(missing)
+
+    @classmethod
+    def for_request(cls, request):
+        """Return the identity map attached to ``request``, creating it once"""
+        identity_map = getattr(request, '_user_identity_map', None)
+        if identity_map is None:
+            user = getattr(request, 'user', None)
+            identity_map = cls([user] if user is not None and user.is_authenticated else [])
+            request._user_identity_map = identity_map
+        return identity_map
+
+    def load(self, user_ids):
+        """Resolve ``user_ids`` with at most one query and return them by id"""
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        unknown = user_ids - self._users.keys() - self._missing
+        if unknown:
+            found = resolve_users(unknown)
+            self._users.update(found)
+            self._missing.update(unknown - found.keys())
+        return {user_id: self._users[user_id] for user_id in user_ids if user_id in self._users}
+
+    def get(self, user_id):
+        return self._users.get(user_id)
+
+
+class BookingCategory:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class BookingService:
+    """Service details shown next to a raw booking"""
+    __slots__ = ('id', 'name', 'provider', 'price', 'duration', 'description',
+                 'category', 'image', 'service_area')
+
+    def __init__(self, name, provider=None, price=1800, duration=2,
+                 description=None, category='Home Services', service_id=None):
+        self.id = service_id
+        self.name = name
+        self.provider = provider
+        self.price = price
+        self.duration = duration
+        self.description = description or f"Professional {name.lower()} service"
+        self.category = BookingCategory(category)
+        self.image = None
+        self.service_area = 'Local Area'
+
+
+class BookingRecord:
+    """Read-only view of a ``services_booking`` document"""
+    __slots__ = ('id', 'customer', 'provider', 'service', 'review',
+                 'approved_by', 'rejected_by') + tuple(BOOKING_FIELDS)
+
+    def __init__(self, doc, customer=None, provider=None, service=None, approved_by=None, rejected_by=None):
+        setter = object.__setattr__
+        setter(self, 'id', str(doc['_id']))
+        for name, (key, default) in BOOKING_FIELDS.items():
+            setter(self, name, doc.get(key, default))
+        setter(self, 'customer', customer)
+        setter(self, 'provider', provider)
+        setter(self, 'service', service)
+        setter(self, 'review', None)
+        setter(self, 'approved_by', approved_by)
+        setter(self, 'rejected_by', rejected_by)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __repr__(self):
+        return f"<BookingRecord {self.id} {self.status}>"
+
+    @property
+    def service_name(self):
+        if self.service:
+            return self.service.name
+        return booking_service_name({'service_snapshot': self.service_snapshot, 'notes': self.notes})
+
+    def get(self, key, default=None):
+        """Allow templates written for raw documents to use ``get``"""
+        return getattr(self, key, default)
+
+    def get_status_display(self):
+        return STATUS_DISPLAY.get(self.status, self.status.title())
+
+    def get_payment_status_display(self):
+        return PAYMENT_STATUS_DISPLAY.get(self.payment_status, self.payment_status.title())
+
+    def get_payment_method_display(self):
+        return PAYMENT_METHOD_DISPLAY.get(self.payment_method, self.payment_method.title())
+
+    def get_country_display(self):
+        return COUNTRY_DISPLAY.get(self.country, self.country)
+
+
+class BookingPage:
+    """One keyset page of booking records"""
+    __slots__ = ('records', 'next_cursor', 'cursor')
+
+    def __init__(self, records, next_cursor=None, cursor=None):
+        self.records = records
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __bool__(self):
+        return bool(self.records)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor is not None
+
+
+class BookingQuery:
+    """Lazy, sliceable booking query so Django's Paginator can page it.
+
+    ``count()`` is a single ``count_documents`` and each slice is one
+    ``find().skip().limit()``, so only the requested page is loaded.
+    """
+
+    def __init__(self, repository, query, fields, sort=(('created_at', -1), ('_id', -1))):
+        self.repository = repository
+        self.query = query
+        self.fields = fields
+        self.sort = list(sort)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.repository.collection.count_documents(self.query)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            records = self[index:index + 1]
+            if not records:
+                raise IndexError(index)
+            return records[0]
+        start = index.start or 0
+        cursor = self.repository.collection.find(self.query, projection_for(self.fields)).sort(self.sort).skip(start)
+        if index.stop is not None:
+            if index.stop <= start:
+                return []
+            cursor = cursor.limit(index.stop - start)
+        return self.repository.build_records(cursor)
+
+
+class BookingRepository:
+    """Queries against ``services_booking`` returning :class:`BookingRecord` objects"""
+
+    def __init__(self, db=None, users=None):
+        self.db = db if db is not None else get_db()
+        self.collection = self.db[BOOKING_COLLECTION]
+        self.users = users if users is not None else UserIdentityMap()
+
+    @classmethod
+    def for_request(cls, request):
+        """Repository sharing the request's user identity map"""
+        return cls(users=UserIdentityMap.for_request(request))
+
+    def get(self, booking_id, fields=DETAIL_FIELDS, with_service=True):
+        """Return the booking with ``booking_id`` (an ObjectId or its string), or None"""
+        object_id = to_object_id(booking_id)
+        if object_id is None:
+            return None
+        doc = self.collection.find_one({'_id': object_id}, projection_for(fields))
+        if not doc:
+            return None
+        return self.build_records([doc], with_service=with_service)[0]
+
+    def query(self, query, fields=ADMIN_FIELDS):
+        """Newest-first :class:`BookingQuery` over every customer's bookings"""
+        return BookingQuery(self, query, fields)
+
+    def get_for_customer(self, booking_id, customer, fields=DETAIL_FIELDS, with_service=True):
+        """Return the customer's booking with ``booking_id``, or None"""
+        object_id = to_object_id(booking_id)
+        if object_id is None:
+            return None
+        doc = self.collection.find_one(
+            {'_id': object_id, 'customer_id': customer.id},
+            projection_for(fields),
+        )
+        if not doc:
+            return None
+        return self.build_records([doc], customer=customer, with_service=with_service)[0]
+
+    def list_for_customer(self, customer, fields=LIST_FIELDS, with_service=True):
+        """Return all of the customer's bookings, newest first"""
+        docs = self.collection.find(
+            {'customer_id': customer.id},
+            projection_for(fields),
+        ).sort('created_at', -1)
+        return self.build_records(docs, customer=customer, with_service=with_service)
+
+    def pages_for_customer(self, customer, tabs, limit=10, fields=LIST_FIELDS, with_service=True):
+        """Return one newest-first keyset page per tab.
+
+        ``tabs`` maps a tab name to ``(statuses, cursor)``. Each tab is a
+        bounded ``(customer_id, status, created_at)`` index range scan, and the
+        providers of every page are resolved together in one query.
+        """
+        projection = projection_for(fields)
+        tab_docs = {}
+        for name, (statuses, cursor) in tabs.items():
+            query = {'customer_id': customer.id, 'status': {'$in': list(statuses)}}
+            query.update(keyset_filter(cursor))
+            docs = list(
+                self.collection.find(query, projection)
+                .sort([('created_at', -1), ('_id', -1)])
+                .limit(limit + 1)
+            )
+            tab_docs[name] = (docs, cursor)
+
+        unique_docs = {}
+        for docs, _ in tab_docs.values():
+            for doc in docs[:limit]:
+                unique_docs.setdefault(doc['_id'], doc)
+        records = dict(zip(
+            unique_docs,
+            self.build_records(unique_docs.values(), customer=customer, with_service=with_service),
+        ))
+
+        pages = {}
+        for name, (docs, cursor) in tab_docs.items():
+            next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+            pages[name] = BookingPage([records[doc['_id']] for doc in docs[:limit]], next_cursor, cursor)
+        return pages
+
+    def status_counts_for_customer(self, customer):
+        """Booking counts per status for the customer in a single aggregation"""
+        pipeline = [
+            {'$match': {'customer_id': customer.id}},
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}}},
+        ]
+        return {row['_id']: row['count'] for row in self.collection.aggregate(pipeline)}
+
+    def recent(self, limit=5, fields=SUMMARY_FIELDS, with_service=True):
+        """Return the most recently created bookings across all customers"""
+        docs = self.collection.find({}, projection_for(fields)).sort('created_at', -1).limit(limit)
+        return self.build_records(docs, with_service=with_service)
+
+    def build_records(self, docs, customer=None, with_service=True):
+        """Wrap documents in records, resolving related users in one query"""
+        docs = list(docs)
+        user_ids = set()
+        for doc in docs:
+            user_ids.add(doc.get('provider_id'))
+            user_ids.add(doc.get('approved_by_id'))
+            user_ids.add(doc.get('rejected_by_id'))
+            if customer is None:
+                user_ids.add(doc.get('customer_id'))
+        users = self.users.load(user_ids)
+
+        records = []
+        for doc in docs:
+            provider = users.get(doc.get('provider_id'))
+            service = None
+            if with_service:
+                snapshot = doc.get('service_snapshot') or {}
+                service = BookingService(
+                    booking_service_name(doc), provider=provider, service_id=snapshot.get('id'),
+                    duration=snapshot.get('duration') or 2,
+                    category=snapshot.get('category_name') or 'Home Services',
+                )
+            records.append(BookingRecord(
+                doc,
+                customer=customer if customer is not None else users.get(doc.get('customer_id')),
+                provider=provider,
+                service=service,
+                approved_by=users.get(doc.get('approved_by_id')),
+                rejected_by=users.get(doc.get('rejected_by_id')),
+            ))
+        return records
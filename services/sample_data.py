@@ -0,0 +1,583 @@
+"""
+Built-in sample catalog
+
+Used by :mod:`services.catalog` when the database has no active services
+(fresh installs and development), so the public pages always have content.
+"""
+
+SAMPLE_CATEGORIES = [
+    {'name': 'Electrical', 'slug': 'electrical', 'description': 'Professional electrical services for your home'},
+    {'name': 'Plumbing', 'slug': 'plumbing', 'description': 'Professional plumbing services for your home'},
+    {'name': 'Cleaning', 'slug': 'cleaning', 'description': 'Home cleaning and maintenance services'},
+    {'name': 'Carpentry', 'slug': 'carpentry', 'description': 'Wood work and furniture repair services'},
+    {'name': 'Painting', 'slug': 'painting', 'description': 'Interior and exterior painting services'},
+    {'name': 'Appliance Repair', 'slug': 'appliance-repair', 'description': 'Repair services for home appliances'},
+    {'name': 'HVAC', 'slug': 'hvac', 'description': 'Heating, ventilation, and air conditioning services'},
+    {'name': 'Landscaping', 'slug': 'landscaping', 'description': 'Garden and outdoor maintenance services'},
+    {'name': 'Security', 'slug': 'security', 'description': 'Home security system installation and maintenance'},
+    {'name': 'Pest Control', 'slug': 'pest-control', 'description': 'Professional pest control and extermination services'},
+    {'name': 'Handyman', 'slug': 'handyman', 'description': 'General handyman services for various home repairs'},
+    {'name': 'Moving & Packing', 'slug': 'moving-packing', 'description': 'Professional moving and packing services'},
+]
+
+SAMPLE_SERVICES = [
+    # Electrical Services
+    {
+        'id': 1,
+        'name': 'Electrical Installation',
+        'description': 'Professional installation of electrical systems in your home or office. Includes wiring, outlets, switches, and circuit breakers.',
+        'price': 2500,
+        'duration': 3,
+        'average_rating': 4.5,
+        'review_count': 12,
+        'category_name': 'Electrical',
+        'category_slug': 'electrical',
+        'provider': {'user': {'get_full_name': 'Rajesh Kumar', 'email': 'rajesh@example.com'}},
+        'image': None
+    },
+    {
+        'id': 2,
+        'name': 'Lighting Repair',
+        'description': 'Fix broken lights, install new lighting fixtures, and upgrade to energy-efficient LED lighting.',
+        'price': 1500,
+        'duration': 2,
+        'average_rating': 4.8,
+        'review_count': 8,
+        'category_name': 'Electrical',
+        'category_slug': 'electrical',
+        'provider': {'user': {'get_full_name': 'Amit Sharma', 'email': 'amit@example.com'}},
+        'image': None
+    },
+    {
+        'id': 3,
+        'name': 'Circuit Breaker Repair',
+        'description': 'Professional repair and replacement of circuit breakers. Safety checks included.',
+        'price': 2000,
+        'duration': 2,
+        'average_rating': 4.7,
+        'review_count': 15,
+        'category_name': 'Electrical',
+        'category_slug': 'electrical',
+        'provider': {'user': {'get_full_name': 'Priya Singh', 'email': 'priya@example.com'}},
+        'image': None
+    },
+    # Plumbing Services
+    {
+        'id': 4,
+        'name': 'Pipe Repair',
+        'description': 'Professional repair of leaking or damaged pipes. Includes copper, PVC, and PEX pipe repairs.',
+        'price': 1200,
+        'duration': 2,
+        'average_rating': 4.6,
+        'review_count': 10,
+        'category_name': 'Plumbing',
+        'category_slug': 'plumbing',
+        'provider': {'user': {'get_full_name': 'Suresh Patel', 'email': 'suresh@example.com'}},
+        'image': None
+    },
+    {
+        'id': 5,
+        'name': 'Leak Detection',
+        'description': 'Advanced leak detection services using thermal imaging and acoustic detection.',
+        'price': 1800,
+        'duration': 1,
+        'average_rating': 4.9,
+        'review_count': 14,
+        'category_name': 'Plumbing',
+        'category_slug': 'plumbing',
+        'provider': {'user': {'get_full_name': 'Kavita Reddy', 'email': 'kavita@example.com'}},
+        'image': None
+    },
+    {
+        'id': 6,
+        'name': 'Water Heater Repair',
+        'description': 'Professional repair and maintenance of water heaters. Gas and electric systems.',
+        'price': 2200,
+        'duration': 2,
+        'average_rating': 4.7,
+        'review_count': 18,
+        'category_name': 'Plumbing',
+        'category_slug': 'plumbing',
+        'provider': {'user': {'get_full_name': 'Vikram Gupta', 'email': 'vikram@example.com'}},
+        'image': None
+    },
+    # Cleaning Services
+    {
+        'id': 7,
+        'name': 'Deep Cleaning',
+        'description': 'Comprehensive deep cleaning service for your entire home. Includes all rooms and surfaces.',
+        'price': 3500,
+        'duration': 4,
+        'average_rating': 4.8,
+        'review_count': 22,
+        'category_name': 'Cleaning',
+        'category_slug': 'cleaning',
+        'provider': {'user': {'get_full_name': 'Sunita Joshi', 'email': 'sunita@example.com'}},
+        'image': None
+    },
+    {
+        'id': 8,
+        'name': 'Carpet Cleaning',
+        'description': 'Professional carpet cleaning using advanced steam cleaning technology.',
+        'price': 1800,
+        'duration': 2,
+        'average_rating': 4.6,
+        'review_count': 16,
+        'category_name': 'Cleaning',
+        'category_slug': 'cleaning',
+        'provider': {'user': {'get_full_name': 'Ravi Mehta', 'email': 'ravi@example.com'}},
+        'image': None
+    },
+    {
+        'id': 9,
+        'name': 'Window Cleaning',
+        'description': 'Professional window cleaning for interior and exterior windows.',
+        'price': 1000,
+        'duration': 1,
+        'average_rating': 4.5,
+        'review_count': 9,
+        'category_name': 'Cleaning',
+        'category_slug': 'cleaning',
+        'provider': {'user': {'get_full_name': 'Neha Agarwal', 'email': 'neha@example.com'}},
+        'image': None
+    },
+    # Carpentry Services
+    {
+        'id': 10,
+        'name': 'Furniture Repair',
+        'description': 'Professional furniture repair and restoration services.',
+        'price': 1800,
+        'duration': 3,
+        'average_rating': 4.7,
+        'review_count': 11,
+        'category_name': 'Carpentry',
+        'category_slug': 'carpentry',
+        'provider': {'user': {'get_full_name': 'Manoj Kumar', 'email': 'manoj@example.com'}},
+        'image': None
+    },
+    {
+        'id': 11,
+        'name': 'Cabinet Installation',
+        'description': 'Custom cabinet installation and fitting services.',
+        'price': 4500,
+        'duration': 6,
+        'average_rating': 4.8,
+        'review_count': 8,
+        'category_name': 'Carpentry',
+        'category_slug': 'carpentry',
+        'provider': {'user': {'get_full_name': 'Ramesh Yadav', 'email': 'ramesh@example.com'}},
+        'image': None
+    },
+    # Painting Services
+    {
+        'id': 12,
+        'name': 'Interior Painting',
+        'description': 'Professional interior wall painting with premium quality paints.',
+        'price': 3000,
+        'duration': 5,
+        'average_rating': 4.6,
+        'review_count': 13,
+        'category_name': 'Painting',
+        'category_slug': 'painting',
+        'provider': {'user': {'get_full_name': 'Deepak Singh', 'email': 'deepak@example.com'}},
+        'image': None
+    },
+    {
+        'id': 13,
+        'name': 'Exterior Painting',
+        'description': 'Weather-resistant exterior painting for homes and buildings.',
+        'price': 5500,
+        'duration': 8,
+        'average_rating': 4.7,
+        'review_count': 9,
+        'category_name': 'Painting',
+        'category_slug': 'painting',
+        'provider': {'user': {'get_full_name': 'Kiran Sharma', 'email': 'kiran@example.com'}},
+        'image': None
+    },
+    # Appliance Repair Services
+    {
+        'id': 14,
+        'name': 'AC Repair',
+        'description': 'Professional air conditioning repair and maintenance services.',
+        'price': 2500,
+        'duration': 2,
+        'average_rating': 4.8,
+        'review_count': 19,
+        'category_name': 'Appliance Repair',
+        'category_slug': 'appliance-repair',
+        'provider': {'user': {'get_full_name': 'Rohit Sharma', 'email': 'rohit@example.com'}},
+        'image': None
+    },
+    {
+        'id': 15,
+        'name': 'Washing Machine Repair',
+        'description': 'Expert washing machine repair and maintenance services.',
+        'price': 1800,
+        'duration': 2,
+        'average_rating': 4.5,
+        'review_count': 14,
+        'category_name': 'Appliance Repair',
+        'category_slug': 'appliance-repair',
+        'provider': {'user': {'get_full_name': 'Santosh Kumar', 'email': 'santosh@example.com'}},
+        'image': None
+    },
+    # HVAC Services
+    {
+        'id': 16,
+        'name': 'AC Installation',
+        'description': 'Professional air conditioning installation with warranty.',
+        'price': 8000,
+        'duration': 4,
+        'average_rating': 4.9,
+        'review_count': 7,
+        'category_name': 'HVAC',
+        'category_slug': 'hvac',
+        'provider': {'user': {'get_full_name': 'Ankit Verma', 'email': 'ankit@example.com'}},
+        'image': None
+    },
+    {
+        'id': 17,
+        'name': 'Duct Cleaning',
+        'description': 'Professional air duct cleaning and maintenance services.',
+        'price': 3500,
+        'duration': 3,
+        'average_rating': 4.6,
+        'review_count': 6,
+        'category_name': 'HVAC',
+        'category_slug': 'hvac',
+        'provider': {'user': {'get_full_name': 'Mukesh Patel', 'email': 'mukesh@example.com'}},
+        'image': None
+    },
+    # Landscaping Services
+    {
+        'id': 18,
+        'name': 'Garden Maintenance',
+        'description': 'Complete garden maintenance including pruning, weeding, and fertilizing.',
+        'price': 2000,
+        'duration': 3,
+        'average_rating': 4.5,
+        'review_count': 8,
+        'category_name': 'Landscaping',
+        'category_slug': 'landscaping',
+        'provider': {'user': {'get_full_name': 'Sanjay Patel', 'email': 'sanjay@example.com'}},
+        'image': None
+    },
+    {
+        'id': 19,
+        'name': 'Lawn Mowing',
+        'description': 'Regular lawn mowing and grass cutting services.',
+        'price': 800,
+        'duration': 1,
+        'average_rating': 4.4,
+        'review_count': 12,
+        'category_name': 'Landscaping',
+        'category_slug': 'landscaping',
+        'provider': {'user': {'get_full_name': 'Gopal Singh', 'email': 'gopal@example.com'}},
+        'image': None
+    },
+    # Security Services
+    {
+        'id': 20,
+        'name': 'CCTV Installation',
+        'description': 'Professional CCTV camera installation and setup.',
+        'price': 5500,
+        'duration': 4,
+        'average_rating': 4.7,
+        'review_count': 12,
+        'category_name': 'Security',
+        'category_slug': 'security',
+        'provider': {'user': {'get_full_name': 'Ajay Kumar', 'email': 'ajay@example.com'}},
+        'image': None
+    },
+    {
+        'id': 21,
+        'name': 'Home Security System',
+        'description': 'Complete home security system installation and monitoring.',
+        'price': 12000,
+        'duration': 6,
+        'average_rating': 4.8,
+        'review_count': 5,
+        'category_name': 'Security',
+        'category_slug': 'security',
+        'provider': {'user': {'get_full_name': 'Vinay Gupta', 'email': 'vinay@example.com'}},
+        'image': None
+    },
+    # Pest Control Services
+    {
+        'id': 22,
+        'name': 'General Pest Control',
+        'description': 'Comprehensive pest control treatment for your home.',
+        'price': 2500,
+        'duration': 2,
+        'average_rating': 4.6,
+        'review_count': 15,
+        'category_name': 'Pest Control',
+        'category_slug': 'pest-control',
+        'provider': {'user': {'get_full_name': 'Vinod Gupta', 'email': 'vinod@example.com'}},
+        'image': None
+    },
+    {
+        'id': 23,
+        'name': 'Termite Treatment',
+        'description': 'Professional termite treatment and prevention services.',
+        'price': 4500,
+        'duration': 4,
+        'average_rating': 4.7,
+        'review_count': 8,
+        'category_name': 'Pest Control',
+        'category_slug': 'pest-control',
+        'provider': {'user': {'get_full_name': 'Sunil Yadav', 'email': 'sunil@example.com'}},
+        'image': None
+    },
+    # Handyman Services
+    {
+        'id': 24,
+        'name': 'General Handyman',
+        'description': 'General handyman services for various home repairs and maintenance.',
+        'price': 1500,
+        'duration': 2,
+        'average_rating': 4.5,
+        'review_count': 18,
+        'category_name': 'Handyman',
+        'category_slug': 'handyman',
+        'provider': {'user': {'get_full_name': 'Ravi Mehta', 'email': 'ravi@example.com'}},
+        'image': None
+    },
+    {
+        'id': 25,
+        'name': 'Wall Mount Installation',
+        'description': 'Professional TV and appliance wall mounting services.',
+        'price': 1200,
+        'duration': 1,
+        'average_rating': 4.6,
+        'review_count': 22,
+        'category_name': 'Handyman',
+        'category_slug': 'handyman',
+        'provider': {'user': {'get_full_name': 'Ashok Kumar', 'email': 'ashok@example.com'}},
+        'image': None
+    },
+    # Moving & Packing Services
+    {
+        'id': 26,
+        'name': 'Local Moving',
+        'description': 'Professional local moving and relocation services.',
+        'price': 5000,
+        'duration': 6,
+        'average_rating': 4.4,
+        'review_count': 10,
+        'category_name': 'Moving & Packing',
+        'category_slug': 'moving-packing',
+        'provider': {'user': {'get_full_name': 'Mohan Lal', 'email': 'mohan@example.com'}},
+        'image': None
+    },
+    {
+        'id': 27,
+        'name': 'Packing Services',
+        'description': 'Professional packing services for safe transportation.',
+        'price': 2500,
+        'duration': 4,
+        'average_rating': 4.3,
+        'review_count': 7,
+        'category_name': 'Moving & Packing',
+        'category_slug': 'moving-packing',
+        'provider': {'user': {'get_full_name': 'Prakash Singh', 'email': 'prakash@example.com'}},
+        'image': None
+    }
+]
+
+# Sample reviews keyed by sample service id
+SAMPLE_REVIEWS = {
+    1: [  # Electrical Installation
+        {
+            'user_name': 'Priya Sharma',
+            'rating': 5,
+            'comment': 'Excellent work! Rajesh was very professional and completed the electrical installation perfectly. All outlets and switches are working great. Highly recommended!',
+            'date': '2024-01-15'
+        },
+        {
+            'user_name': 'Amit Patel',
+            'rating': 4,
+            'comment': 'Good service overall. The electrician arrived on time and did quality work. Only minor issue was some cleanup could have been better.',
+            'date': '2024-01-10'
+        },
+        {
+            'user_name': 'Sunita Gupta',
+            'rating': 5,
+            'comment': 'Outstanding service! Very knowledgeable and explained everything clearly. The electrical work was done safely and efficiently.',
+            'date': '2024-01-05'
+        }
+    ],
+    2: [  # Lighting Repair
+        {
+            'user_name': 'Ravi Kumar',
+            'rating': 5,
+            'comment': 'Amit fixed all our lighting issues quickly. Very professional and reasonably priced. Will definitely use again!',
+            'date': '2024-01-12'
+        },
+        {
+            'user_name': 'Meera Singh',
+            'rating': 4,
+            'comment': 'Good work on the lighting repair. The technician was punctual and completed the job efficiently.',
+            'date': '2024-01-08'
+        }
+    ],
+    3: [  # Circuit Breaker Repair
+        {
+            'user_name': 'Vikram Reddy',
+            'rating': 5,
+            'comment': 'Priya did an excellent job fixing our circuit breaker. Very knowledgeable about electrical safety. Highly recommend!',
+            'date': '2024-01-14'
+        },
+        {
+            'user_name': 'Kavita Joshi',
+            'rating': 4,
+            'comment': 'Professional service. The circuit breaker issue was resolved quickly and safely.',
+            'date': '2024-01-09'
+        }
+    ],
+    4: [  # Pipe Repair
+        {
+            'user_name': 'Deepak Agarwal',
+            'rating': 5,
+            'comment': 'Suresh did an amazing job fixing our pipe leak. Very clean work and no mess left behind. Excellent plumber!',
+            'date': '2024-01-13'
+        },
+        {
+            'user_name': 'Anita Sharma',
+            'rating': 4,
+            'comment': 'Good plumbing service. The pipe repair was done properly and the price was fair.',
+            'date': '2024-01-07'
+        },
+        {
+            'user_name': 'Rohit Gupta',
+            'rating': 5,
+            'comment': 'Very satisfied with the pipe repair work. Professional approach and quality materials used.',
+            'date': '2024-01-03'
+        }
+    ],
+    5: [  # Leak Detection
+        {
+            'user_name': 'Sanjay Patel',
+            'rating': 5,
+            'comment': 'Kavita found the hidden leak that other plumbers missed. Used advanced equipment and solved the problem perfectly!',
+            'date': '2024-01-11'
+        },
+        {
+            'user_name': 'Pooja Singh',
+            'rating': 5,
+            'comment': 'Excellent leak detection service. Very thorough and professional. Saved us from major water damage!',
+            'date': '2024-01-06'
+        }
+    ],
+    6: [  # Water Heater Repair
+        {
+            'user_name': 'Manoj Kumar',
+            'rating': 4,
+            'comment': 'Vikram repaired our water heater efficiently. Good service and reasonable pricing.',
+            'date': '2024-01-10'
+        },
+        {
+            'user_name': 'Rekha Jain',
+            'rating': 5,
+            'comment': 'Outstanding water heater repair service. Very knowledgeable technician and quality work.',
+            'date': '2024-01-04'
+        }
+    ],
+    7: [  # Deep Cleaning
+        {
+            'user_name': 'Neha Verma',
+            'rating': 5,
+            'comment': 'Sunita and her team did an incredible deep cleaning job! Our house looks brand new. Very thorough and professional.',
+            'date': '2024-01-12'
+        },
+        {
+            'user_name': 'Ajay Sharma',
+            'rating': 5,
+            'comment': 'Amazing deep cleaning service! Every corner was cleaned perfectly. Highly recommend for anyone needing thorough cleaning.',
+            'date': '2024-01-08'
+        },
+        {
+            'user_name': 'Priyanka Gupta',
+            'rating': 4,
+            'comment': 'Very good cleaning service. The team was professional and did quality work throughout the house.',
+            'date': '2024-01-02'
+        }
+    ],
+    10: [  # Furniture Repair
+        {
+            'user_name': 'Rajesh Agarwal',
+            'rating': 5,
+            'comment': 'Manoj did excellent furniture repair work. My old dining table looks like new! Very skilled craftsman.',
+            'date': '2024-01-14'
+        },
+        {
+            'user_name': 'Sita Devi',
+            'rating': 4,
+            'comment': 'Good furniture repair service. The work was done carefully and the price was reasonable.',
+            'date': '2024-01-09'
+        }
+    ],
+    12: [  # Interior Painting
+        {
+            'user_name': 'Kiran Joshi',
+            'rating': 5,
+            'comment': 'Deepak did amazing interior painting work! The finish is perfect and the colors look beautiful. Highly recommend!',
+            'date': '2024-01-13'
+        },
+        {
+            'user_name': 'Ramesh Kumar',
+            'rating': 4,
+            'comment': 'Professional painting service. Good quality work and clean finish. Satisfied with the results.',
+            'date': '2024-01-07'
+        }
+    ],
+    14: [  # AC Repair
+        {
+            'user_name': 'Sunil Sharma',
+            'rating': 5,
+            'comment': 'Rohit fixed our AC perfectly! Very knowledgeable about air conditioning systems. Quick and efficient service.',
+            'date': '2024-01-11'
+        },
+        {
+            'user_name': 'Geeta Patel',
+            'rating': 5,
+            'comment': 'Excellent AC repair service. The technician was professional and solved the problem quickly. AC is working great now!',
+            'date': '2024-01-06'
+        },
+        {
+            'user_name': 'Ashok Gupta',
+            'rating': 4,
+            'comment': 'Good AC repair work. The service was prompt and the pricing was fair.',
+            'date': '2024-01-01'
+        }
+    ],
+    16: [  # AC Installation
+        {
+            'user_name': 'Mohan Lal',
+            'rating': 5,
+            'comment': 'Ankit did professional AC installation. Very clean work and explained everything about maintenance. Excellent service!',
+            'date': '2024-01-10'
+        },
+        {
+            'user_name': 'Lakshmi Devi',
+            'rating': 4,
+            'comment': 'Good AC installation service. The technician was skilled and completed the work efficiently.',
+            'date': '2024-01-05'
+        }
+    ],
+    20: [  # CCTV Installation
+        {
+            'user_name': 'Vinod Kumar',
+            'rating': 5,
+            'comment': 'Ajay installed our CCTV system perfectly! Very professional setup and explained how to use the system. Great security solution!',
+            'date': '2024-01-12'
+        },
+        {
+            'user_name': 'Radha Sharma',
+            'rating': 4,
+            'comment': 'Professional CCTV installation. Good quality cameras and clean cable management.',
+            'date': '2024-01-08'
+        }
+    ]
+}
@@ -0,0 +1,241 @@
+"""
+In-memory search over the service catalog
+
+An inverted index is built once per catalog load (the snapshot's ``version``)
+over service name, category and description. A search intersects the posting
+lists of the query terms, applies the category/price filters and counts the
+category and price-range facets in the same pass, then ranks by relevance
+(TF-IDF with field weights) or the requested sort.
+"""
+import math
+import re
+import threading
+from bisect import bisect_left
+
+# Field weights: a hit in the name counts more than one in the description
+FIELD_WEIGHTS = (
+    ('name', 3.0),
+    ('category_name', 2.0),
+    ('description', 1.0),
+)
+
+# Prefix expansions ("plumb" -> "plumbing") score below exact terms
+PREFIX_WEIGHT = 0.5
+MIN_PREFIX_LENGTH = 3
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'into', 'of', 'on',
+    'or', 'the', 'to', 'with', 'your', 'our', 'all', 'any',
+))
+
+# (label, min, max) buckets for the price facet, both ends inclusive (whole
+# rupees) to match the min_price/max_price filter; None = open ended
+PRICE_RANGES = (
+    ('Under ₹1,000', None, 999),
+    ('₹1,000 - ₹2,499', 1000, 2499),
+    ('₹2,500 - ₹4,999', 2500, 4999),
+    ('₹5,000 - ₹9,999', 5000, 9999),
+    ('₹10,000 and above', 10000, None),
+)
+
+SORT_OPTIONS = ('relevance', 'recent', 'price_asc', 'price_desc', 'rating')
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def _stem(token):
+    """Very light plural folding so 'pipes' finds 'pipe' and vice versa"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lower-case word tokens with stopwords removed and plurals folded"""
+    return [
+        _stem(token) for token in _TOKEN_RE.findall((text or '').lower())
+        if token not in STOPWORDS
+    ]
+
+
+def price_bucket(price):
+    """Index into PRICE_RANGES of the bucket holding ``price``"""
+    for position, (_label, _low, high) in enumerate(PRICE_RANGES):
+        if high is None or price < high + 1:
+            return position
+    return len(PRICE_RANGES) - 1
+
+
+class SearchResult:
+    """Ranked services plus the facet counts for the same query"""
+    __slots__ = ('services', 'category_facets', 'price_facets', 'total')
+
+    def __init__(self, services, category_facets, price_facets):
+        self.services = services
+        self.category_facets = category_facets
+        self.price_facets = price_facets
+        self.total = len(services)
+
+
+class SearchIndex:
+    """Inverted index over one catalog snapshot (immutable once built)"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        self.services = snapshot.services
+        self.postings = {}
+        self.prices = []
+        self.buckets = []
+        self.categories = []
+
+        for position, service in enumerate(self.services):
+            weights = {}
+            for field, weight in FIELD_WEIGHTS:
+                for term in tokenize(service.get(field)):
+                    weights[term] = weights.get(term, 0.0) + weight
+            for term, weight in weights.items():
+                self.postings.setdefault(term, {})[position] = weight
+            price = float(service['price'])
+            self.prices.append(price)
+            self.buckets.append(price_bucket(price))
+            self.categories.append(service['category_slug'])
+
+        total = max(len(self.services), 1)
+        self.idf = {
+            term: math.log(1 + total / len(docs))
+            for term, docs in self.postings.items()
+        }
+        # Sorted vocabulary for prefix expansion with bisect
+        self.vocabulary = sorted(self.postings)
+
+        # Precomputed positions for the non-relevance sorts
+        positions = range(len(self.services))
+        ranked = {
+            'recent': list(positions),
+            'price_asc': sorted(positions, key=lambda p: self.prices[p]),
+            'price_desc': sorted(positions, key=lambda p: -self.prices[p]),
+            'rating': sorted(
+                positions,
+                key=lambda p: (-self.services[p]['average_rating'], -self.services[p]['review_count']),
+            ),
+        }
+        self.order = {
+            name: {position: order for order, position in enumerate(positions)}
+            for name, positions in ranked.items()
+        }
+
+    def _expand(self, term):
+        """Return {vocabulary term: weight multiplier} for one query term"""
+        expansions = {}
+        if term in self.postings:
+            expansions[term] = 1.0
+        if len(term) >= MIN_PREFIX_LENGTH:
+            start = bisect_left(self.vocabulary, term)
+            for word in self.vocabulary[start:]:
+                if not word.startswith(term):
+                    break
+                expansions.setdefault(word, PREFIX_WEIGHT)
+        return expansions
+
+    def _score(self, query):
+        """Return {position: score} for services matching every query term"""
+        scores = None
+        for term in dict.fromkeys(tokenize(query)):
+            term_scores = {}
+            for word, multiplier in self._expand(term).items():
+                idf = self.idf[word]
+                for position, weight in self.postings[word].items():
+                    score = weight * idf * multiplier
+                    if score > term_scores.get(position, 0.0):
+                        term_scores[position] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    position: score + term_scores[position]
+                    for position, score in scores.items() if position in term_scores
+                }
+            if not scores:
+                return {}
+        return scores
+
+    def search(self, query='', category=None, min_price=None, max_price=None, sort_by='relevance'):
+        query = (query or '').strip()
+        if query:
+            scores = self._score(query)
+            candidates = scores.keys()
+        else:
+            scores = None
+            candidates = range(len(self.services))
+
+        # One pass: filter and count facets. Each facet ignores its own
+        # filter so the other options still show how many results they hold.
+        category_counts = {}
+        bucket_counts = [0] * len(PRICE_RANGES)
+        matches = []
+        for position in candidates:
+            price = self.prices[position]
+            price_ok = (min_price is None or price >= min_price) and (max_price is None or price <= max_price)
+            category_ok = not category or self.categories[position] == category
+            if price_ok:
+                slug = self.categories[position]
+                category_counts[slug] = category_counts.get(slug, 0) + 1
+            if category_ok:
+                bucket_counts[self.buckets[position]] += 1
+            if price_ok and category_ok:
+                matches.append(position)
+
+        if sort_by == 'relevance' and scores is not None:
+            recent = self.order['recent']
+            matches.sort(key=lambda p: (-scores[p], recent[p]))
+        else:
+            order = self.order.get(sort_by, self.order['recent'])
+            matches.sort(key=order.__getitem__)
+
+        category_facets = [
+            {
+                'name': c['name'],
+                'slug': c['slug'],
+                'count': category_counts.get(c['slug'], 0),
+                'selected': c['slug'] == category,
+            }
+            for c in self.snapshot.categories
+        ]
+        price_facets = [
+            {
+                'label': label,
+                'min_price': low,
+                'max_price': high,
+                'count': bucket_counts[position],
+                'selected': min_price == low and max_price == high,
+            }
+            for position, (label, low, high) in enumerate(PRICE_RANGES)
+        ]
+        return SearchResult([self.services[p] for p in matches], category_facets, price_facets)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _indexes(index, snapshot):
+    if index is None:
+        return False
+    if snapshot.version is not None:
+        return index.version == snapshot.version
+    return index.snapshot is snapshot
+
+
+def get_search_index(snapshot):
+    """Return the search index for ``snapshot``'s catalog load, building it on first use"""
+    global _index
+    index = _index
+    if _indexes(index, snapshot):
+        return index
+    with _lock:
+        if not _indexes(_index, snapshot):
+            _index = SearchIndex(snapshot)
+        return _index
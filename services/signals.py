@@ -0,0 +1,85 @@
+"""
+Signal receivers for the services app (connected in ServicesConfig.ready)
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from . import invoicing  # noqa: F401  registers the invoice transition hooks
+from .assignment import invalidate_pool
+from .catalog import invalidate_catalog
+from .models import Booking, ProviderProfile, Review, Service, ServiceCategory
+from .ratings import apply_rating_change, service_id_for_booking
+from .stats import COUNTED_FIELDS, record_service_change, record_transition
+from .summaries import invalidate_booking_owner
+
+CATALOG_MODELS = (Service, ServiceCategory)
+# Models the provider assignment pool is built from
+ASSIGNMENT_MODELS = (Service, ProviderProfile)
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_delete_{model.__name__}')
+
+for model in ASSIGNMENT_MODELS:
+    post_save.connect(invalidate_pool, sender=model, dispatch_uid=f'assignment_save_{model.__name__}')
+    post_delete.connect(invalidate_pool, sender=model, dispatch_uid=f'assignment_delete_{model.__name__}')
+
+
+def remember_previous_rating(sender, instance, **kwargs):
+    """Keep the stored rating so post_save can move it between star buckets"""
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = sender.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+
+
+def update_rating_on_save(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_previous_rating', None)
+    if previous == instance.rating:
+        return
+    apply_rating_change(service_id_for_booking(instance.booking_id), added=instance.rating, removed=previous)
+
+
+def update_rating_on_delete(sender, instance, **kwargs):
+    apply_rating_change(service_id_for_booking(instance.booking_id), removed=instance.rating)
+
+
+pre_save.connect(remember_previous_rating, sender=Review, dispatch_uid='rating_pre_save')
+post_save.connect(update_rating_on_save, sender=Review, dispatch_uid='rating_save')
+post_delete.connect(update_rating_on_delete, sender=Review, dispatch_uid='rating_delete')
+
+
+def counted_state(booking):
+    return {field: getattr(booking, field) for field in COUNTED_FIELDS}
+
+
+def remember_previous_booking(sender, instance, **kwargs):
+    """Keep the stored state so post_save can move the dashboard counters"""
+    instance._counted_before = None
+    if instance.pk:
+        instance._counted_before = sender.objects.filter(pk=instance.pk).values(*COUNTED_FIELDS).first()
+
+
+def count_booking_save(sender, instance, created, **kwargs):
+    before = None if created else getattr(instance, '_counted_before', None)
+    record_transition(before, counted_state(instance))
+
+
+def count_booking_delete(sender, instance, **kwargs):
+    record_transition(counted_state(instance), None)
+
+
+def count_service_save(sender, instance, created, **kwargs):
+    if created:
+        record_service_change(1)
+
+
+def count_service_delete(sender, instance, **kwargs):
+    record_service_change(-1)
+
+
+pre_save.connect(remember_previous_booking, sender=Booking, dispatch_uid='stats_booking_pre_save')
+post_save.connect(count_booking_save, sender=Booking, dispatch_uid='stats_booking_save')
+post_delete.connect(count_booking_delete, sender=Booking, dispatch_uid='stats_booking_delete')
+post_save.connect(invalidate_booking_owner, sender=Booking, dispatch_uid='summary_booking_save')
+post_delete.connect(invalidate_booking_owner, sender=Booking, dispatch_uid='summary_booking_delete')
+post_save.connect(count_service_save, sender=Service, dispatch_uid='stats_service_save')
+post_delete.connect(count_service_delete, sender=Service, dispatch_uid='stats_service_delete')
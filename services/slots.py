@@ -0,0 +1,309 @@
+"""
+Provider availability as per-day slot bitmaps
+
+A provider's day is cut into ``SLOT_MINUTES`` blocks. Bit ``i`` of a day's
+``free`` mask is set when block ``i`` lies inside an available
+``ProviderSchedule`` window and no active booking occupies it. The masks are
+precomputed into ``services_provider_slots`` (one ``{provider_id, date,
+free}`` document per provider and day) by :func:`rebuild` and
+``manage.py rebuild_slots``, so "which start times fit a two hour service"
+and "is this slot free" are one indexed read plus a few shifts and ANDs.
+
+Masks are kept current incrementally and only ever by ``$bit``: :func:`reserve`
+clears a new booking's blocks with an ``and`` guarded by ``$bitsAllSet``, so
+two customers cannot take the same slot, and a booking that leaves an active
+status or moves frees the blocks it left with an ``or`` (:func:`release`, via
+:func:`sync_transitions`, called from :func:`services.stats.record_transitions`).
+A day is never recomputed over a live document, since a reservation whose
+booking is not inserted yet would be lost: :func:`rebuild` only fills in
+missing days, except from ``rebuild_slots``, which skips days written in the
+last ``REBUILD_GRACE`` and swaps the others only if unchanged since read.
+"""
+import math
+from datetime import datetime, time, timedelta
+
+from bson.int64 import Int64
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from .mongo import get_db
+
+SLOTS_COLLECTION = 'services_provider_slots'
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+DEFAULT_DURATION_MINUTES = 120
+# Working hours of providers who keep no ProviderSchedule at all
+DEFAULT_HOURS = (time(9), time(18))
+# Days ahead precomputed by manage.py rebuild_slots
+REBUILD_DAYS = 30
+# Days written this recently may hold a reservation whose booking is not
+# inserted yet; rebuild_slots leaves them as they are
+REBUILD_GRACE = timedelta(minutes=1)
+
+# Bookings in these states hold their slot
+ACTIVE_STATUSES = ('pending', 'confirmed', 'in_progress')
+
+# Booking fields the slot masks depend on
+SLOT_FIELDS = ('provider_id', 'booking_date', 'duration_minutes', 'status')
+SLOT_PROJECTION = {field: 1 for field in SLOT_FIELDS}
+
+WEEKDAYS = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+    'friday': 4, 'saturday': 5, 'sunday': 6,
+}
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def window_mask(start, end):
+    """Blocks lying entirely inside the ``[start, end)`` time window"""
+    # An end time of 00:00 means midnight at the end of the day
+    end_minute = _minutes(end) or 24 * 60
+    first = math.ceil(_minutes(start) / SLOT_MINUTES)
+    last = min(end_minute // SLOT_MINUTES, SLOTS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def span_mask(start_minute, minutes):
+    """Blocks touched by ``minutes`` starting at ``start_minute`` (clipped at midnight)"""
+    first = start_minute // SLOT_MINUTES
+    last = min(math.ceil((start_minute + minutes) / SLOT_MINUTES), SLOTS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def start_mask(free, blocks):
+    """Bit ``i`` is set when blocks ``i .. i + blocks - 1`` are all free"""
+    run = free
+    for offset in range(1, blocks):
+        run &= free >> offset
+    return run
+
+
+def blocks_for(minutes):
+    return max(1, math.ceil(minutes / SLOT_MINUTES))
+
+
+def set_bits(mask):
+    index = 0
+    while mask:
+        if mask & 1:
+            yield index
+        mask >>= 1
+        index += 1
+
+
+def local_datetime(value):
+    """Naive datetime in the current time zone; naive values from MongoDB are UTC"""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return timezone.localtime(value).replace(tzinfo=None)
+
+
+def day_bounds(day):
+    """UTC range of ``booking_date`` values falling on the local ``day``"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def service_minutes(service):
+    """Duration of a catalog service (``duration`` is in hours)"""
+    hours = service.get('duration') if service else None
+    return int(hours * 60) if hours else DEFAULT_DURATION_MINUTES
+
+
+def booking_minutes(booking_doc):
+    return booking_doc.get('duration_minutes') or DEFAULT_DURATION_MINUTES
+
+
+def schedule_masks(provider_ids):
+    """``{provider_id: [mask for Monday .. Sunday]}`` from ProviderSchedule in one query"""
+    from .models import ProviderSchedule
+
+    default = window_mask(*DEFAULT_HOURS)
+    masks = {}
+    for schedule in ProviderSchedule.objects.filter(provider_id__in=list(provider_ids)):
+        week = masks.setdefault(schedule.provider_id, [0] * 7)
+        weekday = WEEKDAYS.get(schedule.day)
+        if schedule.is_available and weekday is not None:
+            week[weekday] |= window_mask(schedule.start_time, schedule.end_time)
+    return {provider_id: masks.get(provider_id, [default] * 7) for provider_id in provider_ids}
+
+
+def busy_masks(provider_ids, first_day, days, db):
+    """``{(provider_id, day): mask}`` of blocks held by active bookings, from one query"""
+    start, _ = day_bounds(first_day)
+    _, end = day_bounds(first_day + timedelta(days=days - 1))
+    busy = {}
+    cursor = db['services_booking'].find({
+        'provider_id': {'$in': list(provider_ids)},
+        'status': {'$in': list(ACTIVE_STATUSES)},
+        'booking_date': {'$gte': start, '$lt': end},
+    }, SLOT_PROJECTION)
+    for doc in cursor:
+        when = local_datetime(doc['booking_date'])
+        key = (doc['provider_id'], when.date())
+        busy[key] = busy.get(key, 0) | span_mask(_minutes(when), booking_minutes(doc))
+    return busy
+
+
+def rebuild(provider_ids, first_day=None, days=REBUILD_DAYS, db=None, overwrite=False):
+    """
+    Compute the free masks of ``provider_ids`` for ``days`` days that have
+    none yet; returns how many were written. With ``overwrite`` existing days
+    are recomputed too, unless written within ``REBUILD_GRACE`` or changed
+    between the read and the write.
+    """
+    provider_ids = [provider_id for provider_id in set(provider_ids) if provider_id is not None]
+    if not provider_ids:
+        return 0
+    db = db if db is not None else get_db()
+    first_day = first_day or timezone.localdate()
+    dates = [(first_day + timedelta(days=offset)).isoformat() for offset in range(days)]
+    written_at = {}
+    if overwrite:
+        # Read before the bookings, so a reservation made after it fails the swap below
+        cursor = db[SLOTS_COLLECTION].find(
+            {'provider_id': {'$in': provider_ids}, 'date': {'$in': dates}},
+            {'provider_id': 1, 'date': 1, 'updated_at': 1},
+        )
+        written_at = {(doc['provider_id'], doc['date']): doc.get('updated_at') for doc in cursor}
+    schedules = schedule_masks(provider_ids)
+    busy = busy_masks(provider_ids, first_day, days, db)
+    now = datetime.now()
+
+    operations = []
+    for provider_id in provider_ids:
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            free = Int64(schedules[provider_id][day.weekday()] & ~busy.get((provider_id, day), 0))
+            key = {'provider_id': provider_id, 'date': day.isoformat()}
+            if (provider_id, key['date']) not in written_at:
+                operations.append(UpdateOne(key, {'$setOnInsert': {'free': free, 'updated_at': now}}, upsert=True))
+                continue
+            stamp = written_at[(provider_id, key['date'])]
+            if stamp is None or stamp < now - REBUILD_GRACE:
+                operations.append(UpdateOne(
+                    dict(key, updated_at=stamp), {'$set': {'free': free, 'updated_at': now}},
+                ))
+    if not operations:
+        return 0
+    result = db[SLOTS_COLLECTION].bulk_write(operations, ordered=False)
+    return result.upserted_count + result.modified_count
+
+
+def rebuild_day(provider_id, day, db=None):
+    return rebuild([provider_id], day, 1, db=db)
+
+
+def day_mask(provider_id, day, db=None):
+    """Free mask of one provider and day, computing it on first use"""
+    db = db if db is not None else get_db()
+    doc = db[SLOTS_COLLECTION].find_one({'provider_id': provider_id, 'date': day.isoformat()}, {'free': 1})
+    if doc is None:
+        rebuild_day(provider_id, day, db=db)
+        doc = db[SLOTS_COLLECTION].find_one({'provider_id': provider_id, 'date': day.isoformat()}, {'free': 1})
+    return int(doc['free']) if doc else 0
+
+
+def available_slots(provider_id, day, minutes, db=None):
+    """Aware start datetimes on ``day`` where ``minutes`` of work fit, excluding past ones"""
+    starts = start_mask(day_mask(provider_id, day, db=db), blocks_for(minutes))
+    now = timezone.now()
+    slots = []
+    for index in set_bits(starts):
+        start = timezone.make_aware(datetime.combine(day, time.min) + timedelta(minutes=index * SLOT_MINUTES))
+        if start > now:
+            slots.append(start)
+    return slots
+
+
+def booking_span(start, minutes):
+    """``(day, mask)`` of a booking starting at the aware or naive-UTC ``start``"""
+    when = local_datetime(start)
+    return when.date(), span_mask(_minutes(when), minutes)
+
+
+def is_slot_free(provider_id, start, minutes, db=None):
+    day, mask = booking_span(start, minutes)
+    return bool(mask) and day_mask(provider_id, day, db=db) & mask == mask
+
+
+def reserve(provider_id, start, minutes, db=None, held=None):
+    """
+    Take the blocks of a booking starting at ``start`` if they are all free;
+    returns False when any of them is outside the schedule or already taken.
+
+    ``held`` is the booking document being moved: the blocks it already
+    holds on this provider and day are kept rather than taken again, so a
+    booking can move by less than its own length.
+    """
+    db = db if db is not None else get_db()
+    day, mask = booking_span(start, minutes)
+    if not mask:
+        return False
+    if held is not None and held.get('provider_id') == provider_id and isinstance(held.get('booking_date'), datetime):
+        held_day, held_mask = booking_span(held['booking_date'], booking_minutes(held))
+        if held_day == day:
+            mask &= ~held_mask
+            if not mask:
+                return True
+    day_mask(provider_id, day, db=db)
+    result = db[SLOTS_COLLECTION].update_one(
+        {'provider_id': provider_id, 'date': day.isoformat(), 'free': {'$bitsAllSet': mask}},
+        {'$bit': {'free': {'and': Int64(FULL_DAY & ~mask)}}, '$set': {'updated_at': datetime.now()}},
+    )
+    return result.modified_count == 1
+
+
+def release(booking_doc, db=None):
+    """
+    Give back the blocks of a booking's span that no active booking holds
+    any more (its own current span included, so a move frees only the
+    blocks it left); returns the freed mask. Only call it for blocks the
+    booking, or a reservation made for it, actually held.
+    """
+    provider_id = booking_doc.get('provider_id')
+    if provider_id is None or not isinstance(booking_doc.get('booking_date'), datetime):
+        return 0
+    day, mask = booking_span(booking_doc['booking_date'], booking_minutes(booking_doc))
+    if day < timezone.localdate() or not mask:
+        return 0
+    db = db if db is not None else get_db()
+    held = busy_masks([provider_id], day, 1, db).get((provider_id, day), 0)
+    freed = mask & schedule_masks([provider_id])[provider_id][day.weekday()] & ~held
+    if freed:
+        db[SLOTS_COLLECTION].update_one(
+            {'provider_id': provider_id, 'date': day.isoformat()},
+            {'$bit': {'free': {'or': Int64(freed)}}, '$set': {'updated_at': datetime.now()}},
+        )
+    return freed
+
+
+def _holds_slot(doc):
+    return doc is not None and (doc.get('status') or 'pending') in ACTIVE_STATUSES
+
+
+def sync_transitions(transitions, db=None):
+    """
+    Free the slots of bookings that stopped being active, and the blocks
+    bookings that moved to another time or provider left. Taking the new
+    blocks is not handled here: the caller reserves them before writing.
+    """
+    for before, after in transitions:
+        if not _holds_slot(before) or 'booking_date' not in before or 'provider_id' not in before:
+            continue
+        moved = after is not None and (
+            after.get('booking_date') != before.get('booking_date')
+            or after.get('provider_id') != before.get('provider_id')
+        )
+        if not _holds_slot(after) or moved:
+            release(before, db=db)
@@ -0,0 +1,71 @@
+"""
+Service snapshot embedded on raw booking documents
+
+Raw bookings store ``service_id: None`` and name their service only in the
+``notes`` text ("Booking for X - Provider: Y"), so every page used to split
+that string and look the service up again. Bookings now carry a compact
+``service_snapshot`` written once at creation from the in-process catalog::
+
+    {'id': 12, 'name': 'Deep Cleaning', 'category': 'cleaning',
+     'category_name': 'Cleaning', 'duration': 3, 'provider': 'Asha Rao'}
+
+``id`` is only set when the catalog comes from the database (sample
+services have no ``Service`` row). The snapshot is what was booked; later
+edits to the service do not rewrite it. Documents written before it existed
+are backfilled from their notes by ``manage.py backfill_service_snapshots``;
+until then the readers fall back to the notes.
+"""
+from .catalog import get_catalog
+from .repositories import booking_provider_name, booking_service_name, parse_provider_name, parse_service_name
+
+SNAPSHOT_FIELD = 'service_snapshot'
+
+
+def service_snapshot(service, source='database'):
+    """Snapshot of a catalog service as it is booked"""
+    return {
+        'id': service['id'] if source == 'database' else None,
+        'name': service['name'],
+        'category': service['category_slug'],
+        'category_name': service['category_name'],
+        'duration': service['duration'],
+        'provider': service['provider']['user']['get_full_name'],
+    }
+
+
+def snapshot_from_notes(notes, catalog=None):
+    """Best snapshot recoverable from "Booking for X - Provider: Y" notes, or None"""
+    name = parse_service_name(notes, default=None)
+    if name is None:
+        return None
+    catalog = catalog or get_catalog()
+    service = catalog.get_by_name(name)
+    if service is None:
+        snapshot = {'id': None, 'name': name, 'category': None, 'category_name': '', 'duration': None}
+    else:
+        snapshot = service_snapshot(service, catalog.source)
+    # The provider named at booking time, even if the service changed hands since
+    snapshot['provider'] = parse_provider_name(notes, default=snapshot.get('provider'))
+    return snapshot
+
+
+def booking_service_info(booking, catalog=None):
+    """
+    Service fields the payment pages show for a booking (a raw document, a
+    ``BookingRecord`` or an ORM ``Booking``), from its snapshot with the
+    catalog for the description.
+    """
+    read = booking.get if hasattr(booking, 'get') else (lambda key: getattr(booking, key, None))
+    doc = {SNAPSHOT_FIELD: read(SNAPSHOT_FIELD), 'notes': read('notes')}
+    snapshot = doc[SNAPSHOT_FIELD] or {}
+    catalog = catalog or get_catalog()
+    service = catalog.get(snapshot['id']) if snapshot.get('id') is not None else None
+    if service is None:
+        service = catalog.get_by_name(booking_service_name(doc, default=None))
+    return {
+        'service_name': booking_service_name(doc),
+        'service_description': service['description'] if service else 'Professional home service',
+        'service_category': snapshot.get('category_name') or (service['category_name'] if service else 'General'),
+        'service_duration': snapshot.get('duration') or (service['duration'] if service else 2),
+        'provider_name': booking_provider_name(doc),
+    }
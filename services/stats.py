@@ -0,0 +1,320 @@
+"""
+Incrementally maintained dashboard counters
+
+Booking totals per status, paid revenue and bookings-per-day are kept in the
+``services_stats`` collection and adjusted with ``$inc`` on every booking
+insert, status change, payment change or delete, so the dashboards read them
+with one ``find`` instead of counting the bookings collection.
+
+Every change goes through :func:`record_transition` with the booking's state
+before and after. Raw MongoDB writes use :func:`insert_booking` /
+:func:`transition_booking`, and status changes the transition hooks of
+:mod:`services.transitions`; ORM saves are covered by the ``Booking`` signal
+receivers in :mod:`services.signals`. ``manage.py reconcile_dashboard_stats``
+recomputes everything from the bookings and corrects any drift.
+
+The increments start from whatever is stored, so counters created by the
+first write after deploy hold only the new deltas. They count as built once
+a reconcile has marked them with ``built_at``: the dashboard builds them on
+first use (:func:`build_counters`, claimed by one request) and
+``reconcile_dashboard_stats --fix`` does the same from the command line.
+
+The same ``(before, after)`` pairs keep the provider slot masks of
+:mod:`services.slots` current.
+"""
+from datetime import date, datetime, timedelta
+
+from django.utils import timezone
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from .mongo import get_db
+from .slots import SLOT_PROJECTION, sync_transitions
+
+STATS_COLLECTION = 'services_stats'
+BOOKING_COUNTERS_ID = 'bookings'
+SERVICE_COUNTERS_ID = 'services'
+
+# Bookings whose paid amount counts as revenue
+REVENUE_STATUSES = ('confirmed', 'completed')
+
+# Fields of the bookings counter document that are not counters: set by a
+# reconcile that applied its recount, and by the request currently building it
+META_FIELDS = ('built_at', 'building')
+# Seconds after which an unfinished first-use build may be claimed again
+BUILD_TIMEOUT = 300
+
+# Booking fields that affect the counters
+COUNTED_FIELDS = ('status', 'is_paid', 'total_amount', 'created_at')
+COUNTED_PROJECTION = {field: 1 for field in COUNTED_FIELDS}
+
+
+def day_id(day):
+    return f'bookings:{day.isoformat()}'
+
+
+def amount(value):
+    """Booking amounts are floats in raw documents and Decimal128 via the ORM"""
+    if value is None:
+        return 0.0
+    if hasattr(value, 'to_decimal'):
+        value = value.to_decimal()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _day(created_at):
+    if isinstance(created_at, datetime):
+        if timezone.is_aware(created_at):
+            created_at = timezone.localtime(created_at)
+        return created_at.date()
+    if isinstance(created_at, date):
+        return created_at
+    return None
+
+
+def contribution(doc):
+    """
+    Return ``({counter: value}, day)`` that one booking state adds to the
+    counters; ``doc`` of None (not yet created / deleted) contributes nothing.
+    """
+    if doc is None:
+        return {}, None
+    status = doc.get('status') or 'pending'
+    counters = {'total': 1, f'status.{status}': 1}
+    if status in REVENUE_STATUSES and doc.get('is_paid'):
+        counters['paid_bookings'] = 1
+        counters['revenue'] = amount(doc.get('total_amount'))
+    return counters, _day(doc.get('created_at'))
+
+
+def _add_delta(before, after, increments, days):
+    before_counters, before_day = contribution(before)
+    after_counters, after_day = contribution(after)
+    for key, value in after_counters.items():
+        increments[key] = increments.get(key, 0) + value
+    for key, value in before_counters.items():
+        increments[key] = increments.get(key, 0) - value
+    if before_day != after_day:
+        if before_day is not None:
+            days[before_day] = days.get(before_day, 0) - 1
+        if after_day is not None:
+            days[after_day] = days.get(after_day, 0) + 1
+
+
+def record_transitions(transitions, db=None):
+    """Apply the summed counter delta of many ``(before, after)`` pairs in one write"""
+    increments = {}
+    days = {}
+    for before, after in transitions:
+        _add_delta(before, after, increments, days)
+    increments = {key: value for key, value in increments.items() if value}
+
+    operations = []
+    if increments:
+        operations.append(UpdateOne({'_id': BOOKING_COUNTERS_ID}, {'$inc': increments}, upsert=True))
+    for day, delta in days.items():
+        if delta:
+            operations.append(UpdateOne({'_id': day_id(day)}, {'$inc': {'bookings': delta}}, upsert=True))
+    if operations:
+        (db if db is not None else get_db())[STATS_COLLECTION].bulk_write(operations, ordered=False)
+    sync_transitions(transitions, db=db)
+
+
+def record_transition(before, after, db=None):
+    """Apply the counter delta between two states of one booking"""
+    record_transitions([(before, after)], db=db)
+
+
+def record_service_change(delta, db=None):
+    (db if db is not None else get_db())[STATS_COLLECTION].update_one(
+        {'_id': SERVICE_COUNTERS_ID}, {'$inc': {'total': delta}}, upsert=True
+    )
+
+
+def insert_booking(booking_doc, db=None):
+    """
+    Insert a raw booking document and count it. Only the insert can raise:
+    a failed count is left as drift for ``reconcile_dashboard_stats``.
+    """
+    db = db if db is not None else get_db()
+    result = db['services_booking'].insert_one(booking_doc)
+    try:
+        record_transition(None, booking_doc, db=db)
+    except Exception as e:
+        print(f"Error counting booking {booking_doc['_id']}: {e}")
+    return result
+
+
+def transition_booking(query, update, db=None, projection=None):
+    """
+    Apply ``update`` to the first booking matching ``query`` and adjust the
+    counters from the state it had just before the write.
+
+    Returns the matched document's counted fields (plus any in
+    ``projection``) as they were before the update, or None if nothing
+    matched.
+    """
+    db = db if db is not None else get_db()
+    projection = dict(projection or {}, **COUNTED_PROJECTION, **SLOT_PROJECTION)
+    before = db['services_booking'].find_one_and_update(
+        query, update, projection=projection, return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        return None
+    after = dict(before)
+    for field, value in update.get('$set', {}).items():
+        if field in projection:
+            after[field] = value
+    record_transition(before, after, db=db)
+    return before
+
+
+def get_dashboard_counters(db=None):
+    """
+    Read the counters in one round trip:
+    ``{'total', 'status': {...}, 'revenue', 'paid_bookings', 'today', 'services'}``,
+    or None if no reconcile has built them yet (see :func:`build_counters`).
+    """
+    db = db if db is not None else get_db()
+    today = day_id(timezone.localdate())
+    docs = {
+        doc['_id']: doc
+        for doc in db[STATS_COLLECTION].find({'_id': {'$in': [BOOKING_COUNTERS_ID, SERVICE_COUNTERS_ID, today]}})
+    }
+    bookings = docs.get(BOOKING_COUNTERS_ID)
+    if bookings is None or 'built_at' not in bookings:
+        return None
+    return {
+        'total': bookings.get('total', 0),
+        'status': bookings.get('status', {}),
+        'revenue': bookings.get('revenue', 0.0),
+        'paid_bookings': bookings.get('paid_bookings', 0),
+        'today': docs.get(today, {}).get('bookings', 0),
+        'services': docs.get(SERVICE_COUNTERS_ID, {}).get('total', 0),
+    }
+
+
+def _flatten(counters):
+    flat = {}
+    for key, value in counters.items():
+        if key == '_id' or key in META_FIELDS:
+            continue
+        if isinstance(value, dict):
+            flat.update({f'{key}.{sub}': sub_value for sub, sub_value in value.items()})
+        else:
+            flat[key] = value
+    return flat
+
+
+def compute_counters(db=None):
+    """Recompute ``(booking_counters, {day: bookings})`` from the bookings collection"""
+    db = db if db is not None else get_db()
+    counters = {}
+    days = {}
+    for doc in db['services_booking'].find({}, COUNTED_PROJECTION):
+        values, day = contribution(doc)
+        for key, value in values.items():
+            counters[key] = counters.get(key, 0) + value
+        if day is not None:
+            days[day] = days.get(day, 0) + 1
+    return counters, days
+
+
+def reconcile(service_count, db=None, apply=False):
+    """
+    Compare the stored counters with a full recount.
+
+    Returns ``{counter id: {field: (stored, expected)}}`` for every value that
+    drifted. With ``apply`` the drift is added back with ``$inc`` so that
+    increments made while the recount ran are kept, and the bookings
+    counters are marked as built.
+    """
+    db = db if db is not None else get_db()
+    expected, days = compute_counters(db)
+    collection = db[STATS_COLLECTION]
+    stored = {doc['_id']: _flatten(doc) for doc in collection.find({})}
+
+    wanted = {BOOKING_COUNTERS_ID: expected, SERVICE_COUNTERS_ID: {'total': service_count}}
+    wanted.update({day_id(day): {'bookings': count} for day, count in days.items()})
+    for counter_id, values in stored.items():
+        if counter_id.startswith('bookings:') and counter_id not in wanted:
+            wanted[counter_id] = {'bookings': 0}
+
+    drift = {}
+    operations = []
+    for counter_id, values in wanted.items():
+        current = stored.get(counter_id, {})
+        keys = set(values) | (set(current) if counter_id == BOOKING_COUNTERS_ID else set())
+        differences = {}
+        for key in keys:
+            have, want = current.get(key, 0), values.get(key, 0)
+            if abs(have - want) > 1e-6:
+                differences[key] = (have, want)
+        if differences:
+            drift[counter_id] = differences
+            operations.append(UpdateOne(
+                {'_id': counter_id},
+                {'$inc': {key: want - have for key, (have, want) in differences.items()}},
+                upsert=True,
+            ))
+
+    if apply:
+        operations.append(UpdateOne(
+            {'_id': BOOKING_COUNTERS_ID},
+            {'$set': {'built_at': datetime.now()}, '$unset': {'building': ''}},
+            upsert=True,
+        ))
+        collection.bulk_write(operations, ordered=False)
+    return drift
+
+
+def claim_build(db=None):
+    """
+    Claim the first-use build of the counters with one conditional write;
+    True for the single caller that should run it
+    """
+    db = db if db is not None else get_db()
+    now = datetime.now()
+    try:
+        result = db[STATS_COLLECTION].update_one(
+            {
+                '_id': BOOKING_COUNTERS_ID,
+                'built_at': {'$exists': False},
+                '$or': [
+                    {'building': {'$exists': False}},
+                    # The claimant died before finishing
+                    {'building': {'$lt': now - timedelta(seconds=BUILD_TIMEOUT)}},
+                ],
+            },
+            {'$set': {'building': now}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Built, or being built by someone else
+        return False
+    return result.modified_count == 1 or result.upserted_id is not None
+
+
+def build_counters(service_count, db=None):
+    """Reconcile the counters into a built state unless another request is at it; True if built here"""
+    db = db if db is not None else get_db()
+    if not claim_build(db):
+        return False
+    reconcile(service_count, db=db, apply=True)
+    return True
+
+
+def counted_counters(service_count, db=None):
+    """:func:`get_dashboard_counters` computed from the bookings, for use while they are being built"""
+    counters, days = compute_counters(db)
+    return {
+        'total': counters.get('total', 0),
+        'status': {key[len('status.'):]: value for key, value in counters.items() if key.startswith('status.')},
+        'revenue': counters.get('revenue', 0.0),
+        'paid_bookings': counters.get('paid_bookings', 0),
+        'today': days.get(timezone.localdate(), 0),
+        'services': service_count,
+    }
@@ -0,0 +1,137 @@
+"""
+Per-customer booking summary for the user dashboard
+
+The dashboard shows a customer's latest bookings and how many they have in
+each status. Both come from one ``$facet`` aggregation over the customer's
+bookings, with the providers joined by ``$lookup``, so building a summary is
+a single round trip and serving a cached one makes none.
+
+Summaries are cached through :mod:`services.cache` for
+``settings.USER_SUMMARY_MAX_AGE`` seconds, shared by the worker processes,
+with at most ``USER_SUMMARY_MAX_ENTRIES`` kept in each process. Every
+booking write for a customer drops their entry: status changes through a
+transition hook, ORM saves and deletes through :mod:`services.signals`, and
+creation, edits, rescheduling and provider assignment where they happen.
+Other processes drop their local copy within
+``SERVICES_CACHE_LOCAL_MAX_AGE`` seconds.
+"""
+from django.conf import settings
+from users.models import User
+
+from .cache import CacheNamespace
+from .mongo import get_db
+from .repositories import (
+    BOOKING_COLLECTION, SUMMARY_FIELDS, BookingRepository, UserIdentityMap, projection_for,
+)
+from .transitions import on_transition
+
+# Latest bookings shown on the dashboard
+SUMMARY_BOOKINGS = 3
+DEFAULT_MAX_AGE = 30
+DEFAULT_MAX_ENTRIES = 10000
+
+SUMMARY_BOOKING_FIELDS = SUMMARY_FIELDS + ('provider_id', 'address', 'payment_status', 'is_paid')
+USER_FIELDS = ('id', 'first_name', 'last_name', 'email')
+
+
+class BookingSummary:
+    """A customer's latest bookings and their booking count per status"""
+    __slots__ = ('customer_id', 'bookings', 'status_counts')
+
+    def __init__(self, customer_id, bookings, status_counts):
+        self.customer_id = customer_id
+        self.bookings = bookings
+        self.status_counts = status_counts
+
+    @property
+    def total(self):
+        return sum(self.status_counts.values())
+
+    def count(self, status):
+        return self.status_counts.get(status, 0)
+
+
+def summary_pipeline(customer_id, limit=SUMMARY_BOOKINGS):
+    return [
+        {'$match': {'customer_id': customer_id}},
+        {'$facet': {
+            'recent': [
+                {'$sort': {'booking_date': -1, '_id': -1}},
+                {'$limit': limit},
+                {'$project': projection_for(SUMMARY_BOOKING_FIELDS)},
+                {'$lookup': {
+                    'from': User._meta.db_table,
+                    'let': {'provider_id': '$provider_id'},
+                    'pipeline': [
+                        {'$match': {'$expr': {'$eq': ['$id', '$$provider_id']}}},
+                        {'$project': {'_id': 0, **{field: 1 for field in USER_FIELDS}}},
+                    ],
+                    'as': 'provider',
+                }},
+            ],
+            'by_status': [
+                {'$group': {'_id': {'$ifNull': ['$status', 'pending']}, 'count': {'$sum': 1}}},
+            ],
+        }},
+    ]
+
+
+def load_summary(customer, limit=SUMMARY_BOOKINGS, db=None):
+    """The summary of ``customer`` as plain data for the cache, with one aggregation"""
+    db = db if db is not None else get_db()
+    result = next(db[BOOKING_COLLECTION].aggregate(summary_pipeline(customer.id, limit)), None) or {}
+    return {
+        'customer': {field: getattr(customer, field) for field in USER_FIELDS},
+        'recent': result.get('recent', []),
+        'by_status': result.get('by_status', []),
+    }
+
+
+def build_summary(payload):
+    """Turn a loaded summary into a :class:`BookingSummary` without further queries"""
+    # A detached customer: cached records must not keep request.user (and its request) alive
+    customer = User(**payload['customer'])
+    docs = [dict(doc) for doc in payload['recent']]
+
+    # Providers come from the $lookup; seeding the identity map with them
+    # (and the ids that matched no user) keeps build_records from querying
+    providers = []
+    missing = set()
+    for doc in docs:
+        matches = doc.pop('provider', None)
+        if matches:
+            providers.append(User(**{field: matches[0].get(field) for field in USER_FIELDS}))
+        elif doc.get('provider_id') is not None:
+            missing.add(doc['provider_id'])
+    users = UserIdentityMap([customer] + providers, missing=missing)
+    bookings = BookingRepository(users=users).build_records(docs, customer=customer)
+
+    status_counts = {row['_id']: row['count'] for row in payload['by_status']}
+    return BookingSummary(customer.id, bookings, status_counts)
+
+
+summary_cache = CacheNamespace(
+    'user_summary', 'USER_SUMMARY_MAX_AGE', DEFAULT_MAX_AGE,
+    local_entries=getattr(settings, 'USER_SUMMARY_MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+    decode=build_summary,
+)
+
+
+def get_user_summary(customer, db=None):
+    """The cached :class:`BookingSummary` of ``customer``, loaded when missing or expired"""
+    return summary_cache.get_or_set(customer.id, lambda: load_summary(customer, db=db))
+
+
+def invalidate_user_summary(*customer_ids):
+    """Drop the cached summaries of these customers"""
+    summary_cache.delete(*customer_ids)
+
+
+@on_transition(fields=('customer_id',))
+def invalidate_transitioned(event, moved, db):
+    invalidate_user_summary(*{after.get('customer_id') for _, after in moved})
+
+
+def invalidate_booking_owner(sender, instance, **kwargs):
+    """Signal receiver for ORM booking saves and deletes"""
+    invalidate_user_summary(instance.customer_id)
@@ -1,3 +1,1036 @@
-from django.test import TestCase
-
-# Create your tests here.
+from datetime import datetime, time, timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from bson import ObjectId
+from django.conf import settings
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils import timezone
+
+from . import approvals, jobs, payments, ratings, slots, stats, transitions
+from .assignment import ProviderPool, assign_providers
+from .bookings import cancel_booking, create_booking, update_booking
+from .cache import CacheNamespace, shared_cache
+from .catalog import build_snapshot, load_catalog
+from .dashboard import load_counters
+from .indexes import INDEXES, IndexResult, ensure_indexes, verify_indexes
+from .invoice_views import InvoiceDownloadView
+from .invoicing import invalidate_invoice_status, invoice_status
+from .mongo import get_client
+from .provider_jobs import ProviderFeed, claim_job
+from .repositories import BookingRepository, decode_cursor, encode_cursor, keyset_filter
+from .search import get_search_index
+
+# Local-memory caches, so tests never touch Redis or the file cache
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'services': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-services'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES, SERVICES_CACHE='services')
+class MongoTestCase(SimpleTestCase):
+    """Raw MongoDB code paths, each test against a throwaway database on the configured server"""
+
+    def setUp(self):
+        super().setUp()
+        client = get_client()
+        name = f"{settings.DATABASES['default']['NAME']}_test_{ObjectId()}"
+        self.db = client[name]
+        self.addCleanup(client.drop_database, name)
+
+
+def default_schedules(provider_ids):
+    """Every provider on the default hours, in place of ProviderSchedule"""
+    return {provider_id: [slots.window_mask(*slots.DEFAULT_HOURS)] * 7 for provider_id in provider_ids}
+
+
+class ScheduledTestCase(MongoTestCase):
+    """Slot masks built from the default hours, on a day a few days ahead"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('services.slots.schedule_masks', side_effect=default_schedules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.day = timezone.localdate() + timedelta(days=3)
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def free_times(self, provider_id, minutes):
+        return [timezone.localtime(start).strftime('%H:%M')
+                for start in slots.available_slots(provider_id, self.day, minutes, db=self.db)]
+
+
+class KeysetCursorTests(SimpleTestCase):
+
+    def test_round_trip_keeps_millisecond_position(self):
+        object_id = ObjectId()
+        created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+        cursor = encode_cursor({'_id': object_id, 'created_at': created_at})
+        self.assertEqual(decode_cursor(cursor), (created_at.replace(microsecond=123000), object_id))
+
+    def test_missing_timestamp(self):
+        object_id = ObjectId()
+        cursor = encode_cursor({'_id': object_id, 'created_at': None})
+        self.assertEqual(cursor, f'n_{object_id}')
+        self.assertEqual(decode_cursor(cursor), (None, object_id))
+
+    def test_invalid_cursors_decode_to_none(self):
+        for cursor in ('', 'garbage', '123_not-an-id', f'abc_{ObjectId()}'):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                self.assertEqual(keyset_filter(cursor), {})
+
+    def test_filter_after_position(self):
+        object_id = ObjectId()
+        created_at = datetime(2024, 5, 1, 12, 30)
+        position = keyset_filter(encode_cursor({'_id': object_id, 'created_at': created_at}))
+        self.assertEqual(position, {'$or': [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': None},
+            {'created_at': created_at, '_id': {'$lt': object_id}},
+        ]})
+        undated = keyset_filter(encode_cursor({'_id': object_id}))
+        self.assertEqual(undated, {'created_at': None, '_id': {'$lt': object_id}})
+
+
+class BookingPageTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = SimpleNamespace(id=7)
+        start = datetime(2024, 5, 1, 12, 0)
+        docs = []
+        for index in range(23):
+            # Pairs share a timestamp so the _id tie-break is exercised at page edges
+            docs.append({
+                'customer_id': self.customer.id, 'status': 'pending' if index % 4 else 'cancelled',
+                'created_at': start + timedelta(minutes=index // 2), 'notes': f'Booking {index}',
+            })
+        docs.append({'customer_id': self.customer.id, 'status': 'pending', 'created_at': None})
+        docs.append({'customer_id': 8, 'status': 'pending', 'created_at': start})
+        self.db['services_booking'].insert_many(docs)
+        self.repository = BookingRepository(db=self.db)
+
+    def expected_ids(self, statuses):
+        return [
+            str(doc['_id']) for doc in self.db['services_booking']
+            .find({'customer_id': self.customer.id, 'status': {'$in': statuses}}, {'_id': 1})
+            .sort([('created_at', -1), ('_id', -1)])
+        ]
+
+    def walk(self, statuses, limit):
+        cursor, pages = None, []
+        while True:
+            page = self.repository.pages_for_customer(self.customer, {'tab': (statuses, cursor)}, limit=limit)['tab']
+            self.assertEqual(page.cursor, cursor)
+            pages.append([record.id for record in page])
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_booking_once_in_order(self):
+        expected = self.expected_ids(['pending', 'cancelled'])
+        pages = self.walk(['pending', 'cancelled'], limit=5)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 4])
+        self.assertEqual(sum(pages, []), expected)
+        # Undated bookings sort after every dated one
+        self.assertEqual(pages[-1][-1], self.expected_ids(['pending'])[-1])
+
+    def test_exact_multiple_has_no_empty_last_page(self):
+        expected = self.expected_ids(['cancelled'])
+        self.assertEqual(len(expected), 6)
+        pages = self.walk(['cancelled'], limit=3)
+        self.assertEqual([len(page) for page in pages], [3, 3])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_tabs_page_independently(self):
+        pages = self.repository.pages_for_customer(
+            self.customer, {'pending': (['pending'], None), 'cancelled': (['cancelled'], None)}, limit=10,
+        )
+        self.assertEqual(len(pages['pending']), 10)
+        self.assertTrue(pages['pending'].has_next)
+        self.assertEqual(len(pages['cancelled']), 6)
+        self.assertFalse(pages['cancelled'].has_next)
+        self.assertFalse(pages['cancelled'].has_previous)
+
+
+def bits(*indexes):
+    return sum(1 << index for index in indexes)
+
+
+class SlotMaskTests(SimpleTestCase):
+
+    def test_window_covers_whole_blocks_only(self):
+        self.assertEqual(slots.window_mask(time(9), time(18)), bits(*range(18, 36)))
+        self.assertEqual(slots.window_mask(time(9, 15), time(10)), bits(19))
+        self.assertEqual(slots.window_mask(time(10), time(10)), 0)
+        # Midnight closes the day
+        self.assertEqual(slots.window_mask(time(22), time(0)), bits(44, 45, 46, 47))
+
+    def test_span_touches_partial_blocks_and_clips_at_midnight(self):
+        self.assertEqual(slots.span_mask(9 * 60 + 15, 60), bits(18, 19, 20))
+        self.assertEqual(slots.span_mask(23 * 60 + 30, 120), bits(47))
+        self.assertEqual(slots.span_mask(10 * 60, 0), 0)
+
+    def test_start_mask_needs_consecutive_free_blocks(self):
+        free = bits(0, 1, 2, 4, 5, 6)
+        self.assertEqual(slots.start_mask(free, 1), free)
+        self.assertEqual(slots.start_mask(free, 2), bits(0, 1, 4, 5))
+        self.assertEqual(slots.start_mask(free, 4), 0)
+        self.assertEqual(slots.blocks_for(45), 2)
+        self.assertEqual(slots.blocks_for(0), 1)
+
+
+class SlotReservationTests(ScheduledTestCase):
+
+    def test_reserve_takes_free_blocks_once(self):
+        self.assertTrue(slots.reserve(1, self.at(10), 120, db=self.db))
+        self.assertFalse(slots.reserve(1, self.at(11), 60, db=self.db))
+        self.assertTrue(slots.reserve(1, self.at(12), 120, db=self.db))
+        # Another provider's day is separate
+        self.assertTrue(slots.reserve(2, self.at(11), 60, db=self.db))
+        self.assertEqual(self.free_times(1, 120), ['14:00', '14:30', '15:00', '15:30', '16:00'])
+
+    def test_reserve_refuses_time_outside_schedule(self):
+        self.assertFalse(slots.reserve(1, self.at(17, 30), 60, db=self.db))
+        self.assertFalse(slots.reserve(1, self.at(7), 60, db=self.db))
+        self.assertEqual(slots.day_mask(1, self.day, db=self.db), slots.window_mask(*slots.DEFAULT_HOURS))
+
+    def test_release_frees_only_blocks_no_booking_holds(self):
+        held = {'provider_id': 1, 'booking_date': self.at(10), 'duration_minutes': 120, 'status': 'confirmed'}
+        dropped = {'provider_id': 1, 'booking_date': self.at(14), 'duration_minutes': 60, 'status': 'pending'}
+        for doc in (held, dropped):
+            self.assertTrue(slots.reserve(1, doc['booking_date'], doc['duration_minutes'], db=self.db))
+        self.db['services_booking'].insert_many([held, dict(dropped, status='cancelled')])
+
+        slots.release(dropped, db=self.db)
+        free = slots.day_mask(1, self.day, db=self.db)
+        self.assertEqual(free & bits(*range(20, 24)), 0)
+        self.assertEqual(free & bits(28, 29), bits(28, 29))
+        self.assertTrue(slots.is_slot_free(1, self.at(14), 60, db=self.db))
+        self.assertFalse(slots.is_slot_free(1, self.at(11), 30, db=self.db))
+
+
+    def test_reservation_waiting_for_its_booking_survives_release_and_rebuild(self):
+        dropped = {'provider_id': 1, 'booking_date': self.at(14), 'duration_minutes': 60, 'status': 'cancelled'}
+        self.assertTrue(slots.reserve(1, dropped['booking_date'], 60, db=self.db))
+        self.db['services_booking'].insert_one(dropped)
+        # Reserved, but its booking is not inserted yet
+        self.assertTrue(slots.reserve(1, self.at(10), 120, db=self.db))
+
+        slots.release(dropped, db=self.db)
+        slots.rebuild([1], self.day, 1, db=self.db)
+        self.assertEqual(slots.rebuild([1], self.day, 1, db=self.db, overwrite=True), 0)
+        self.assertFalse(slots.is_slot_free(1, self.at(10), 30, db=self.db))
+        self.assertTrue(slots.is_slot_free(1, self.at(14), 60, db=self.db))
+
+        # Once out of the grace period, rebuild_slots recomputes the day from the bookings
+        stale = datetime.now() - slots.REBUILD_GRACE * 2
+        self.db[slots.SLOTS_COLLECTION].update_many({}, {'$set': {'updated_at': stale}})
+        self.assertEqual(slots.rebuild([1], self.day, 1, db=self.db, overwrite=True), 1)
+        self.assertTrue(slots.is_slot_free(1, self.at(10), 120, db=self.db))
+
+class AssignmentTests(ScheduledTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pool = ProviderPool(
+            ratings={1: 4.0, 2: 5.0, 3: 3.0},
+            capabilities={'plumbing': {1, 2}, 'electrical': {3}},
+            loads={1: 3},
+        )
+        for target, value in (('get_pool', self.pool), ('get_catalog', mock.Mock())):
+            patcher = mock.patch(f'services.assignment.{target}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def book(self, provider_id, hour, category='plumbing'):
+        """An approved booking of ``provider_id``, holding its slot, as the approval read it"""
+        doc = {
+            'customer_id': 7, 'provider_id': provider_id, 'status': 'confirmed',
+            'booking_date': self.at(hour), 'duration_minutes': 120,
+            'service_snapshot': {'category': category},
+        }
+        self.assertTrue(slots.reserve(provider_id, doc['booking_date'], 120, db=self.db))
+        doc['_id'] = self.db['services_booking'].insert_one(dict(doc)).inserted_id
+        return doc
+
+    def provider_of(self, doc):
+        return self.db['services_booking'].find_one({'_id': doc['_id']})['provider_id']
+
+    def test_moves_booking_to_least_loaded_free_provider(self):
+        doc = self.book(1, 10)
+        self.assertEqual(assign_providers([doc], db=self.db), {doc['_id']: 2})
+        self.assertEqual(self.provider_of(doc), 2)
+        self.assertEqual(self.pool.loads[2], 1)
+        self.assertFalse(slots.is_slot_free(2, self.at(10), 120, db=self.db))
+        # The old provider's day is recomputed without the booking
+        self.assertTrue(slots.is_slot_free(1, self.at(10), 120, db=self.db))
+
+    def test_keeps_current_provider_when_least_loaded(self):
+        self.pool.loads.update({1: 0, 2: 5})
+        doc = self.book(1, 10)
+        self.assertEqual(assign_providers([doc], db=self.db), {})
+        stored = self.db['services_booking'].find_one({'_id': doc['_id']})
+        self.assertEqual(stored['provider_id'], 1)
+        self.assertNotIn('assigned_at', stored)
+
+    def test_keeps_current_provider_when_nobody_else_is_free(self):
+        self.book(2, 10)
+        doc = self.book(1, 10)
+        self.assertEqual(assign_providers([doc], db=self.db), {})
+        self.assertEqual(self.provider_of(doc), 1)
+
+    def test_unassigns_when_provider_left_and_nobody_is_free(self):
+        self.book(3, 10, category='electrical')
+        doc = self.book(9, 10, category='electrical')
+        self.assertEqual(assign_providers([doc], db=self.db), {doc['_id']: None})
+        self.assertIsNone(self.provider_of(doc))
+        self.assertTrue(slots.is_slot_free(9, self.at(10), 120, db=self.db))
+
+    def test_lost_write_is_neither_counted_nor_reserved(self):
+        won = self.book(1, 10)
+        lost = self.book(1, 14)
+        # Another admin moved it after it was read
+        self.db['services_booking'].update_one({'_id': lost['_id']}, {'$set': {'provider_id': 3}})
+
+        self.assertEqual(assign_providers([won, lost], db=self.db), {won['_id']: 2})
+        self.assertEqual(self.provider_of(lost), 3)
+        self.assertEqual(self.pool.loads[2], 1)
+        self.assertFalse(slots.is_slot_free(2, self.at(10), 120, db=self.db))
+        self.assertTrue(slots.is_slot_free(2, self.at(14), 120, db=self.db))
+        self.assertEqual(self.db['services_booking'].count_documents({'assignment_batch': {'$exists': True}}), 0)
+
+
+class BookingCreationTests(ScheduledTestCase):
+
+    service = {
+        'id': 1, 'name': 'Pipe Repair', 'price': 1500, 'duration': 2,
+        'category_slug': 'plumbing', 'category_name': 'Plumbing',
+        'provider': {'user': {'id': 1, 'email': 'pat@example.com', 'get_full_name': 'Pat Provider'}},
+    }
+
+    def setUp(self):
+        super().setUp()
+        ensure_indexes(self.db, [spec for spec in INDEXES if spec.name == 'booking_idempotency_key_unique'])
+        patcher = mock.patch('services.bookings.get_catalog', return_value=mock.Mock(source='sample'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.customer = SimpleNamespace(id=7)
+
+    def create(self, hour=10, customer=None, **kwargs):
+        return create_booking(customer or self.customer, self.service, self.at(hour), db=self.db, **kwargs)
+
+    def test_same_key_returns_first_booking(self):
+        first = self.create(idempotency_key='form-1')
+        second = self.create(idempotency_key='form-1')
+        self.assertTrue(first.created)
+        self.assertFalse(second.created)
+        self.assertEqual(second.booking_id, first.booking_id)
+        self.assertEqual(self.db['services_booking'].count_documents({}), 1)
+
+    def test_submits_without_key_are_matched_by_slot(self):
+        first = self.create()
+        second = self.create()
+        self.assertFalse(second.created)
+        self.assertEqual(second.booking_id, first.booking_id)
+
+    def test_rebooking_a_cancelled_slot_creates_a_new_booking(self):
+        first = self.create()
+        self.assertTrue(cancel_booking(first.booking_id, self.customer, db=self.db).ok)
+
+        second = self.create()
+        self.assertTrue(second.created)
+        self.assertNotEqual(second.booking_id, first.booking_id)
+        # The rebooking is idempotent in turn
+        self.assertEqual(self.create().booking_id, second.booking_id)
+        self.assertEqual(self.db['services_booking'].count_documents({}), 2)
+
+    def test_taken_slot_is_refused(self):
+        self.create()
+        other = self.create(hour=11, customer=SimpleNamespace(id=8))
+        self.assertFalse(other.ok)
+        self.assertEqual(other.error, 'slot_unavailable')
+        self.assertEqual(self.db['services_booking'].count_documents({}), 1)
+
+    def test_failed_count_keeps_the_booking_and_its_slot(self):
+        with mock.patch('services.stats.record_transitions', side_effect=RuntimeError('stats down')):
+            creation = self.create()
+        self.assertTrue(creation.created)
+        self.assertEqual(self.db['services_booking'].count_documents({}), 1)
+        self.assertFalse(slots.is_slot_free(1, self.at(10), 120, db=self.db))
+
+    def test_empty_instructions_clear_them(self):
+        booking_id = self.create(notes='Ring twice').booking_id
+        self.assertTrue(update_booking(booking_id, self.customer, special_instructions=None, db=self.db).ok)
+        stored = self.db['services_booking'].find_one({}, {'special_instructions': 1})
+        self.assertEqual(stored['special_instructions'], 'Ring twice')
+
+        change = update_booking(booking_id, self.customer, special_instructions='', db=self.db)
+        self.assertEqual(change.changes, {'special_instructions': ''})
+        stored = self.db['services_booking'].find_one({}, {'special_instructions': 1})
+        self.assertEqual(stored['special_instructions'], '')
+
+
+    def test_move_overlapping_its_own_slot(self):
+        booking_id = self.create().booking_id
+        change = update_booking(booking_id, self.customer, booking_datetime=self.at(10, 30), db=self.db)
+        self.assertTrue(change.ok)
+        self.assertEqual(change.changes, {'booking_date': self.at(10, 30)})
+        free = slots.day_mask(1, self.day, db=self.db)
+        # 10:00 is left, 10:30-12:30 is held
+        self.assertEqual(free & bits(*range(20, 25)), bits(20))
+
+    def test_move_onto_another_booking_is_refused(self):
+        booking_id = self.create().booking_id
+        self.create(hour=13, customer=SimpleNamespace(id=8))
+        change = update_booking(booking_id, self.customer, booking_datetime=self.at(11, 30), db=self.db)
+        self.assertEqual(change.error, 'slot_unavailable')
+        # Neither booking lost any of its blocks
+        self.assertEqual(slots.day_mask(1, self.day, db=self.db) & bits(*range(20, 30)), bits(24, 25))
+
+class TransitionTests(ScheduledTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.bookings = self.db['services_booking']
+
+    def insert(self, status='pending', customer_id=7):
+        return self.bookings.insert_one({'customer_id': customer_id, 'status': status, 'notes': 'Booking'}).inserted_id
+
+    def status_of(self, object_id):
+        return self.bookings.find_one({'_id': object_id})['status']
+
+    def hook(self, *events, fields=(), fail=False):
+        """Register a recording hook for the duration of the test"""
+        calls = []
+
+        @transitions.on_transition(*events, fields=fields)
+        def record(event, moved, db):
+            calls.append((event, moved))
+            if fail:
+                raise RuntimeError('hook failed')
+
+        self.addCleanup(transitions._hooks.remove, transitions._hooks[-1])
+        return calls
+
+    def test_event_moves_only_from_its_sources(self):
+        object_id = self.insert()
+        result = transitions.apply_transition(object_id, 'approve', {'admin_notes': 'ok'}, actor_id=1, db=self.db)
+        self.assertTrue(result.ok)
+        self.assertEqual((result.before['status'], result.after['status']), ('pending', 'confirmed'))
+        self.assertEqual(self.bookings.find_one({'_id': object_id})['admin_notes'], 'ok')
+
+        again = transitions.apply_transition(object_id, 'approve', db=self.db)
+        self.assertEqual((again.error, again.current_status), ('wrong_state', 'confirmed'))
+        self.assertEqual(self.status_of(object_id), 'confirmed')
+        history = transitions.transition_history(object_id, db=self.db)
+        self.assertEqual([(entry['event'], entry['from'], entry['to'], entry['actor_id']) for entry in history],
+                         [('approve', 'pending', 'confirmed', 1)])
+
+    def test_missing_invalid_and_guarded_bookings(self):
+        self.assertEqual(transitions.apply_transition('nope', 'cancel', db=self.db).error, 'invalid_id')
+        self.assertEqual(transitions.apply_transition(ObjectId(), 'cancel', db=self.db).error, 'not_found')
+        object_id = self.insert(customer_id=8)
+        result = transitions.apply_transition(object_id, 'cancel', guard={'customer_id': 7}, db=self.db)
+        self.assertEqual(result.error, 'not_found')
+        self.assertEqual(self.status_of(object_id), 'pending')
+
+    def test_pay_keeps_status(self):
+        object_id = self.insert(status='confirmed')
+        result = transitions.apply_transition(object_id, 'pay', {'is_paid': True}, db=self.db)
+        self.assertEqual(result.after['status'], 'confirmed')
+        self.assertEqual(transitions.apply_transition(self.insert('cancelled'), 'pay', db=self.db).error, 'wrong_state')
+
+    def test_batch_reports_each_id_in_order(self):
+        pending, confirmed = self.insert(), self.insert(status='confirmed')
+        missing = ObjectId()
+        ids = [str(confirmed), 'bad', str(pending), str(pending), str(missing)]
+        results = transitions.apply_transitions(ids, 'reject', {'rejection_reason': 'full'}, db=self.db)
+        self.assertEqual([result.booking_id for result in results], [str(confirmed), 'bad', str(pending), str(missing)])
+        self.assertEqual([result.error for result in results], ['wrong_state', 'invalid_id', None, 'not_found'])
+        self.assertEqual(self.status_of(pending), 'rejected')
+        self.assertEqual(self.status_of(confirmed), 'confirmed')
+
+    def test_hooks_run_once_per_call_for_their_events(self):
+        cancels = self.hook('cancel', fields=('notes',))
+        every = self.hook()
+        first, second = self.insert(), self.insert()
+        transitions.apply_transitions([first, second], 'cancel', db=self.db)
+        transitions.apply_transition(self.insert(), 'approve', db=self.db)
+
+        self.assertEqual(len(cancels), 1)
+        event, moved = cancels[0]
+        self.assertEqual(event, 'cancel')
+        self.assertEqual({before['_id'] for before, _ in moved}, {first, second})
+        self.assertTrue(all(before['notes'] == 'Booking' and after['status'] == 'cancelled' for before, after in moved))
+        self.assertEqual([event for event, _ in every], ['cancel', 'approve'])
+
+    def test_failing_hook_does_not_undo_transition(self):
+        calls = self.hook('cancel', fail=True)
+        object_id = self.insert()
+        self.assertTrue(transitions.apply_transition(object_id, 'cancel', db=self.db).ok)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.status_of(object_id), 'cancelled')
+
+    def test_lost_race_is_not_hooked(self):
+        calls = self.hook('approve')
+        object_id = self.insert()
+        real_bulk_write = self.bookings.bulk_write
+
+        def cancel_first(operations, **kwargs):
+            # Another request cancels the booking between the read and the write
+            self.bookings.update_one({'_id': object_id}, {'$set': {'status': 'cancelled'}})
+            return real_bulk_write(operations, **kwargs)
+
+        with mock.patch.object(type(self.bookings), 'bulk_write', autospec=True,
+                               side_effect=lambda collection, operations, **kwargs: cancel_first(operations, **kwargs)):
+            results = transitions.apply_transitions([object_id], 'approve', db=self.db)
+        self.assertEqual((results[0].error, results[0].current_status), ('wrong_state', 'cancelled'))
+        self.assertEqual(calls, [])
+
+    def test_batch_tag_is_removed(self):
+        won, lost = self.insert(), self.insert()
+        real_bulk_write = self.bookings.bulk_write
+
+        def cancel_one(operations, **kwargs):
+            self.bookings.update_one({'_id': lost}, {'$set': {'status': 'cancelled'}})
+            return real_bulk_write(operations, **kwargs)
+
+        with mock.patch.object(type(self.bookings), 'bulk_write', autospec=True,
+                               side_effect=lambda collection, operations, **kwargs: cancel_one(operations, **kwargs)):
+            results = transitions.apply_transitions([won, lost], 'approve', db=self.db)
+        self.assertEqual([result.ok for result in results], [True, False])
+        self.assertEqual(self.bookings.count_documents({'transition_batch': {'$exists': True}}), 0)
+
+
+@override_settings(CACHES=TEST_CACHES, SERVICES_CACHE='services', SERVICES_CACHE_LOCAL_MAX_AGE=0)
+class CacheNamespaceTests(SimpleTestCase):
+    """Without a local tier every read goes to the shared one, as in a second process"""
+
+    def setUp(self):
+        super().setUp()
+        shared_cache().clear()
+        self.builds = []
+
+    def namespace(self, **kwargs):
+        return CacheNamespace('tests', 'TESTS_CACHE_MAX_AGE', 30, **kwargs)
+
+    def build(self, value='fresh'):
+        def build():
+            self.builds.append(value)
+            return value
+        return build
+
+    def test_built_once_and_shared(self):
+        first, second = self.namespace(), self.namespace()
+        self.assertEqual(first.get_or_set('key', self.build()), 'fresh')
+        self.assertEqual(second.get_or_set('key', self.build()), 'fresh')
+        self.assertEqual(second.get('key'), 'fresh')
+        self.assertEqual(self.builds, ['fresh'])
+
+    def test_invalidate_reaches_other_processes(self):
+        first, second = self.namespace(), self.namespace()
+        first.get_or_set('key', self.build('old'))
+        second.invalidate()
+        self.assertIsNone(first.get('key'))
+        self.assertEqual(first.get_or_set('key', self.build('new')), 'new')
+        self.assertEqual(self.builds, ['old', 'new'])
+
+    def test_expired_value_served_while_another_process_rebuilds(self):
+        cache = self.namespace()
+        cache.set('key', 'stale', timeout=0)
+        self.assertIsNone(cache.get('key'))
+
+        lock = (f"{cache.key('key')}:lock", 1)
+        shared_cache().add(*lock, version=cache.version)
+        self.assertEqual(cache.get_or_set('key', self.build()), 'stale')
+        self.assertEqual(self.builds, [])
+
+        shared_cache().delete(lock[0], version=cache.version)
+        self.assertEqual(cache.get_or_set('key', self.build()), 'fresh')
+        self.assertEqual(self.builds, ['fresh'])
+
+    def test_value_deleted_during_build_is_not_kept(self):
+        cache = self.namespace()
+
+        def build():
+            cache.delete('key')
+            return self.build()()
+
+        self.assertEqual(cache.get_or_set('key', build), 'fresh')
+        self.assertIsNone(cache.get('key'))
+
+    def test_decode_and_local_bound(self):
+        with self.settings(SERVICES_CACHE_LOCAL_MAX_AGE=5):
+            cache = self.namespace(local_entries=2, decode=tuple)
+            for key in ('a', 'b', 'c'):
+                self.assertEqual(cache.get_or_set(key, lambda: [key]), (key,))
+            self.assertEqual(list(cache._local), ['tests:b', 'tests:c'])
+
+    def test_shared_tier_failing_mid_load_builds_directly(self):
+        cache = self.namespace()
+        # The generation token is read fine; the lock and writes fail
+        cache.invalidate()
+        backend = mock.Mock(wraps=shared_cache())
+        for call in ('add', 'set', 'get', 'delete'):
+            getattr(backend, call).side_effect = ConnectionError('down')
+        with mock.patch('services.cache.shared_cache', return_value=backend):
+            self.assertEqual(cache.get_or_set('key', self.build()), 'fresh')
+            cache.set('key', 'other')
+            cache.delete('key')
+
+        backend.get_many.side_effect = ConnectionError('down')
+        with mock.patch('services.cache.shared_cache', return_value=backend):
+            self.assertEqual(cache.get_or_set('key', self.build()), 'fresh')
+            self.assertIsNone(cache.get('key'))
+        self.assertEqual(self.builds, ['fresh', 'fresh'])
+
+    def test_unchanged_shared_value_is_not_decoded_again(self):
+        decoded = []
+        cache = self.namespace(decode=lambda payload: decoded.append(payload) or object())
+        first = cache.get_or_set('key', self.build())
+        # The local entry has expired (max age 0): re-read, same write
+        self.assertIs(cache.get_or_set('key', self.build()), first)
+        self.assertIs(cache.get('key'), first)
+        self.assertEqual(decoded, ['fresh'])
+
+        cache.set('key', 'changed')
+        self.assertIsNot(cache.get('key'), first)
+        self.assertEqual(decoded, ['fresh', 'changed'])
+
+    def test_catalog_search_index_follows_catalog_loads(self):
+        catalog_cache = CacheNamespace('catalog-tests', 'CATALOG_MAX_AGE', 300, decode=build_snapshot)
+        with mock.patch('services.catalog.load_from_database', return_value=([], [])):
+            snapshot = catalog_cache.get_or_set('snapshot', load_catalog)
+            index = get_search_index(snapshot)
+            self.assertIs(get_search_index(catalog_cache.get_or_set('snapshot', load_catalog)), index)
+
+            catalog_cache.invalidate()
+            reloaded = catalog_cache.get_or_set('snapshot', load_catalog)
+        self.assertNotEqual(reloaded.version, snapshot.version)
+        self.assertIsNot(get_search_index(reloaded), index)
+
+    def test_invoice_status_loaded_across_an_invalidation_is_not_kept(self):
+        booking_id = ObjectId()
+
+        def load(object_id, customer_id, db=None):
+            # Paid and approved while the old status was being read
+            invalidate_invoice_status((object_id, customer_id))
+            return {'has_invoice': False, 'status': 'unavailable'}
+
+        with mock.patch('services.invoicing.load_invoice_status', side_effect=load) as loader:
+            self.assertEqual(invoice_status(booking_id, 7)['status'], 'unavailable')
+            invoice_status(booking_id, 7)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_lock_holder_failing_is_built_locally(self):
+        cache = self.namespace()
+        cache.invalidate()
+        backend = mock.Mock(wraps=shared_cache())
+        backend.add.return_value = False
+        backend.get.side_effect = ConnectionError('down')
+        with mock.patch('services.cache.shared_cache', return_value=backend):
+            self.assertEqual(cache.get_or_set('key', self.build()), 'fresh')
+        self.assertEqual(self.builds, ['fresh'])
+
+
+class DashboardCounterTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('services.dashboard.Service')
+        patcher.start().objects.count.return_value = 3
+        self.addCleanup(patcher.stop)
+        now = datetime.now()
+        self.db['services_booking'].insert_many([
+            {'status': 'pending', 'created_at': now},
+            {'status': 'confirmed', 'is_paid': True, 'total_amount': 1500.0, 'created_at': now},
+        ])
+
+    def test_counters_started_by_a_write_are_built_on_first_read(self):
+        # The first write after deploy only creates the increments
+        stats.insert_booking({'status': 'pending', 'created_at': datetime.now()}, db=self.db)
+        self.assertIsNone(stats.get_dashboard_counters(self.db))
+
+        counters = load_counters(self.db)
+        self.assertEqual((counters['total'], counters['status'], counters['revenue']),
+                         (3, {'pending': 2, 'confirmed': 1}, 1500.0))
+        self.assertEqual(counters['services'], 3)
+        stored = self.db[stats.STATS_COLLECTION].find_one({'_id': stats.BOOKING_COUNTERS_ID})
+        self.assertIn('built_at', stored)
+        self.assertNotIn('building', stored)
+        # Built counters are read, not rebuilt
+        self.assertEqual(load_counters(self.db)['total'], 3)
+
+    def test_build_is_claimed_once(self):
+        self.assertTrue(stats.claim_build(self.db))
+        self.assertFalse(stats.claim_build(self.db))
+        # Requests that lose the claim count the bookings meanwhile, without writing
+        self.assertEqual(load_counters(self.db)['total'], 2)
+        self.assertIsNone(stats.get_dashboard_counters(self.db))
+
+    def test_abandoned_claim_is_taken_over(self):
+        self.assertTrue(stats.claim_build(self.db))
+        self.db[stats.STATS_COLLECTION].update_one(
+            {'_id': stats.BOOKING_COUNTERS_ID},
+            {'$set': {'building': datetime.now() - timedelta(seconds=stats.BUILD_TIMEOUT + 1)}},
+        )
+        self.assertTrue(stats.build_counters(3, db=self.db))
+        self.assertFalse(stats.claim_build(self.db))
+        self.assertEqual(stats.get_dashboard_counters(self.db)['total'], 2)
+
+    def test_transitions_keep_built_counters_exact(self):
+        stats.build_counters(3, db=self.db)
+        pending = self.db['services_booking'].find_one({'status': 'pending'})
+        self.assertTrue(transitions.apply_transition(pending['_id'], 'cancel', {}, db=self.db).ok)
+        self.assertEqual(stats.reconcile(3, db=self.db), {})
+        self.assertEqual(stats.get_dashboard_counters(self.db)['status'], {'pending': 0, 'confirmed': 1, 'cancelled': 1})
+
+    def test_reconcile_command_reports_and_fixes_drift(self):
+        stats.build_counters(3, db=self.db)
+        self.db[stats.STATS_COLLECTION].update_one(
+            {'_id': stats.BOOKING_COUNTERS_ID}, {'$inc': {'total': 5, 'revenue': -100.0}},
+        )
+        self.assertEqual(stats.reconcile(3, db=self.db), {
+            stats.BOOKING_COUNTERS_ID: {'total': (7, 2), 'revenue': (1400.0, 1500.0)},
+        })
+
+        command = 'services.management.commands.reconcile_dashboard_stats'
+        with mock.patch(f'{command}.get_db', return_value=self.db), mock.patch(f'{command}.Service') as service:
+            service.objects.count.return_value = 3
+            out = StringIO()
+            call_command('reconcile_dashboard_stats', stdout=out)
+            self.assertIn('total: stored 7, expected 2', out.getvalue())
+            self.assertEqual(stats.get_dashboard_counters(self.db)['total'], 7)
+
+            call_command('reconcile_dashboard_stats', '--fix', stdout=StringIO())
+        self.assertEqual(stats.reconcile(3, db=self.db), {})
+        self.assertEqual(stats.get_dashboard_counters(self.db)['total'], 2)
+
+
+class OpenJobTests(ScheduledTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # An available provider serving 560001 who keeps no schedule
+        patcher = mock.patch.object(ProviderFeed, 'eligibility_filter', autospec=True, side_effect=lambda feed: {
+            'status': 'confirmed', 'provider_id': None, 'service_area': {'$in': ['560001']},
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.provider = SimpleNamespace(id=2)
+
+    def insert(self, hour, status='confirmed', provider_id=None, area='560001'):
+        return self.db['services_booking'].insert_one({
+            'customer_id': 7, 'status': status, 'provider_id': provider_id, 'service_area': area,
+            'booking_date': self.at(hour), 'duration_minutes': 120, 'is_paid': False,
+        }).inserted_id
+
+    def test_open_jobs_are_unassigned_confirmed_bookings_in_the_area(self):
+        later, sooner = self.insert(14), self.insert(10)
+        self.insert(12, provider_id=5)
+        self.insert(12, status='pending')
+        self.insert(12, area='110001')
+        jobs = ProviderFeed(self.provider, db=self.db).open_jobs()
+        self.assertEqual([job['booking_id'] for job in jobs], [str(sooner), str(later)])
+        self.assertFalse(any(job['assigned'] for job in jobs))
+
+    def test_claimed_job_is_taken_once(self):
+        booking_id = self.insert(10)
+        self.assertTrue(claim_job(booking_id, self.provider, db=self.db)[0])
+        self.assertEqual(self.db['services_booking'].find_one({'_id': booking_id})['provider_id'], 2)
+        self.assertFalse(slots.is_slot_free(2, self.at(10), 120, db=self.db))
+
+        claimed, message = claim_job(booking_id, SimpleNamespace(id=3), db=self.db)
+        self.assertFalse(claimed)
+        self.assertEqual(message, 'This job is no longer open.')
+        self.assertEqual(ProviderFeed(self.provider, db=self.db).open_jobs(), [])
+
+    def test_busy_provider_cannot_claim(self):
+        self.assertTrue(slots.reserve(2, self.at(11), 60, db=self.db))
+        booking_id = self.insert(10)
+        self.assertFalse(claim_job(booking_id, self.provider, db=self.db)[0])
+        self.assertIsNone(self.db['services_booking'].find_one({'_id': booking_id})['provider_id'])
+
+    def test_claim_lost_to_a_concurrent_one_gives_the_slot_back(self):
+        booking_id = self.insert(10)
+
+        def reserve_then_lose(*args, **kwargs):
+            taken = slots.reserve(*args, **kwargs)
+            self.db['services_booking'].update_one({'_id': booking_id}, {'$set': {'provider_id': 3}})
+            return taken
+
+        with mock.patch('services.provider_jobs.reserve', side_effect=reserve_then_lose):
+            self.assertFalse(claim_job(booking_id, self.provider, db=self.db)[0])
+        self.assertTrue(slots.is_slot_free(2, self.at(10), 120, db=self.db))
+
+
+class PaymentTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        ensure_indexes(self.db, [
+            spec for spec in INDEXES if spec.collection in (payments.PAYMENTS_COLLECTION, payments.LEDGER_COLLECTION)
+        ])
+        self.customer = SimpleNamespace(id=7)
+        self.booking_id = self.db['services_booking'].insert_one({
+            'customer_id': 7, 'status': 'confirmed', 'total_amount': 1000.0, 'is_paid': False,
+            'created_at': datetime.now(),
+        }).inserted_id
+
+    def pay(self, key='pay-1'):
+        return payments.process_payment(str(self.booking_id), self.customer, 'card', idempotency_key=key, db=self.db)
+
+    def clean_report(self):
+        report = payments.reconciliation_report(db=self.db)
+        return report['charges'] == 1 and not any(ids for key, ids in report.items() if key != 'charges')
+
+    def test_same_key_replays_the_first_payment(self):
+        first = self.pay()
+        replay = self.pay()
+        self.assertTrue(first.created)
+        self.assertFalse(replay.created)
+        self.assertEqual(replay.transaction_id, first.transaction_id)
+        self.assertEqual(self.db[payments.PAYMENTS_COLLECTION].count_documents({}), 1)
+        self.assertEqual(self.db[payments.LEDGER_COLLECTION].count_documents({}), 1)
+        self.assertEqual(first.payment['amount'], 1180.0)
+        self.assertTrue(self.clean_report())
+
+        other = self.pay(key='pay-2')
+        self.assertEqual(other.error, 'already_paid')
+        self.assertEqual(other.transaction_id, first.transaction_id)
+
+    def test_payment_left_in_the_outbox_is_relayed_later(self):
+        with mock.patch('services.payments.relay_payment', side_effect=ConnectionError('ledger down')):
+            result = self.pay()
+        self.assertTrue(result.ok and result.created)
+        self.assertEqual(payments.reconciliation_report(db=self.db)['pending_outbox'], [str(self.booking_id)])
+        # A refresh meanwhile gets the payment from the outbox
+        self.assertEqual(self.pay().transaction_id, result.transaction_id)
+
+        self.assertEqual(payments.relay_pending(db=self.db), 1)
+        self.assertEqual(payments.relay_pending(db=self.db), 0)
+        self.assertTrue(self.clean_report())
+        self.assertEqual(payments.find_payment(booking_id=self.booking_id, db=self.db)['transaction_id'],
+                         result.transaction_id)
+
+    def test_report_flags_ledger_disagreements(self):
+        self.pay()
+        self.db['services_booking'].update_one({'_id': self.booking_id}, {'$set': {'total_amount': 900.0}})
+        self.assertEqual(payments.reconciliation_report(db=self.db)['amount_mismatch'], [str(self.booking_id)])
+
+        self.db['services_booking'].update_one({'_id': self.booking_id}, {'$set': {'is_paid': False}})
+        self.assertEqual(payments.reconciliation_report(db=self.db)['charge_without_paid'], [str(self.booking_id)])
+
+        self.db[payments.LEDGER_COLLECTION].delete_many({})
+        self.db['services_booking'].update_one({'_id': self.booking_id}, {'$set': {'is_paid': True}})
+        self.assertEqual(payments.reconciliation_report(db=self.db)['paid_without_charge'], [str(self.booking_id)])
+
+    def test_unpayable_booking_is_refused(self):
+        self.db['services_booking'].update_one({'_id': self.booking_id}, {'$set': {'status': 'cancelled'}})
+        result = self.pay()
+        self.assertEqual((result.error, result.booking_status), ('not_payable', 'cancelled'))
+        self.assertIsNone(payments.find_payment(booking_id=self.booking_id, db=self.db))
+
+
+class ApprovalTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Invoice documents name the customer; no users table here
+        patcher = mock.patch('services.invoicing.resolve_users', return_value={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = SimpleNamespace(id=1)
+
+    def insert(self, status='pending', **fields):
+        return self.db['services_booking'].insert_one(dict(
+            {'customer_id': 7, 'status': status, 'total_amount': 500.0, 'created_at': datetime.now()}, **fields
+        )).inserted_id
+
+    def test_pending_booking_is_decided_once(self):
+        booking_id = self.insert()
+        decision = approvals.approve_booking(str(booking_id), self.admin, db=self.db)
+        self.assertTrue(decision.ok)
+        self.assertEqual((decision.booking['status'], decision.booking['approved_by_id']), ('confirmed', 1))
+
+        again = approvals.reject_booking(str(booking_id), self.admin, 'Too late', db=self.db)
+        self.assertEqual((again.error, again.current_status), ('not_pending', 'confirmed'))
+        # The approval created the invoice document
+        self.assertEqual(self.db['services_invoice'].count_documents({'booking_id': booking_id}), 1)
+
+    def test_bulk_decisions_report_each_id_in_order(self):
+        first, second, confirmed = self.insert(), self.insert(), self.insert('confirmed')
+        missing = ObjectId()
+        decisions = approvals.decide_bookings(
+            [first, 'nope', confirmed, missing, second, first], 'reject',
+            approvals.rejection_changes(self.admin, 'No provider'), actor_id=1, db=self.db,
+        )
+        self.assertEqual([(decision.booking_id, decision.error) for decision in decisions], [
+            (str(first), None), ('nope', 'invalid_id'), (str(confirmed), 'not_pending'),
+            (str(missing), 'not_found'), (str(second), None),
+        ])
+        self.assertEqual(self.db['services_booking'].count_documents({'status': 'rejected'}), 2)
+
+    def test_assignment_queues_invoices_of_paid_approvals(self):
+        paid, unpaid = self.insert(is_paid=True), self.insert()
+        decisions = approvals.decide_bookings([paid, unpaid], 'approve', approvals.approval_changes(self.admin),
+                                              db=self.db)
+        with mock.patch('services.approvals.assign_booking_providers', return_value={paid: 4}):
+            self.assertEqual(approvals.assign_providers(decisions, db=self.db), {paid: 4})
+        self.assertEqual(decisions[0].booking['provider_id'], 4)
+        queued = [job['payload']['booking_id'] for job in self.db[jobs.JOBS_COLLECTION].find()]
+        self.assertEqual(queued, [str(paid)])
+
+    def test_invoices_are_queued_even_if_assignment_fails(self):
+        paid = self.insert(is_paid=True)
+        decisions = approvals.decide_bookings([paid], 'approve', approvals.approval_changes(self.admin), db=self.db)
+        with mock.patch('services.approvals.assign_booking_providers', side_effect=RuntimeError('pool down')):
+            with self.assertRaises(RuntimeError):
+                approvals.assign_providers(decisions, db=self.db)
+        self.assertEqual(self.db[jobs.JOBS_COLLECTION].count_documents({}), 1)
+
+
+class JobQueueTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        ensure_indexes(self.db, [spec for spec in INDEXES if spec.collection == jobs.JOBS_COLLECTION])
+
+    def job(self):
+        return self.db[jobs.JOBS_COLLECTION].find_one({'key': 'job-1'})
+
+    def run_with(self, handler):
+        with mock.patch('services.jobs.load_handlers', return_value={'test': handler}):
+            return jobs.run_pending(worker='tests', db=self.db)
+
+    def test_keyed_job_is_queued_once_while_active(self):
+        self.assertTrue(jobs.enqueue('test', {'n': 1}, key='job-1', db=self.db))
+        self.assertFalse(jobs.enqueue('test', {'n': 2}, key='job-1', db=self.db))
+        self.assertEqual(jobs.enqueue_many('test', [({'n': 3}, 'job-1'), ({'n': 4}, 'job-2')], db=self.db), 1)
+
+        self.assertEqual(self.run_with(lambda payload, db=None: payload['n']), 2)
+        self.assertEqual((self.job()['status'], self.job()['result']), (jobs.DONE, 1))
+        # Finished jobs may be queued again
+        self.assertTrue(jobs.enqueue('test', {'n': 5}, key='job-1', db=self.db))
+        self.assertEqual(self.db[jobs.JOBS_COLLECTION].count_documents({}), 2)
+
+    def test_failing_job_is_retried_with_backoff_then_failed(self):
+        jobs.enqueue('test', {}, key='job-1', max_attempts=2, db=self.db)
+
+        def fail(payload, db=None):
+            raise RuntimeError('render failed')
+
+        self.assertEqual(self.run_with(fail), 1)
+        job = self.job()
+        self.assertEqual((job['status'], job['attempts']), (jobs.QUEUED, 1))
+        self.assertGreater(job['run_after'], datetime.now())
+        # Not due yet
+        self.assertEqual(self.run_with(fail), 0)
+
+        self.db[jobs.JOBS_COLLECTION].update_one({'_id': job['_id']}, {'$set': {'run_after': datetime.now()}})
+        self.assertEqual(self.run_with(fail), 1)
+        job = self.job()
+        self.assertEqual((job['status'], job['attempts']), (jobs.FAILED, 2))
+        self.assertIn('render failed', job['error'])
+
+    def test_expired_lease_is_claimed_by_another_worker(self):
+        jobs.enqueue('test', {}, key='job-1', db=self.db)
+        lost = jobs.claim('dead', lease=timedelta(seconds=-1), db=self.db)
+        taken = jobs.claim('alive', db=self.db)
+        self.assertEqual((taken['_id'], taken['attempts']), (lost['_id'], 2))
+        # The first worker finishing late does not overwrite the new claim
+        jobs.complete(lost, db=self.db)
+        self.assertEqual((self.job()['status'], self.job()['worker']), (jobs.RUNNING, 'alive'))
+
+
+class InvoiceDownloadTests(SimpleTestCase):
+
+    invoice = {'invoice_number': 'INV-1', 'pdf_hash': 'abc123'}
+
+    def respond(self, **headers):
+        view = InvoiceDownloadView()
+        view.request = RequestFactory().get('/', **headers)
+        return view.stored_pdf_response('invoices/INV-1.pdf', self.invoice)
+
+    @override_settings(INVOICE_SENDFILE_HEADER='X-Accel-Redirect', INVOICE_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_current_etag_is_not_modified(self):
+        response = self.respond(HTTP_IF_NONE_MATCH='"abc123"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"abc123"')
+
+        response = self.respond(HTTP_IF_NONE_MATCH='"older"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"abc123"')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/invoices/INV-1.pdf')
+
+
+class RatingTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('services.ratings.Service')
+        self.service = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_moved_review_changes_only_its_buckets(self):
+        self.service.objects.filter.return_value.update.return_value = 1
+        with mock.patch('services.ratings.invalidate_catalog') as invalidate:
+            self.assertEqual(ratings.apply_rating_change(4, added=5, removed=2), 1)
+        self.service.objects.filter.assert_called_once_with(pk=4)
+        updates = self.service.objects.filter.return_value.update.call_args.kwargs
+        self.assertEqual(set(updates), {'rating_sum', 'rating_5_count', 'rating_2_count'})
+        invalidate.assert_called_once_with()
+
+    def test_invalid_or_unchanged_rating_writes_nothing(self):
+        self.assertEqual(ratings.apply_rating_change(4, added=9), 0)
+        self.assertEqual(ratings.apply_rating_change(4, added=3, removed=3), 0)
+        self.assertEqual(ratings.apply_rating_change(None, added=3), 0)
+        self.service.objects.filter.assert_not_called()
+
+    def test_stats_count_every_review_once(self):
+        self.service.objects.order_by.return_value.values_list.return_value = [(6, 'Deep Cleaning')]
+        bookings = self.db['services_booking']
+        raw = bookings.insert_one({'service_id': 4}).inserted_id
+        snapshot = bookings.insert_one({'service_snapshot': {'id': 5}}).inserted_id
+        named = bookings.insert_one({'notes': 'Booking for Deep Cleaning - Provider: Pat'}).inserted_id
+        bookings.insert_one({'id': 12, 'service_id': 4})
+        self.db['services_review'].insert_many([
+            {'booking_id': raw, 'rating': 5}, {'booking_id': 12, 'rating': 3},
+            {'booking_id': snapshot, 'rating': 4}, {'booking_id': named, 'rating': 2},
+            {'booking_id': raw, 'rating': 0}, {'booking_id': ObjectId(), 'rating': 5},
+        ])
+
+        computed = ratings.compute_rating_stats(self.db)
+        self.assertEqual(set(computed), {4, 5, 6})
+        self.assertEqual(computed[4], dict(ratings.empty_stats(), rating_sum=8, rating_count=2,
+                                           rating_5_count=1, rating_3_count=1))
+        self.assertEqual((computed[5]['rating_count'], computed[5]['rating_4_count']), (1, 1))
+        self.assertEqual((computed[6]['rating_count'], computed[6]['rating_2_count']), (1, 1))
+
+
+class IndexTests(MongoTestCase):
+
+    def test_declared_indexes_are_created_once(self):
+        self.assertEqual({result.status for result in ensure_indexes(self.db)}, {IndexResult.CREATED})
+        self.assertEqual({result.status for result in ensure_indexes(self.db)}, {IndexResult.EXISTS})
+        self.assertTrue(all(result.ok for result in verify_indexes(self.db)))
+
+    def test_index_with_other_options_is_replaced_only_on_request(self):
+        specs = [spec for spec in INDEXES if spec.name == 'booking_idempotency_key_unique']
+        self.db['services_booking'].create_index([('idempotency_key', 1)], name='legacy_key')
+
+        self.assertEqual(ensure_indexes(self.db, specs)[0].status, IndexResult.CONFLICT)
+        self.assertEqual(ensure_indexes(self.db, specs, dry_run=True, replace=True)[0].status, IndexResult.MISSING)
+        self.assertIn('legacy_key', self.db['services_booking'].index_information())
+
+        self.assertEqual(ensure_indexes(self.db, specs, replace=True)[0].status, IndexResult.CREATED)
+        indexes = self.db['services_booking'].index_information()
+        self.assertNotIn('legacy_key', indexes)
+        self.assertTrue(indexes['booking_idempotency_key_unique']['unique'])
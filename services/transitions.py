@@ -0,0 +1,313 @@
+"""
+Booking state machine for raw MongoDB bookings
+
+Every status change is a named event from :data:`TRANSITIONS` (``approve``,
+``reject``, ``cancel``, ``complete``, ``decline``, ``pay``) with the set of
+statuses it may leave and the status it enters, following
+``Booking.STATUS_CHOICES``. Applying an event is one conditional write whose
+query carries ``status: {'$in': sources}``: there is no read before it, and
+two requests racing on the same booking cannot both move it.
+
+Each applied transition is appended to ``services_booking_transitions``, a
+capped collection holding a compact audit trail (booking, event, from, to,
+actor, time), and then the hooks registered with :func:`on_transition` run
+once per call with every ``(before, after)`` pair it moved. The dashboard
+counters and slot masks are the first hook; the invoice hooks live in
+:mod:`services.invoicing`. Hooks run after the write is committed, so a
+failing hook is logged and left to ``reconcile_dashboard_stats`` /
+``backfill_invoices`` rather than undoing the transition.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from .mongo import get_db
+from .repositories import to_object_id
+from .slots import SLOT_PROJECTION
+from .stats import COUNTED_PROJECTION, record_transitions
+
+TRANSITION_LOG_COLLECTION = 'services_booking_transitions'
+# Capped size of the transition log in bytes; oldest entries are dropped first
+DEFAULT_LOG_SIZE = 64 * 1024 * 1024
+
+
+class Transition:
+    """One event: the statuses it may leave and the one it enters (None keeps the status)"""
+    __slots__ = ('name', 'sources', 'target')
+
+    def __init__(self, name, sources, target):
+        self.name = name
+        self.sources = tuple(sources)
+        self.target = target
+
+    def __repr__(self):
+        return f"Transition({self.name}: {'|'.join(self.sources)} -> {self.target or 'same'})"
+
+
+TRANSITIONS = {transition.name: transition for transition in (
+    Transition('approve', ('pending',), 'confirmed'),
+    Transition('reject', ('pending',), 'rejected'),
+    Transition('cancel', ('pending', 'confirmed'), 'cancelled'),
+    Transition('complete', ('confirmed',), 'completed'),
+    # A servicer turning down a job that was already confirmed
+    Transition('decline', ('confirmed',), 'rejected'),
+    # Payment changes is_paid, not the status, but only for live bookings
+    Transition('pay', ('pending', 'confirmed', 'completed'), None),
+)}
+
+# Fields every hook may rely on in ``before`` and ``after``
+BASE_PROJECTION = dict(COUNTED_PROJECTION, **SLOT_PROJECTION)
+
+_hooks = []
+_log_ready = False
+
+
+class TransitionResult:
+    """Outcome of applying one event to one booking"""
+    __slots__ = ('booking_id', 'event', 'before', 'after', 'error', 'current_status')
+
+    def __init__(self, booking_id, event, before=None, after=None, error=None, current_status=None):
+        self.booking_id = booking_id
+        self.event = event
+        self.before = before
+        self.after = after
+        self.error = error
+        self.current_status = current_status
+
+    @property
+    def ok(self):
+        return self.after is not None
+
+    @property
+    def message(self):
+        if self.error == 'invalid_id':
+            return f'Invalid booking id: {self.booking_id}'
+        if self.error == 'not_found':
+            return 'Booking not found.'
+        if self.error == 'wrong_state':
+            return f'A {self.current_status} booking cannot be moved by "{self.event}".'
+        return ''
+
+
+def on_transition(*events, fields=()):
+    """
+    Decorator registering ``hook(event, moved, db)`` to run after ``events``
+    (every event when none are given). ``moved`` lists ``(before, after)``
+    documents, which include ``fields`` on top of :data:`BASE_PROJECTION`.
+    """
+    def decorator(hook):
+        _hooks.append((frozenset(events), tuple(fields), hook))
+        return hook
+    return decorator
+
+
+def hooks_for(event):
+    return [(fields, hook) for events, fields, hook in _hooks if not events or event in events]
+
+
+def projection_for(event, projection=None):
+    projection = dict(BASE_PROJECTION, **(projection or {}))
+    for fields, _ in hooks_for(event):
+        projection.update({field: 1 for field in fields})
+    return projection
+
+
+def run_hooks(event, moved, db=None):
+    if not moved:
+        return
+    for _, hook in hooks_for(event):
+        try:
+            hook(event, moved, db)
+        except Exception as e:
+            print(f"Error in {event} transition hook {hook.__name__}: {e}")
+
+
+@on_transition()
+def count_transitions(event, moved, db):
+    """Dashboard counters and provider slot masks (see :mod:`services.stats`)"""
+    record_transitions(moved, db=db)
+
+
+def ensure_transition_log(db=None):
+    """Create the capped transition log if it does not exist; returns True if created"""
+    global _log_ready
+    db = db if db is not None else get_db()
+    created = False
+    if not db.list_collection_names(filter={'name': TRANSITION_LOG_COLLECTION}):
+        try:
+            db.create_collection(
+                TRANSITION_LOG_COLLECTION, capped=True,
+                size=getattr(settings, 'BOOKING_TRANSITION_LOG_SIZE', DEFAULT_LOG_SIZE),
+            )
+            created = True
+        except CollectionInvalid:
+            # Created concurrently
+            pass
+    _log_ready = True
+    return created
+
+
+def log_entry(event, before, after, actor_id, at):
+    return {
+        'booking_id': before['_id'],
+        'event': event,
+        'from': before.get('status'),
+        'to': after.get('status'),
+        'actor_id': actor_id,
+        'at': at,
+    }
+
+
+def log_transitions(event, moved, actor_id=None, at=None, db=None):
+    """Append one log entry per moved booking with a single insert"""
+    if not moved:
+        return
+    db = db if db is not None else get_db()
+    try:
+        if not _log_ready:
+            ensure_transition_log(db)
+        at = at or datetime.now()
+        db[TRANSITION_LOG_COLLECTION].insert_many(
+            [log_entry(event, before, after, actor_id, at) for before, after in moved], ordered=False,
+        )
+    except PyMongoError as e:
+        # The transition itself is committed; a lost audit line must not undo it
+        print(f"Error logging {event} transitions: {e}")
+
+
+def transition_history(booking_id, db=None):
+    """Logged transitions of one booking, oldest first"""
+    object_id = to_object_id(booking_id)
+    if object_id is None:
+        return []
+    return list((db if db is not None else get_db())[TRANSITION_LOG_COLLECTION].find(
+        {'booking_id': object_id}, {'_id': 0, 'booking_id': 0},
+    ).sort('at', 1))
+
+
+def _update_for(transition, changes, now):
+    fields = dict(changes or {})
+    if transition.target is not None:
+        fields['status'] = transition.target
+    fields.setdefault('updated_at', now)
+    return fields
+
+
+def apply_transition(booking_id, event, changes=None, guard=None, push=None, actor_id=None,
+                     projection=None, db=None):
+    """
+    Apply ``event`` to one booking with a single conditional
+    ``find_one_and_update`` and return a :class:`TransitionResult`.
+
+    ``changes`` are extra fields to ``$set``, ``guard`` extra query
+    conditions (e.g. ``customer_id``), ``push`` a ``$push`` to apply in the
+    same write. ``before``/``after`` hold ``projection`` plus the fields the
+    hooks need.
+    """
+    transition = TRANSITIONS[event]
+    object_id = to_object_id(booking_id)
+    if object_id is None:
+        return TransitionResult(booking_id, event, error='invalid_id')
+    db = db if db is not None else get_db()
+    now = datetime.now()
+    fields = _update_for(transition, changes, now)
+    update = {'$set': fields}
+    if push:
+        update['$push'] = push
+
+    query = dict(guard or {}, _id=object_id, status={'$in': list(transition.sources)})
+    before = db['services_booking'].find_one_and_update(
+        query, update, projection=projection_for(event, projection), return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        # Only the failure path pays for a second read, to explain it
+        current = db['services_booking'].find_one(dict(guard or {}, _id=object_id), {'status': 1})
+        if current is None:
+            return TransitionResult(booking_id, event, error='not_found')
+        return TransitionResult(booking_id, event, error='wrong_state', current_status=current.get('status', 'pending'))
+
+    after = dict(before, **fields)
+    log_transitions(event, [(before, after)], actor_id=actor_id, at=now, db=db)
+    run_hooks(event, [(before, after)], db=db)
+    return TransitionResult(booking_id, event, before=before, after=after)
+
+
+def apply_transitions(booking_ids, event, changes=None, actor_id=None, projection=None, db=None):
+    """
+    Apply ``event`` to many bookings with one ``bulk_write`` and return a
+    :class:`TransitionResult` per distinct id, in the order given.
+
+    Each write is tagged with a batch id; when fewer documents were modified
+    than attempted (someone else moved them first) the tag tells which
+    writes were ours, and it is removed again afterwards. Hooks and the log
+    run once for the whole batch. Their pre-images are the documents as
+    read before the write, so only the status is sure to be current: a
+    field another request changed in between may be stale.
+    """
+    transition = TRANSITIONS[event]
+    results = {}
+    object_ids = {}
+    seen = set()
+    for booking_id in booking_ids:
+        key = str(booking_id)
+        if key in seen:
+            continue
+        seen.add(key)
+        object_id = to_object_id(booking_id)
+        if object_id is None:
+            results[key] = TransitionResult(key, event, error='invalid_id')
+        elif object_id not in object_ids:
+            object_ids[object_id] = key
+
+    if object_ids:
+        db = db if db is not None else get_db()
+        collection = db['services_booking']
+        now = datetime.now()
+        fields = _update_for(transition, changes, now)
+        sources = {'$in': list(transition.sources)}
+        batch = ObjectId()
+        before = {
+            doc['_id']: doc
+            for doc in collection.find({'_id': {'$in': list(object_ids)}, 'status': sources}, projection_for(event, projection))
+        }
+
+        won = set(before)
+        if before:
+            result = collection.bulk_write([
+                UpdateOne({'_id': object_id, 'status': sources}, {'$set': dict(fields, transition_batch=batch)})
+                for object_id in before
+            ], ordered=False)
+            if result.modified_count < len(before):
+                tagged = collection.find({'_id': {'$in': list(before)}, 'transition_batch': batch}, {'_id': 1})
+                won = {doc['_id'] for doc in tagged}
+            if won:
+                collection.update_many(
+                    {'_id': {'$in': list(won)}, 'transition_batch': batch}, {'$unset': {'transition_batch': ''}},
+                )
+        moved = [(before[object_id], dict(before[object_id], **fields)) for object_id in won]
+        log_transitions(event, moved, actor_id=actor_id, at=now, db=db)
+        run_hooks(event, moved, db=db)
+
+        lost = [object_id for object_id in object_ids if object_id not in won]
+        current = {
+            doc['_id']: doc.get('status', 'pending')
+            for doc in collection.find({'_id': {'$in': lost}}, {'status': 1})
+        } if lost else {}
+        after = {before_doc['_id']: after_doc for before_doc, after_doc in moved}
+
+        for object_id, key in object_ids.items():
+            if object_id in after:
+                results[key] = TransitionResult(key, event, before=before[object_id], after=after[object_id])
+            elif object_id in current:
+                results[key] = TransitionResult(key, event, error='wrong_state', current_status=current[object_id])
+            else:
+                results[key] = TransitionResult(key, event, error='not_found')
+
+    order = {}
+    for position, booking_id in enumerate(booking_ids):
+        # A repeated id keeps the position it was first given at
+        order.setdefault(str(booking_id), position)
+    return sorted(results.values(), key=lambda result: order[result.booking_id])
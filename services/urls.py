@@ -25,6 +25,7 @@ urlpatterns = [
 
     # Booking URLs (updated to accept string IDs for MongoDB ObjectId compatibility)
     path('book/<int:service_id>/', login_required(views.ServiceBookingView.as_view()), name='book_service'),
+    path('api/service/<int:service_id>/slots/', views.service_slots, name='service_slots'),
     path('bookings/', login_required(views.BookingListView.as_view()), name='booking_list'),
     path('bookings/<str:pk>/', login_required(views.BookingDetailView.as_view()), name='booking_detail'),
     path('bookings/<str:pk>/cancel/', login_required(views.BookingCancelViewOriginal.as_view()), name='booking_cancel'),
@@ -70,5 +71,6 @@ urlpatterns = [
     # Admin Booking Approval APIs
     path('api/admin/booking/approve/', admin_views.admin_approve_booking, name='admin_approve_booking'),
     path('api/admin/booking/reject/', admin_views.admin_reject_booking, name='admin_reject_booking'),
+    path('api/admin/booking/bulk/', admin_views.admin_bulk_booking_action, name='admin_bulk_booking_action'),
     path('api/admin/test-db/', admin_views.test_database_connection, name='test_database_connection'),
 ]